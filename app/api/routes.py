@@ -1,22 +1,23 @@
 from fastapi import APIRouter, Request, HTTPException, status
-from fastapi.responses import PlainTextResponse, JSONResponse
-from app.models.models import CryptoEntry, OutputFormat
+from fastapi.responses import Response, ORJSONResponse, StreamingResponse
+from app.models.models import OutputFormat, ResolvedSnapshot, Snapshot
 from datetime import datetime as dt
 from app.services.time_service import TimeService
-from app.models.errors import UnavailableTime
-from app.logic.coin_resolver import CoinResolver
-import sys
-import logging
-import time
+from app.models.errors import UnavailableTime, UpstreamUnavailable
+from app.logic.coin_resolver import CoinResolver, CURRENT_SEARCH_SECONDS_RANGE
+from app.services.metrics import REGISTRY, REQUEST_STAGE_SECONDS, SNAPSHOT_AGE_SECONDS
 
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+router = APIRouter(default_response_class=ORJSONResponse)
 
-router = APIRouter()
+SNAPSHOT_AGE_HEADER = "X-Snapshot-Age"
+# Responses for final historical resolutions never change
+IMMUTABLE_MAX_AGE_SECONDS = 60 * 60 * 24 * 365
+MAX_RANGE_POINTS = 1000
+MAX_STREAMED_RANGE_POINTS = 100_000
 
 
 @router.get("/top_price_list", response_model=None)
-async def get_top_price_list(request: Request, limit: int, datetime: str | None = None, format: str | None = None) -> JSONResponse | PlainTextResponse:
+async def get_top_price_list(request: Request, limit: int, datetime: str | None = None, format: str | None = None) -> Response:
     """Gets sorted price list for top crypto assets by market volume.
 
     Args:
@@ -32,22 +33,159 @@ async def get_top_price_list(request: Request, limit: int, datetime: str | None
         - If format is not CSV or JSON
 
     Returns:
-        JSONResponse | PlainTextResponse: Response containing top crypto assets by market volume.
+        Response: Response containing top crypto assets by market volume, either as JSON or CSV.
+        The response carries an ETag identifying the snapshot, limit and format, and requests
+        with a matching If-None-Match header are answered with 304 - not modified.
+        For current queries, the age of the snapshot in seconds is given in the X-Snapshot-Age header,
+        and Cache-Control allows caching the response for the remaining lifetime of the snapshot.
+        For historical queries whose snapshot can't be superseded by newer ones, Cache-Control
+        marks the response as immutable.
+    """
+    with REQUEST_STAGE_SECONDS.time("validation"):
+        # Validate limit
+        _validate_limit(limit)
+
+        # Validate timestamp
+        timestamp = _validate_timestamp(request.app.time_service, datetime)
+
+        # Validate output
+        output_format = _validate_output_format(format)
+
+    # Answer conditional requests before fetching results
+    resolved_snapshot = await _resolve_snapshot(request.app.coin_resolver, timestamp)
+    is_final = resolved_snapshot is not None and resolved_snapshot.is_final
+    if resolved_snapshot is not None:
+        headers = _cache_headers(request.app.time_service, resolved_snapshot.timestamp,
+                                 limit, output_format, timestamp is None, is_final)
+        if _is_not_modified(request, headers["ETag"]):
+            _observe_snapshot_age(request.app.time_service, resolved_snapshot.timestamp, timestamp is None)
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Fetch results, without resolving the snapshot again
+    snapshot = await _fetch_results(request.app.coin_resolver, limit, timestamp, resolved_snapshot)
+
+    # Return results in output format
+    headers = None
+    if snapshot.timestamp is not None:
+        headers = _cache_headers(request.app.time_service, snapshot.timestamp,
+                                 limit, output_format, timestamp is None, is_final)
+        _observe_snapshot_age(request.app.time_service, snapshot.timestamp, timestamp is None)
+    return _format_output(output_format, snapshot, limit, headers)
+
+
+@router.get("/top_price_list/range", response_model=None)
+async def get_top_price_list_range(request: Request, limit: int, start: str, end: str, step: int, format: str | None = None, stream: bool = False) -> Response:
+    """Gets sorted price lists for top crypto assets by market volume for a series of times.
+
+    Args:
+        limit (int): Number of results to return per time. Valid values are within 10 and 100.
+        start (str): First datetime of the series, in ISO format.
+        end (str): Last datetime of the series, in ISO format.
+        step (int): Number of seconds between consecutive datetimes of the series.
+        format (str, optional): Output format. Defaults to None. It can be either JSON, CSV or NDJSON.
+        stream (bool, optional): Whether to stream the response as it is read from the database. Defaults to False.
+        Streamed responses allow series of up to MAX_STREAMED_RANGE_POINTS datetimes.
+
+    Raises:
+        HTTPException: If data validation fails, namely:
+        - If limit is not within 10 and 100
+        - If start or end are not in ISO format, or in the future
+        - If start is after end
+        - If step is not positive or the series has more than MAX_RANGE_POINTS datetimes
+        (MAX_STREAMED_RANGE_POINTS when streaming)
+        - If format is not CSV, JSON or NDJSON
+
+    Returns:
+        Response: Response containing the top crypto assets of the distinct snapshots closest to
+        each datetime of the series, sorted by timestamp and rank.
     """
     # Validate limit
     _validate_limit(limit)
 
-    # Validate timestamp
-    timestamp = _validate_timestamp(request.app.time_service, datetime)
+    # Validate range
+    start_timestamp = _validate_timestamp(request.app.time_service, start)
+    end_timestamp = _validate_timestamp(request.app.time_service, end)
+    _validate_range(start_timestamp, end_timestamp, step,
+                    MAX_STREAMED_RANGE_POINTS if stream else MAX_RANGE_POINTS)
 
     # Validate output
-    output_format = _validate_output_format(format)
+    output_format = _validate_output_format(
+        format, (OutputFormat.JSON, OutputFormat.CSV, OutputFormat.NDJSON))
+
+    # Stream results in output format, in batches as they are read
+    if stream:
+        batches = request.app.coin_resolver.stream_top_coins_in_range(
+            limit, start_timestamp, end_timestamp, step)
+        return StreamingResponse(output_format.stream(batches), media_type=output_format.media_type)
 
     # Fetch results
-    results = await _fetch_results(request.app.coin_resolver, limit, timestamp)
+    with REQUEST_STAGE_SECONDS.time("resolver"):
+        snapshots = await request.app.coin_resolver.fetch_top_snapshots_in_range(
+            limit, start_timestamp, end_timestamp, step)
 
     # Return results in output format
-    return _format_output(output_format, results)
+    entries = [entry for snapshot in snapshots for entry in snapshot.entries]
+    with REQUEST_STAGE_SECONDS.time("serialization"):
+        content = output_format.output(entries)
+    return Response(content=content, media_type=output_format.media_type)
+
+
+@router.get("/price_history", response_model=None)
+async def get_price_history(request: Request, symbol: str, start: str, end: str, bucket: int | None = None, format: str | None = None) -> Response:
+    """Gets the price history of a single crypto asset within a time range.
+
+    Args:
+        symbol (str): Symbol of the crypto asset, e.g. BTC.
+        start (str): Start of the range, in ISO format.
+        end (str): End of the range, inclusive, in ISO format.
+        bucket (int, optional): Number of seconds per bucket. Defaults to None. If given, only the last price
+        of each bucket is returned, so that the size of the response is bounded by the number of buckets.
+        format (str, optional): Output format. Defaults to None. It can be either JSON, CSV or NDJSON.
+
+    Raises:
+        HTTPException: If data validation fails, namely:
+        - If start or end are not in ISO format, or in the future
+        - If start is after end
+        - If bucket is not positive or the range has more than MAX_RANGE_POINTS buckets
+        - If format is not CSV, JSON or NDJSON
+
+    Returns:
+        Response: Response containing the prices of the crypto asset in the snapshots of the range, sorted by timestamp.
+    """
+    # Validate range
+    start_timestamp = _validate_timestamp(request.app.time_service, start)
+    end_timestamp = _validate_timestamp(request.app.time_service, end)
+    if bucket is not None:
+        _validate_range(start_timestamp, end_timestamp, bucket)
+    elif start_timestamp > end_timestamp:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Start must not be after end")
+
+    # Validate output
+    output_format = _validate_output_format(
+        format, (OutputFormat.JSON, OutputFormat.CSV, OutputFormat.NDJSON))
+
+    # Fetch results
+    with REQUEST_STAGE_SECONDS.time("resolver"):
+        entries = await request.app.coin_resolver.fetch_symbol_history(
+            symbol.upper(), start_timestamp, end_timestamp, bucket)
+
+    # Return results in output format
+    with REQUEST_STAGE_SECONDS.time("serialization"):
+        content = output_format.output(entries)
+    return Response(content=content, media_type=output_format.media_type)
+
+
+@router.get("/metrics", response_model=None)
+async def get_metrics() -> Response:
+    """Gets the metrics of the service in the Prometheus text exposition format.
+
+    Returns:
+        Response: Response containing histograms of the latency of the external API services, the database
+        operations and the stages of handling requests, the outcomes of the snapshot cache and the age of the
+        snapshots returned for current queries.
+    """
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 def _validate_limit(limit: int) -> None:
@@ -74,34 +212,84 @@ def _validate_timestamp(time_service: TimeService, datetime: str | None) -> dt |
     return timestamp
 
 
-def _validate_output_format(format: str | None) -> OutputFormat:
+def _validate_range(start: dt, end: dt, step: int, max_points: int = MAX_RANGE_POINTS) -> None:
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Start must not be after end")
+    if step <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Step must be a positive number of seconds")
+    if (end - start).total_seconds() / step >= max_points:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Range must not have more than {max_points} steps")
+
+
+def _validate_output_format(format: str | None, supported_formats: tuple[OutputFormat, ...] = (OutputFormat.CSV, OutputFormat.JSON)) -> OutputFormat:
     output_format = OutputFormat.JSON
     if format is not None:
-        if format.lower() == "csv":
-            output_format = OutputFormat.CSV
-        elif format.lower() != "json":
+        matching_formats = [
+            f for f in supported_formats if f.value == format.upper()]
+        if len(matching_formats) == 0:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="Format must be either CSV or JSON")
+                                detail="Format must be either {}".format(" or ".join(f.value for f in supported_formats)))
+        output_format = matching_formats[0]
     return output_format
 
 
-async def _fetch_results(coin_resolver: CoinResolver, limit: int, timestamp: dt | None) -> list[CryptoEntry]:
-    results: list[CryptoEntry] = []
-    start_time = time.time()
+async def _resolve_snapshot(coin_resolver: CoinResolver, timestamp: dt | None) -> ResolvedSnapshot | None:
     try:
-        results = await coin_resolver.fetch_top_coins(limit, timestamp)
+        return await coin_resolver.resolve_snapshot(timestamp)
     except UnavailableTime as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="No data available for the specified time.")
-    end_time = time.time()
-    logging.debug("Router: Time to fetch top coins: {} seconds".format(
-        end_time - start_time))
-    return results
-
-
-def _format_output(output_format: OutputFormat, results: list[CryptoEntry]) -> JSONResponse | PlainTextResponse:
-    formatted_output = output_format.output(results)
-    if output_format == OutputFormat.JSON:
-        return JSONResponse(content=formatted_output)
-    else:
-        return PlainTextResponse(content=formatted_output)
+
+
+async def _fetch_results(coin_resolver: CoinResolver, limit: int, timestamp: dt | None,
+                         resolved_snapshot: ResolvedSnapshot | None) -> Snapshot:
+    try:
+        with REQUEST_STAGE_SECONDS.time("resolver"):
+            return await coin_resolver.fetch_top_snapshot(limit, timestamp, resolved_snapshot)
+    except UnavailableTime as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="No data available for the specified time.")
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Current prices are temporarily unavailable.")
+
+
+def _cache_headers(time_service: TimeService, snapshot_timestamp: dt, limit: int, output_format: OutputFormat,
+                   is_current: bool, is_final: bool = False) -> dict[str, str]:
+    # Snapshots never change once taken, so they are identified by their timestamp
+    snapshot_id = int(snapshot_timestamp.timestamp() * 1_000_000)
+    headers = {
+        "ETag": f'"{snapshot_id}-{limit}-{output_format.value.lower()}"'}
+    if is_current:
+        age = max(0, int((time_service.now() - snapshot_timestamp).total_seconds()))
+        headers[SNAPSHOT_AGE_HEADER] = str(age)
+        headers["Cache-Control"] = f"max-age={max(0, CURRENT_SEARCH_SECONDS_RANGE - age)}"
+    elif is_final:
+        headers["Cache-Control"] = f"max-age={IMMUTABLE_MAX_AGE_SECONDS}, immutable"
+    return headers
+
+
+def _observe_snapshot_age(time_service: TimeService, snapshot_timestamp: dt, is_current: bool) -> None:
+    if is_current:
+        SNAPSHOT_AGE_SECONDS.observe(
+            max(0.0, (time_service.now() - snapshot_timestamp).total_seconds()))
+
+
+def _is_not_modified(request: Request, etag: str) -> bool:
+    if (if_none_match := request.headers.get("if-none-match")) is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _format_output(output_format: OutputFormat, snapshot: Snapshot, limit: int, headers: dict[str, str] | None = None) -> Response:
+    # Serialized outputs are rendered once per snapshot and sliced to the limit
+    with REQUEST_STAGE_SECONDS.time("serialization"):
+        formatted_output = snapshot.render(output_format, limit)
+    return Response(content=formatted_output, media_type=output_format.media_type, headers=headers)
@@ -1,109 +1,370 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timedelta
-from app.models.models import CryptoEntry
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from app.models.models import CryptoEntry, Resolution, RollupEntry
+from app.db.storage import Storage
+from app.services.metrics import DB_OPERATION_SECONDS
 from pymongo.mongo_client import MongoClient
 from pymongo.collection import Collection
+from pymongo.cursor import Cursor
+import functools
+import itertools
 import logging
+import asyncio
 
 load_dotenv()
 
 db_password = os.getenv("DB_PASSWORD")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_TIMEOUT_MS = int(os.getenv("DB_TIMEOUT_MS", "5000"))
 
+T = TypeVar("T")
 
-class Database:
-    """Database to store historical coin data"""
+DUPLICATE_KEY_ERROR = 11000
+
+
+class Database(Storage):
+    """MongoDB database to store historical coin data.
+
+    Each snapshot of top coins is stored as a single document in the `snapshots` collection,
+    holding its entries sorted by rank. The timestamps of all snapshots are additionally stored
+    in the `snapshot_timestamps` collection, so that closest timestamps can be found with
+    indexed point queries over small documents. Hourly and daily rollups are stored with
+    the same layout in the `snapshots_hourly` and `snapshots_daily` collections.
+
+    The history of a single coin is found through a compound index on the names of the
+    entries and the timestamp of the snapshots, in raw snapshots as well as in rollups.
+
+    Timestamps are stored as native BSON dates, which have millisecond precision.
+    Lookups only match dates, so ISO string timestamps stored by previous versions
+    are converted on initialization, see `migrate_string_timestamps`.
+
+    All operations are asynchronous: the blocking driver calls run in a bounded pool of
+    threads, sized like the connection pool, so that they never block the event loop.
+    """
+    executor: ThreadPoolExecutor
     client: MongoClient
-    collection: Collection
+    snapshots: Collection
+    snapshot_timestamps: Collection
+    legacy_collection: Collection
+    rollups: dict[Resolution, Collection]
 
-    def __init__(self):
+    def __init__(self, pool_size: int = DB_POOL_SIZE, timeout_ms: int = DB_TIMEOUT_MS):
         CONNECTION_STRING = "mongodb+srv://admin:" + \
             db_password + "@cluster0.0maxtet.mongodb.net"
-        self.client = MongoClient(CONNECTION_STRING)
-        self.collection = self.client["crypto"]["top_assets"]
+        self.executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="database")
+        self.client = MongoClient(CONNECTION_STRING, tz_aware=True,
+                                  maxPoolSize=pool_size,
+                                  connectTimeoutMS=timeout_ms,
+                                  serverSelectionTimeoutMS=timeout_ms,
+                                  socketTimeoutMS=timeout_ms,
+                                  waitQueueTimeoutMS=timeout_ms)
+        self.snapshots = self.client["crypto"]["snapshots"]
+        self.snapshot_timestamps = self.client["crypto"]["snapshot_timestamps"]
+        self.legacy_collection = self.client["crypto"]["top_assets"]
+        self.rollups = {resolution: self.client["crypto"][f"snapshots_{resolution.value}"]
+                        for resolution in Resolution if resolution != Resolution.RAW}
 
-    def close(self):
-        """Close database connection"""
+    async def close(self):
+        """Close database connection, once pending operations are done"""
+        await asyncio.to_thread(self.executor.shutdown, True)
         self.client.close()
 
-    async def insert_updated_data(self, crypto_entries: list[CryptoEntry]) -> None:
-        """Inserts new data about crypto entries.
+    async def initialize(self) -> None:
+        """Creates the indexes needed for snapshot lookups, if they don't exist yet,
+        and converts the ISO string timestamps left by previous versions."""
+        await self._run(self._create_indexes)
+        await self.migrate_string_timestamps()
 
-        Args:
-            crypto_entries (list[CryptoEntry]): crypto entries to store
-        """
-        crypto_entries_for_insertion = map(
-            lambda x: x.model_dump(mode="json"), crypto_entries)
-        self.collection.insert_many(crypto_entries_for_insertion)
+    async def insert_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        await self._run(self._insert_snapshots, snapshots)
+
+    async def insert_rollup(self, resolution: Resolution, rollup_entries: list[RollupEntry]) -> None:
+        await self._run(self._insert_rollup, resolution, rollup_entries)
 
-    def get_closest_timestamp(self, timestamp: datetime, seconds_range: int) -> datetime | None:
-        """Gets closest timestamps to the one given as reference within the input range of seconds.
+    async def delete_snapshots_before(self, timestamp: datetime) -> int:
+        return await self._run(self._delete_snapshots_before, timestamp)
 
-        Args:
-            timestamp (datetime): reference time to search around
-            seconds_range (int): number of seconds around the reference time for the search
+    async def get_latest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self._run(self._get_latest_timestamp, resolution)
 
-        Returns
-            datetime | None: the closest timestamp to the reference withing the input range or None, if not found.
+    async def get_earliest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self._run(self._get_earliest_timestamp, resolution)
+
+    async def get_closest_timestamp(self, timestamp: datetime, seconds_range: int, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self._run(self._get_closest_timestamp, timestamp, seconds_range, resolution)
+
+    async def get_historical_data(self, limit: int, timestamp: datetime, resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self._run(self._get_historical_data, limit, timestamp, resolution)
+
+    async def get_timestamps_between(self, start: datetime, end: datetime, resolution: Resolution = Resolution.RAW) -> list[datetime]:
+        return await self._run(self._get_timestamps_between, start, end, resolution)
+
+    async def get_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime],
+                                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self._run(self._get_historical_data_for_timestamps, limit, timestamps, resolution)
+
+    async def get_symbol_history(self, name: str, start: datetime, end: datetime,
+                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self._run(self._get_symbol_history, name, start, end, resolution)
+
+    async def stream_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime], batch_size: int,
+                                                    resolution: Resolution = Resolution.RAW) -> AsyncIterator[list[CryptoEntry]]:
+        if len(timestamps) == 0:
+            return
+        cursor = self._snapshot_collection(resolution).find(
+            {"timestamp": {"$in": timestamps}},
+            {"_id": 0, "timestamp": 1, "entries": {"$slice": limit}},
+            batch_size=batch_size).sort("timestamp", ASCENDING)
+        try:
+            while len(batch := await self._run(self._next_batch, cursor, batch_size)) > 0:
+                yield batch
+        finally:
+            await self._run(cursor.close)
+
+    async def migrate_legacy_data(self) -> int:
+        """Migrates crypto entries stored one per document in the legacy `top_assets` collection
+        to the snapshot layout. Snapshots that were already migrated are left untouched,
+        so that the migration can be run repeatedly.
+
+        Returns:
+            int: number of snapshots processed.
+        """
+        return await self._run(self._migrate_legacy_data)
+
+    async def migrate_string_timestamps(self) -> int:
+        """Converts ISO string timestamps stored by previous versions to native BSON dates.
+        Once converted, this only scans the empty string range of the timestamp indexes.
+
+        Returns:
+            int: number of documents converted.
         """
+        return await self._run(self._migrate_string_timestamps)
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        with DB_OPERATION_SECONDS.time(function.__name__.removeprefix("_")):
+            return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    def _create_indexes(self) -> None:
+        self.snapshots.create_index([("timestamp", ASCENDING)], unique=True)
+        self.snapshots.create_index(
+            [("entries.name", ASCENDING), ("timestamp", ASCENDING)])
+        self.snapshot_timestamps.create_index(
+            [("timestamp", ASCENDING)], unique=True)
+        for rollup_collection in self.rollups.values():
+            rollup_collection.create_index(
+                [("timestamp", ASCENDING)], unique=True)
+            rollup_collection.create_index(
+                [("entries.name", ASCENDING), ("timestamp", ASCENDING)])
+        logging.debug("Database: created indexes")
+
+    def _insert_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        snapshots = [crypto_entries for crypto_entries in snapshots if len(crypto_entries) > 0]
+        if len(snapshots) == 0:
+            return
+        # Timestamps are inserted last, so that lookups only find complete snapshots
+        self._insert_many_skipping_duplicates(self.snapshots, [{
+            "timestamp": crypto_entries[0].timestamp,
+            "entries": list(map(self._entry_document, crypto_entries))
+        } for crypto_entries in snapshots])
+        self._insert_many_skipping_duplicates(self.snapshot_timestamps, [
+            {"timestamp": crypto_entries[0].timestamp} for crypto_entries in snapshots])
+        logging.debug(f"Database: inserted {len(snapshots)} snapshots")
+
+    def _insert_many_skipping_duplicates(self, collection: Collection, documents: list[dict[str, Any]]) -> None:
+        # Unordered bulk writes go on past documents whose timestamp is already stored
+        try:
+            collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details["writeErrors"]):
+                raise
+
+    def _insert_rollup(self, resolution: Resolution, rollup_entries: list[RollupEntry]) -> None:
+        if len(rollup_entries) == 0:
+            return
+        timestamp = rollup_entries[0].timestamp
+        self.rollups[resolution].replace_one({"timestamp": timestamp}, {
+            "timestamp": timestamp,
+            "entries": list(map(self._rollup_entry_document, rollup_entries))
+        }, upsert=True)
+
+    def _delete_snapshots_before(self, timestamp: datetime) -> int:
+        result = self.snapshots.delete_many({"timestamp": {"$lt": timestamp}})
+        self.snapshot_timestamps.delete_many({"timestamp": {"$lt": timestamp}})
+        logging.info(
+            f"Database: deleted {result.deleted_count} snapshots before {timestamp.isoformat()}")
+        return result.deleted_count
+
+    def _get_latest_timestamp(self, resolution: Resolution) -> datetime | None:
+        latest = self._timestamp_collection(resolution).find_one(
+            {}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", DESCENDING)])
+        return self._parse_timestamp(latest["timestamp"]) if latest is not None else None
+
+    def _get_earliest_timestamp(self, resolution: Resolution) -> datetime | None:
+        earliest = self._timestamp_collection(resolution).find_one(
+            {}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", ASCENDING)])
+        return self._parse_timestamp(earliest["timestamp"]) if earliest is not None else None
+
+    def _get_closest_timestamp(self, timestamp: datetime, seconds_range: int, resolution: Resolution) -> datetime | None:
         max_timestamp = timestamp + timedelta(seconds=seconds_range/2)
         min_timestamp = timestamp - timedelta(seconds=seconds_range/2)
-        try:
-            close_timestamps_cursor = self.collection.aggregate([
-                {"$match":
-                    {"$and":
-                        [
-                            {"timestamp": {"$lte": max_timestamp.isoformat()}},
-                            {"timestamp": {"$gte": min_timestamp.isoformat()}}
-                        ]
-                     }
-                 },
-                {"$group":
-                    {
-                        "_id": None,
-                        "timestamp": {"$addToSet": "$timestamp"}
-                    }
-                 }
-            ])
-            close_timestamps = list(map(lambda t: datetime.fromisoformat(t),
-                                        close_timestamps_cursor.next()["timestamp"]))
-            logging.debug(
-                f"Database: found {len(close_timestamps)} between {min_timestamp.isoformat()} and {max_timestamp.isoformat()}")
-            return self._closest_timestamp(timestamp, close_timestamps)
-        except StopIteration:
+        projection = {"_id": 0, "timestamp": 1}
+        timestamp_collection = self._timestamp_collection(resolution)
+
+        # Nearest timestamp at or before the reference and nearest one at or after it
+        before = timestamp_collection.find_one(
+            {"timestamp": {"$lte": timestamp, "$gte": min_timestamp}},
+            projection, sort=[("timestamp", DESCENDING)])
+        after = timestamp_collection.find_one(
+            {"timestamp": {"$gte": timestamp, "$lte": max_timestamp}},
+            projection, sort=[("timestamp", ASCENDING)])
+        close_timestamps = [self._parse_timestamp(document["timestamp"])
+                            for document in (before, after) if document is not None]
+
+        if len(close_timestamps) == 0:
             logging.debug(
                 f"Database: Couldn't find any timestamps between {min_timestamp.isoformat()} and {max_timestamp.isoformat()}")
             return None
+        closest = min(close_timestamps, key=lambda t: abs(
+            (timestamp - t).total_seconds()))
+        logging.debug(f"Database: found closest time: {closest.isoformat()}")
+        return closest
 
-    def get_historical_data(self, limit: int, timestamp: datetime) -> list[CryptoEntry]:
-        """Gets historical data for crypto entries for a given timestamp.
+    def _get_historical_data(self, limit: int, timestamp: datetime, resolution: Resolution) -> list[CryptoEntry]:
+        snapshot = self._snapshot_collection(resolution).find_one(
+            {"timestamp": timestamp},
+            {"_id": 0, "entries": {"$slice": limit}})
+        entries = snapshot["entries"] if snapshot is not None else []
+        converted_results = list(map(
+            lambda x: self._crypto_entry(x, timestamp), entries))
+        logging.debug(
+            f"Database: retrieved {len(converted_results)} records of {resolution.value} historical data with timestamp {timestamp.isoformat()}")
+        return converted_results
 
-        Args:
-            limit (int): maximum number of results to return, sorted by rank
-            timestamp (datetime): timestamp for the search
+    def _get_timestamps_between(self, start: datetime, end: datetime, resolution: Resolution) -> list[datetime]:
+        cursor = self._timestamp_collection(resolution).find(
+            {"timestamp": {"$gte": start, "$lte": end}},
+            {"_id": 0, "timestamp": 1}).sort("timestamp", ASCENDING)
+        return [self._parse_timestamp(document["timestamp"]) for document in cursor]
 
-        Returns:
-            list[CryptoEntry]: list of crypto entries that matched the search criteria
-        """
-        results = self.collection.find(
-            {"timestamp": timestamp.isoformat()}).sort("rank").limit(limit)
-        converted_results = list(map(lambda x: CryptoEntry(**x), results))
+    def _get_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime], resolution: Resolution) -> list[CryptoEntry]:
+        if len(timestamps) == 0:
+            return []
+        cursor = self._snapshot_collection(resolution).find(
+            {"timestamp": {"$in": timestamps}},
+            {"_id": 0, "timestamp": 1, "entries": {"$slice": limit}}).sort("timestamp", ASCENDING)
+        converted_results: list[CryptoEntry] = []
+        for snapshot in cursor:
+            timestamp = self._parse_timestamp(snapshot["timestamp"])
+            converted_results.extend(map(
+                lambda x: self._crypto_entry(x, timestamp), snapshot["entries"]))
         logging.debug(
-            f"Database: retrieved {len(converted_results)} records of historical data with timestamp {timestamp.isoformat()}")
+            f"Database: retrieved {len(converted_results)} records of {resolution.value} historical data for {len(timestamps)} timestamps")
         return converted_results
 
-    def _closest_timestamp(self, reference: datetime, timestamps: list[datetime]) -> datetime | None:
+    def _get_symbol_history(self, name: str, start: datetime, end: datetime, resolution: Resolution) -> list[CryptoEntry]:
+        cursor = self._snapshot_collection(resolution).find(
+            {"entries.name": name, "timestamp": {"$gte": start, "$lte": end}},
+            {"_id": 0, "timestamp": 1, "entries": {"$elemMatch": {"name": name}}}).sort("timestamp", ASCENDING)
+        converted_results: list[CryptoEntry] = []
+        for snapshot in cursor:
+            timestamp = self._parse_timestamp(snapshot["timestamp"])
+            converted_results.extend(map(
+                lambda x: self._crypto_entry(x, timestamp), snapshot["entries"]))
         logging.debug(
-            f"Database: looking for the closest time to {reference.isoformat()} in {list(map(lambda t: t.isoformat(), timestamps))}")
-        if len(timestamps) == 0:
-            return None
-        closest = timestamps[0]
-        min_diff = abs((reference - closest).total_seconds())
-        for elem in timestamps:
-            diff = abs((reference - elem).total_seconds())
-            if diff < min_diff:
-                closest = elem
-                min_diff = diff
-        logging.debug(f"Database: found closest time: {closest.isoformat()}")
-        return closest
+            f"Database: retrieved {len(converted_results)} records of {resolution.value} historical data for {name}")
+        return converted_results
+
+    def _next_batch(self, cursor: Cursor, batch_size: int) -> list[CryptoEntry]:
+        converted_results: list[CryptoEntry] = []
+        for snapshot in itertools.islice(cursor, batch_size):
+            timestamp = self._parse_timestamp(snapshot["timestamp"])
+            converted_results.extend(map(
+                lambda x: self._crypto_entry(x, timestamp), snapshot["entries"]))
+        return converted_results
+
+    def _migrate_legacy_data(self) -> int:
+        legacy_snapshots = self.legacy_collection.aggregate([
+            {"$sort": {"timestamp": 1, "rank": 1}},
+            {"$group": {
+                "_id": "$timestamp",
+                "entries": {"$push": {"name": "$name", "value": "$value", "rank": "$rank"}}
+            }}
+        ], allowDiskUse=True)
+
+        num_snapshots = 0
+        snapshot_operations: list[UpdateOne] = []
+        timestamp_operations: list[UpdateOne] = []
+        for legacy_snapshot in legacy_snapshots:
+            timestamp = self._parse_timestamp(legacy_snapshot["_id"])
+            snapshot_operations.append(UpdateOne(
+                {"timestamp": timestamp},
+                {"$setOnInsert": {"timestamp": timestamp,
+                                  "entries": legacy_snapshot["entries"]}},
+                upsert=True))
+            timestamp_operations.append(UpdateOne(
+                {"timestamp": timestamp},
+                {"$setOnInsert": {"timestamp": timestamp}},
+                upsert=True))
+            num_snapshots += 1
+
+        if num_snapshots > 0:
+            self.snapshots.bulk_write(snapshot_operations, ordered=False)
+            self.snapshot_timestamps.bulk_write(
+                timestamp_operations, ordered=False)
+        logging.info(
+            f"Database: migrated {num_snapshots} legacy snapshots")
+        return num_snapshots
+
+    def _migrate_string_timestamps(self) -> int:
+        num_documents = 0
+        for collection in (self.snapshots, self.snapshot_timestamps):
+            operations = [
+                UpdateOne({"_id": document["_id"]},
+                          {"$set": {"timestamp": self._parse_timestamp(document["timestamp"])}})
+                for document in collection.find({"timestamp": {"$type": "string"}}, {"timestamp": 1})
+            ]
+            if len(operations) > 0:
+                collection.bulk_write(operations, ordered=False)
+            num_documents += len(operations)
+        logging.info(
+            f"Database: converted {num_documents} string timestamps to dates")
+        return num_documents
+
+    def _snapshot_collection(self, resolution: Resolution) -> Collection:
+        return self.snapshots if resolution == Resolution.RAW else self.rollups[resolution]
+
+    def _timestamp_collection(self, resolution: Resolution) -> Collection:
+        # Rollups are few, so their timestamps are looked up in the rollups themselves
+        return self.snapshot_timestamps if resolution == Resolution.RAW else self.rollups[resolution]
+
+    def _parse_timestamp(self, timestamp: datetime | str) -> datetime:
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp
+
+    def _entry_document(self, crypto_entry: CryptoEntry) -> dict[str, Any]:
+        return {
+            "name": crypto_entry.name,
+            "value": crypto_entry.value,
+            "rank": crypto_entry.rank
+        }
+
+    def _crypto_entry(self, document: dict[str, Any], timestamp: datetime) -> CryptoEntry:
+        return CryptoEntry(document["name"], document["value"], document["rank"], timestamp)
+
+    def _rollup_entry_document(self, rollup_entry: RollupEntry) -> dict[str, Any]:
+        return {
+            **self._entry_document(rollup_entry),
+            "min_value": rollup_entry.min_value,
+            "max_value": rollup_entry.max_value,
+            "mean_value": rollup_entry.mean_value
+        }
@@ -0,0 +1,58 @@
+from app.db.database import Database
+from app.db.storage import Storage
+from app.db.snapshot_archive import SnapshotArchive, SNAPSHOT_ARCHIVE_PATH, EPOCH
+from app.models.models import CryptoEntry
+from datetime import datetime, timedelta, timezone
+import logging
+import sys
+import asyncio
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+
+EXPORT_BATCH_SIZE = 100
+
+
+async def export_snapshots(storage: Storage, archive: SnapshotArchive, end: datetime) -> int:
+    """Appends the raw snapshots of a storage that are newer than the archive, up to a given time.
+
+    Args:
+        storage (Storage): storage to export snapshots from
+        archive (SnapshotArchive): archive to append snapshots to
+        end (datetime): time up to which snapshots are exported, inclusive
+
+    Returns:
+        int: number of snapshots appended.
+    """
+    start = EPOCH
+    if (latest_timestamp := archive.latest_timestamp()) is not None:
+        start = latest_timestamp + timedelta(microseconds=1)
+    timestamps = await storage.get_timestamps_between(start, end)
+
+    # Batches may split a snapshot, so entries are held until the next snapshot begins
+    num_snapshots = 0
+    snapshot_entries: list[CryptoEntry] = []
+    async for batch in storage.stream_historical_data_for_timestamps(archive.width, timestamps, EXPORT_BATCH_SIZE):
+        for crypto_entry in batch:
+            if len(snapshot_entries) > 0 and crypto_entry.timestamp != snapshot_entries[0].timestamp:
+                num_snapshots += archive.append(snapshot_entries)
+                snapshot_entries = []
+            snapshot_entries.append(crypto_entry)
+    num_snapshots += archive.append(snapshot_entries)
+    logging.info(f"Exported {num_snapshots} snapshots to {archive.path}")
+    return num_snapshots
+
+
+async def export(path: str):
+    """Exports the raw snapshots of the database to the snapshot archive at the given path."""
+    db = Database()
+    archive = SnapshotArchive(path)
+    try:
+        await export_snapshots(db, archive, datetime.now(timezone.utc))
+    finally:
+        archive.close()
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(export(sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_ARCHIVE_PATH))
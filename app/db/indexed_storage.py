@@ -0,0 +1,177 @@
+from dotenv import load_dotenv
+import os
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+from app.models.models import CryptoEntry, Resolution, RollupEntry
+from app.db.storage import Storage
+from app.db.timestamps import EPOCH, to_key, from_key, find_closest_key
+from app.services.time_service import TimeService
+import array
+import bisect
+import logging
+
+load_dotenv()
+
+INDEX_SYNC_INTERVAL_SECONDS = float(
+    os.getenv("INDEX_SYNC_INTERVAL_SECONDS", "10"))
+
+# Snapshots stored by other instances may be taken slightly before they are seen
+SYNC_MARGIN_SECONDS = 60
+
+
+class TimestampIndex:
+    """Sorted in-memory index of snapshot timestamps, stored as microseconds since the epoch."""
+    keys: array.array
+
+    def __init__(self):
+        self.keys = array.array("q")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, timestamp: datetime) -> None:
+        """Adds a timestamp to the index, unless it is already indexed."""
+        key = to_key(timestamp)
+        position = bisect.bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            self.keys.insert(position, key)
+
+    def discard(self, timestamp: datetime) -> None:
+        """Removes a timestamp from the index, if it is indexed."""
+        key = to_key(timestamp)
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def discard_before(self, timestamp: datetime) -> None:
+        """Removes the timestamps before a given time from the index."""
+        del self.keys[0:bisect.bisect_left(self.keys, to_key(timestamp))]
+
+    def find_closest(self, timestamp: datetime, seconds_range: int) -> datetime | None:
+        """Finds the closest indexed timestamp to the reference within the input range of seconds.
+
+        Args:
+            timestamp (datetime): reference time to search around
+            seconds_range (int): number of seconds around the reference time for the search
+
+        Returns:
+            datetime | None: the closest timestamp to the reference within the input range or None, if not found.
+        """
+        closest = find_closest_key(self.keys, to_key(timestamp), seconds_range)
+        return from_key(closest) if closest is not None else None
+
+    def between(self, start: datetime, end: datetime) -> list[datetime]:
+        """Gets the indexed timestamps within a time range, both ends included, sorted."""
+        start_position = bisect.bisect_left(self.keys, to_key(start))
+        end_position = bisect.bisect_right(self.keys, to_key(end))
+        return [from_key(key) for key in self.keys[start_position:end_position]]
+
+
+class IndexedStorage(Storage):
+    """Storage that resolves raw snapshot timestamps from a sorted in-memory index.
+
+    The index is loaded once on initialization with a query for timestamps only, and it is
+    updated as snapshots are inserted or deleted through this storage, so that it is always
+    current for the snapshots of this instance. Snapshots stored by other instances are picked
+    up incrementally, by querying the timestamps since the last sync, at most once per sync
+    interval and only when a lookup reaches beyond the last sync. Lookups of older times, and
+    all other lookups within the interval, never query the storage for timestamps. Snapshots
+    deleted by other instances are dropped from the index as it is synced, and as soon as a
+    lookup finds one of them gone. Rollups are always looked up in the underlying storage.
+    """
+    storage: Storage
+    time_service: TimeService
+    sync_interval_seconds: float
+    index: TimestampIndex
+    synced_until: datetime | None
+
+    def __init__(self, storage: Storage, time_service: TimeService,
+                 sync_interval_seconds: float = INDEX_SYNC_INTERVAL_SECONDS):
+        self.storage = storage
+        self.time_service = time_service
+        self.sync_interval_seconds = sync_interval_seconds
+        self.index = TimestampIndex()
+        self.synced_until = None
+
+    async def initialize(self) -> None:
+        await self.storage.initialize()
+        await self._sync()
+        logging.info(
+            f"IndexedStorage: Loaded {len(self.index)} snapshot timestamps")
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+    async def insert_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        await self.storage.insert_snapshots(snapshots)
+        for crypto_entries in snapshots:
+            if len(crypto_entries) > 0:
+                self.index.add(crypto_entries[0].timestamp)
+
+    async def insert_rollup(self, resolution: Resolution, rollup_entries: list[RollupEntry]) -> None:
+        await self.storage.insert_rollup(resolution, rollup_entries)
+
+    async def delete_snapshots_before(self, timestamp: datetime) -> int:
+        num_deleted = await self.storage.delete_snapshots_before(timestamp)
+        self.index.discard_before(timestamp)
+        return num_deleted
+
+    async def get_latest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self.storage.get_latest_timestamp(resolution)
+
+    async def get_earliest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self.storage.get_earliest_timestamp(resolution)
+
+    async def get_closest_timestamp(self, timestamp: datetime, seconds_range: int, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        if resolution != Resolution.RAW:
+            return await self.storage.get_closest_timestamp(timestamp, seconds_range, resolution)
+        await self._sync_until(timestamp + timedelta(seconds=seconds_range/2))
+        return self.index.find_closest(timestamp, seconds_range)
+
+    async def get_historical_data(self, limit: int, timestamp: datetime, resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        crypto_entries = await self.storage.get_historical_data(limit, timestamp, resolution)
+        if resolution == Resolution.RAW and len(crypto_entries) == 0:
+            # The snapshot was deleted by another instance, along with every older one
+            self.index.discard_before(timestamp + timedelta(microseconds=1))
+        return crypto_entries
+
+    async def get_timestamps_between(self, start: datetime, end: datetime, resolution: Resolution = Resolution.RAW) -> list[datetime]:
+        if resolution != Resolution.RAW:
+            return await self.storage.get_timestamps_between(start, end, resolution)
+        await self._sync_until(end)
+        return self.index.between(start, end)
+
+    async def get_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime],
+                                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self.storage.get_historical_data_for_timestamps(limit, timestamps, resolution)
+
+    async def get_symbol_history(self, name: str, start: datetime, end: datetime,
+                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self.storage.get_symbol_history(name, start, end, resolution)
+
+    def stream_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime], batch_size: int,
+                                              resolution: Resolution = Resolution.RAW) -> AsyncIterator[list[CryptoEntry]]:
+        return self.storage.stream_historical_data_for_timestamps(limit, timestamps, batch_size, resolution)
+
+    async def _sync_until(self, end: datetime) -> None:
+        if self.synced_until is None:
+            await self._sync()
+        elif end > self.synced_until and \
+                self.time_service.now() - self.synced_until >= timedelta(seconds=self.sync_interval_seconds):
+            await self._sync()
+
+    async def _sync(self) -> None:
+        now = self.time_service.now()
+        start = EPOCH
+        end = now + timedelta(seconds=SYNC_MARGIN_SECONDS)
+        if self.synced_until is not None:
+            start = self.synced_until - timedelta(seconds=SYNC_MARGIN_SECONDS)
+        # Raw snapshots are only deleted from the oldest, so those deleted by other instances
+        # are the ones before the earliest stored snapshot
+        earliest_timestamp = await self.storage.get_earliest_timestamp()
+        timestamps = await self.storage.get_timestamps_between(start, end)
+        self.index.discard_before(
+            earliest_timestamp if earliest_timestamp is not None else end)
+        for timestamp in timestamps:
+            self.index.add(timestamp)
+        self.synced_until = now
@@ -0,0 +1,22 @@
+from app.db.database import Database
+import logging
+import sys
+import asyncio
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+
+
+async def migrate():
+    """Migrates the legacy `top_assets` collection to the snapshot layout.
+    ISO string timestamps are converted to native dates on initialization."""
+    db = Database()
+    try:
+        await db.initialize()
+        await db.migrate_legacy_data()
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,340 @@
+from dotenv import load_dotenv
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, BinaryIO, Callable, Iterator, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from app.models.models import CryptoEntry, Resolution, RollupEntry
+from app.db.storage import Storage
+from app.db.timestamps import EPOCH, to_key, from_key, find_closest_key
+import array
+import bisect
+import fcntl
+import functools
+import mmap
+import logging
+import asyncio
+
+load_dotenv()
+
+SNAPSHOT_ARCHIVE_PATH = os.getenv("SNAPSHOT_ARCHIVE_PATH")
+
+ARCHIVE_WIDTH = 100
+NO_SYMBOL = -1
+
+T = TypeVar("T")
+
+
+class _Column:
+    """Append-only file of fixed-width rows of a primitive type, read through a memory map."""
+    file_path: str
+    typecode: str
+    row_length: int
+    row_size: int
+    file: BinaryIO
+    mapping: mmap.mmap | None
+    view: memoryview | None
+
+    def __init__(self, file_path: str, typecode: str, row_length: int):
+        self.file_path = file_path
+        self.typecode = typecode
+        self.row_length = row_length
+        self.row_size = array.array(typecode).itemsize * row_length
+        self.file = open(file_path, "a+b")
+        self.mapping = None
+        self.view = None
+
+    def num_rows(self) -> int:
+        return os.fstat(self.file.fileno()).st_size // self.row_size
+
+    def append(self, values: list) -> None:
+        self.file.write(array.array(self.typecode, values).tobytes())
+        self.file.flush()
+
+    def truncate(self, num_rows: int) -> None:
+        self.file.truncate(num_rows * self.row_size)
+
+    def rows(self, num_rows: int) -> memoryview:
+        if num_rows == 0:
+            return memoryview(b"").cast(self.typecode)
+        # Map the file again only once it has grown beyond the mapped rows
+        if self.view is None or len(self.view) < num_rows * self.row_length:
+            self._unmap()
+            self.mapping = mmap.mmap(
+                self.file.fileno(), num_rows * self.row_size, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mapping).cast(self.typecode)
+        return self.view[0:num_rows * self.row_length]
+
+    def close(self) -> None:
+        self._unmap()
+        self.file.close()
+
+    def _unmap(self) -> None:
+        # Views handed out over a previous mapping keep it alive until they are released
+        self.view = None
+        self.mapping = None
+
+
+class SnapshotArchive:
+    """Columnar archive of raw snapshots in local files, read through memory maps.
+
+    Snapshots are stored as fixed-width columns, in native byte order:
+    - `timestamps.bin`: sorted timestamps, as microseconds since the epoch (int64)
+    - `symbol_ids.bin`: matrix of symbol ids by snapshot and rank (int32), padded with -1
+    - `prices.bin`: matrix of prices by snapshot and rank (float64)
+    - `symbols.txt`: symbol names, one per line, in the order of their ids
+
+    Closest timestamps are found by binary search over the memory mapped timestamps, and the
+    top entries of a snapshot are sliced from the matrices without copying them. Timestamps are
+    written last, so that a snapshot only becomes visible to readers once it is complete.
+
+    Several processes may share an archive, e.g. the worker processes on a host. Appends are
+    serialized across them with the `archive.lock` file, and symbols are reloaded under that
+    lock before new ids are assigned, so that all processes agree on the ids of the symbols.
+    """
+    path: str
+    width: int
+    lock_file: BinaryIO
+    timestamps: _Column
+    symbol_ids: _Column
+    prices: _Column
+    symbols: list[str]
+    symbol_id_by_name: dict[str, int]
+
+    def __init__(self, path: str, width: int = ARCHIVE_WIDTH):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.width = width
+        self.lock_file = open(os.path.join(path, "archive.lock"), "a+b")
+        self.timestamps = _Column(os.path.join(
+            path, "timestamps.bin"), "q", 1)
+        self.symbol_ids = _Column(os.path.join(
+            path, "symbol_ids.bin"), "i", width)
+        self.prices = _Column(os.path.join(path, "prices.bin"), "d", width)
+        self.symbols = []
+        self.symbol_id_by_name = {}
+        self._load_symbols()
+
+    def __len__(self) -> int:
+        return self.timestamps.num_rows()
+
+    def close(self) -> None:
+        """Closes the archive files."""
+        for column in (self.timestamps, self.symbol_ids, self.prices):
+            column.close()
+        self.lock_file.close()
+
+    def latest_timestamp(self) -> datetime | None:
+        """Gets the timestamp of the latest archived snapshot.
+
+        Returns:
+            datetime | None: the latest timestamp or None, if the archive is empty.
+        """
+        if (num_snapshots := len(self)) == 0:
+            return None
+        return from_key(self.timestamps.rows(num_snapshots)[-1])
+
+    def append(self, crypto_entries: list[CryptoEntry]) -> bool:
+        """Appends a snapshot to the archive. Snapshots must be appended in chronological order.
+
+        Args:
+            crypto_entries (list[CryptoEntry]): crypto entries sorted by rank and sharing the same timestamp.
+            Entries beyond the width of the archive are dropped.
+
+        Returns:
+            bool: whether the snapshot was appended, i.e. it is newer than the latest archived snapshot.
+        """
+        if len(crypto_entries) == 0:
+            return False
+        key = to_key(crypto_entries[0].timestamp)
+        with self._write_lock():
+            num_snapshots = len(self)
+            if num_snapshots > 0 and key <= self.timestamps.rows(num_snapshots)[-1]:
+                logging.debug(
+                    f"SnapshotArchive: skipped snapshot with timestamp {crypto_entries[0].timestamp.isoformat()}, not newer than the archive")
+                return False
+
+            # Drop the rows of a snapshot whose timestamp was never written, e.g. by a writer that crashed
+            self.symbol_ids.truncate(num_snapshots)
+            self.prices.truncate(num_snapshots)
+
+            entries = crypto_entries[0:self.width]
+            padding = self.width - len(entries)
+            # Other processes may have assigned ids to new symbols since they were loaded
+            if any(entry.name not in self.symbol_id_by_name for entry in entries):
+                self._load_symbols()
+            self.symbol_ids.append(
+                [self._symbol_id(entry.name) for entry in entries] + [NO_SYMBOL] * padding)
+            self.prices.append(
+                [entry.value for entry in entries] + [0.0] * padding)
+            self.timestamps.append([key])
+            return True
+
+    def find_closest_timestamp(self, timestamp: datetime, seconds_range: int) -> datetime | None:
+        """Finds the closest archived timestamp to the reference within the input range of seconds.
+
+        Args:
+            timestamp (datetime): reference time to search around
+            seconds_range (int): number of seconds around the reference time for the search
+
+        Returns:
+            datetime | None: the closest timestamp to the reference within the input range or None, if not found.
+        """
+        closest = find_closest_key(self.timestamps.rows(len(self)), to_key(timestamp), seconds_range)
+        return from_key(closest) if closest is not None else None
+
+    def top(self, limit: int, timestamp: datetime) -> tuple[memoryview, memoryview] | None:
+        """Gets the symbol ids and prices of the top entries of a snapshot, as views over the archive.
+
+        Args:
+            limit (int): maximum number of entries, sorted by rank
+            timestamp (datetime): timestamp of the snapshot
+
+        Returns:
+            tuple[memoryview, memoryview] | None: symbol ids and prices of the top entries, padded with
+            NO_SYMBOL if the snapshot holds fewer entries, or None, if there is no snapshot with that timestamp.
+        """
+        if (index := self._index(timestamp)) is None:
+            return None
+        num_snapshots = len(self)
+        start = index * self.width
+        end = start + min(limit, self.width)
+        return self.symbol_ids.rows(num_snapshots)[start:end], self.prices.rows(num_snapshots)[start:end]
+
+    def get_entries(self, limit: int, timestamp: datetime) -> list[CryptoEntry] | None:
+        """Gets the top entries of a snapshot.
+
+        Args:
+            limit (int): maximum number of entries to return, sorted by rank
+            timestamp (datetime): timestamp of the snapshot
+
+        Returns:
+            list[CryptoEntry] | None: the top crypto entries or None, if there is no snapshot with that timestamp.
+        """
+        if (top := self.top(limit, timestamp)) is None:
+            return None
+        symbol_ids, prices = top
+        if max(symbol_ids, default=NO_SYMBOL) >= len(self.symbols):
+            self._load_symbols()
+        crypto_entries: list[CryptoEntry] = []
+        for rank, (symbol_id, price) in enumerate(zip(symbol_ids, prices), start=1):
+            if symbol_id == NO_SYMBOL:
+                break
+            crypto_entries.append(CryptoEntry(
+                name=self.symbols[symbol_id], value=price, rank=rank, timestamp=timestamp))
+        return crypto_entries
+
+    def _index(self, timestamp: datetime) -> int | None:
+        keys = self.timestamps.rows(len(self))
+        key = to_key(timestamp)
+        position = bisect.bisect_left(keys, key)
+        if position == len(keys) or keys[position] != key:
+            return None
+        return position
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _symbol_id(self, name: str) -> int:
+        if (symbol_id := self.symbol_id_by_name.get(name)) is not None:
+            return symbol_id
+        with open(os.path.join(self.path, "symbols.txt"), "a", encoding="utf-8") as symbols_file:
+            symbols_file.write(name + "\n")
+        symbol_id = len(self.symbols)
+        self.symbols.append(name)
+        self.symbol_id_by_name[name] = symbol_id
+        return symbol_id
+
+    def _load_symbols(self) -> None:
+        symbols_path = os.path.join(self.path, "symbols.txt")
+        if os.path.exists(symbols_path):
+            with open(symbols_path, encoding="utf-8") as symbols_file:
+                self.symbols = symbols_file.read().splitlines()
+        self.symbol_id_by_name = {
+            name: symbol_id for symbol_id, name in enumerate(self.symbols)}
+
+
+
+class ArchiveBackedStorage(Storage):
+    """Storage that mirrors raw snapshots into a snapshot archive and reads them from it.
+
+    Snapshots are appended to the archive as they are inserted. Lookups of raw snapshots are
+    answered from the archive when it holds them, and from the underlying storage otherwise,
+    e.g. for snapshots inserted by other instances.
+
+    Archive operations, which write, flush and map files, run in a dedicated thread,
+    so that they never block the event loop and never run concurrently.
+    """
+    storage: Storage
+    archive: SnapshotArchive
+    executor: ThreadPoolExecutor
+
+    def __init__(self, storage: Storage, archive: SnapshotArchive):
+        self.storage = storage
+        self.archive = archive
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="archive")
+
+    async def initialize(self) -> None:
+        await self.storage.initialize()
+
+    async def close(self) -> None:
+        await self.storage.close()
+        await self._run(self.archive.close)
+        await asyncio.to_thread(self.executor.shutdown, True)
+
+    async def insert_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        await self.storage.insert_snapshots(snapshots)
+        await self._run(self._append_snapshots, snapshots)
+
+    async def insert_rollup(self, resolution: Resolution, rollup_entries: list[RollupEntry]) -> None:
+        await self.storage.insert_rollup(resolution, rollup_entries)
+
+    async def delete_snapshots_before(self, timestamp: datetime) -> int:
+        return await self.storage.delete_snapshots_before(timestamp)
+
+    async def get_latest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self.storage.get_latest_timestamp(resolution)
+
+    async def get_earliest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self.storage.get_earliest_timestamp(resolution)
+
+    async def get_closest_timestamp(self, timestamp: datetime, seconds_range: int, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        if resolution == Resolution.RAW and \
+                (closest_timestamp := await self._run(self.archive.find_closest_timestamp, timestamp, seconds_range)) is not None:
+            return closest_timestamp
+        return await self.storage.get_closest_timestamp(timestamp, seconds_range, resolution)
+
+    async def get_historical_data(self, limit: int, timestamp: datetime, resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        if resolution == Resolution.RAW and limit <= self.archive.width and \
+                (crypto_entries := await self._run(self.archive.get_entries, limit, timestamp)) is not None:
+            return crypto_entries
+        return await self.storage.get_historical_data(limit, timestamp, resolution)
+
+    async def get_timestamps_between(self, start: datetime, end: datetime, resolution: Resolution = Resolution.RAW) -> list[datetime]:
+        return await self.storage.get_timestamps_between(start, end, resolution)
+
+    async def get_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime],
+                                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self.storage.get_historical_data_for_timestamps(limit, timestamps, resolution)
+
+    async def get_symbol_history(self, name: str, start: datetime, end: datetime,
+                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self.storage.get_symbol_history(name, start, end, resolution)
+
+    def stream_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime], batch_size: int,
+                                              resolution: Resolution = Resolution.RAW) -> AsyncIterator[list[CryptoEntry]]:
+        return self.storage.stream_historical_data_for_timestamps(limit, timestamps, batch_size, resolution)
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    def _append_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        for crypto_entries in sorted(snapshots, key=lambda entries: entries[0].timestamp if len(entries) > 0 else EPOCH):
+            self.archive.append(crypto_entries)
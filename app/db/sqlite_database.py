@@ -0,0 +1,263 @@
+from dotenv import load_dotenv
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from app.models.models import CryptoEntry, Resolution, RollupEntry
+from app.db.storage import Storage
+from app.services.metrics import DB_OPERATION_SECONDS
+import sqlite3
+import functools
+import logging
+import asyncio
+
+load_dotenv()
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "top_crypto_price_list.db")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+SQLITE_MAX_QUERY_PARAMETERS = 500
+
+T = TypeVar("T")
+
+
+class SQLiteDatabase(Storage):
+    """Embedded SQLite database to store historical coin data in a local file.
+
+    Snapshot timestamps are stored as microseconds since the epoch in an indexed table,
+    so that closest timestamps are found with 2 indexed point queries, and the entries
+    of each snapshot are clustered by timestamp and rank. The history of a single coin
+    is found through an index on the name and timestamp of the entries. Hourly and daily
+    rollups are stored with the same layout and indexes in tables suffixed with their resolution.
+
+    The connection is used from a single thread, which serializes all operations
+    without blocking the event loop.
+    """
+    executor: ThreadPoolExecutor
+    connection: sqlite3.Connection
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sqlite")
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+    async def initialize(self) -> None:
+        """Creates the tables and indexes for snapshots, if they don't exist yet."""
+        await self._run(self._create_tables)
+
+    async def close(self) -> None:
+        await self._run(self.connection.close)
+        await asyncio.to_thread(self.executor.shutdown, True)
+
+    async def insert_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        await self._run(self._insert_snapshots, snapshots)
+
+    async def insert_rollup(self, resolution: Resolution, rollup_entries: list[RollupEntry]) -> None:
+        await self._run(self._insert_rollup, resolution, rollup_entries)
+
+    async def delete_snapshots_before(self, timestamp: datetime) -> int:
+        return await self._run(self._delete_snapshots_before, timestamp)
+
+    async def get_latest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self._run(self._get_latest_timestamp, resolution)
+
+    async def get_earliest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self._run(self._get_earliest_timestamp, resolution)
+
+    async def get_closest_timestamp(self, timestamp: datetime, seconds_range: int, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        return await self._run(self._get_closest_timestamp, timestamp, seconds_range, resolution)
+
+    async def get_historical_data(self, limit: int, timestamp: datetime, resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self._run(self._get_historical_data, limit, timestamp, resolution)
+
+    async def get_timestamps_between(self, start: datetime, end: datetime, resolution: Resolution = Resolution.RAW) -> list[datetime]:
+        return await self._run(self._get_timestamps_between, start, end, resolution)
+
+    async def get_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime],
+                                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self._run(self._get_historical_data_for_timestamps, limit, timestamps, resolution)
+
+    async def get_symbol_history(self, name: str, start: datetime, end: datetime,
+                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        return await self._run(self._get_symbol_history, name, start, end, resolution)
+
+    async def stream_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime], batch_size: int,
+                                                    resolution: Resolution = Resolution.RAW) -> AsyncIterator[list[CryptoEntry]]:
+        keys = sorted(map(self._to_key, timestamps))
+        for chunk_start in range(0, len(keys), SQLITE_MAX_QUERY_PARAMETERS):
+            chunk = keys[chunk_start:chunk_start + SQLITE_MAX_QUERY_PARAMETERS]
+            cursor = await self._run(self._select_entries, limit, chunk, resolution)
+            try:
+                while len(batch := await self._run(self._next_batch, cursor, batch_size * limit)) > 0:
+                    yield batch
+            finally:
+                await self._run(cursor.close)
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        with DB_OPERATION_SECONDS.time(function.__name__.removeprefix("_")):
+            return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    def _create_tables(self) -> None:
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots (timestamp INTEGER PRIMARY KEY)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "timestamp INTEGER NOT NULL, rank INTEGER NOT NULL, name TEXT NOT NULL, value REAL NOT NULL, "
+                "PRIMARY KEY (timestamp, rank)) WITHOUT ROWID")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_name_timestamp ON entries (name, timestamp)")
+            for resolution in Resolution:
+                if resolution == Resolution.RAW:
+                    continue
+                snapshots_table, entries_table = self._tables(resolution)
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {snapshots_table} (timestamp INTEGER PRIMARY KEY)")
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {entries_table} ("
+                    "timestamp INTEGER NOT NULL, rank INTEGER NOT NULL, name TEXT NOT NULL, value REAL NOT NULL, "
+                    "min_value REAL NOT NULL, max_value REAL NOT NULL, mean_value REAL NOT NULL, "
+                    "PRIMARY KEY (timestamp, rank)) WITHOUT ROWID")
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {entries_table}_name_timestamp ON {entries_table} (name, timestamp)")
+        logging.debug("SQLiteDatabase: created tables")
+
+    def _insert_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        snapshots = [crypto_entries for crypto_entries in snapshots if len(crypto_entries) > 0]
+        if len(snapshots) == 0:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO snapshots (timestamp) VALUES (?)",
+                [(self._to_key(crypto_entries[0].timestamp),) for crypto_entries in snapshots])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO entries (timestamp, rank, name, value) VALUES (?, ?, ?, ?)",
+                [(self._to_key(entry.timestamp), entry.rank, entry.name, entry.value)
+                 for crypto_entries in snapshots for entry in crypto_entries])
+
+    def _insert_rollup(self, resolution: Resolution, rollup_entries: list[RollupEntry]) -> None:
+        if len(rollup_entries) == 0:
+            return
+        timestamp = self._to_key(rollup_entries[0].timestamp)
+        snapshots_table, entries_table = self._tables(resolution)
+        with self.connection:
+            self.connection.execute(
+                f"INSERT OR IGNORE INTO {snapshots_table} (timestamp) VALUES (?)", (timestamp,))
+            self.connection.execute(
+                f"DELETE FROM {entries_table} WHERE timestamp = ?", (timestamp,))
+            self.connection.executemany(
+                f"INSERT INTO {entries_table} (timestamp, rank, name, value, min_value, max_value, mean_value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(timestamp, entry.rank, entry.name, entry.value, entry.min_value, entry.max_value, entry.mean_value)
+                 for entry in rollup_entries])
+
+    def _delete_snapshots_before(self, timestamp: datetime) -> int:
+        key = self._to_key(timestamp)
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM entries WHERE timestamp < ?", (key,))
+            num_snapshots = self.connection.execute(
+                "DELETE FROM snapshots WHERE timestamp < ?", (key,)).rowcount
+        logging.info(
+            f"SQLiteDatabase: deleted {num_snapshots} snapshots before {timestamp.isoformat()}")
+        return num_snapshots
+
+    def _get_latest_timestamp(self, resolution: Resolution) -> datetime | None:
+        snapshots_table, _ = self._tables(resolution)
+        latest = self.connection.execute(
+            f"SELECT MAX(timestamp) FROM {snapshots_table}").fetchone()[0]
+        return self._from_key(latest) if latest is not None else None
+
+    def _get_earliest_timestamp(self, resolution: Resolution) -> datetime | None:
+        snapshots_table, _ = self._tables(resolution)
+        earliest = self.connection.execute(
+            f"SELECT MIN(timestamp) FROM {snapshots_table}").fetchone()[0]
+        return self._from_key(earliest) if earliest is not None else None
+
+    def _get_closest_timestamp(self, timestamp: datetime, seconds_range: int, resolution: Resolution) -> datetime | None:
+        reference = self._to_key(timestamp)
+        half_range = timedelta(seconds=seconds_range/2) // timedelta(microseconds=1)
+        snapshots_table, _ = self._tables(resolution)
+
+        # Nearest timestamp at or before the reference and nearest one at or after it
+        before = self.connection.execute(
+            f"SELECT timestamp FROM {snapshots_table} WHERE timestamp <= ? AND timestamp >= ? ORDER BY timestamp DESC LIMIT 1",
+            (reference, reference - half_range)).fetchone()
+        after = self.connection.execute(
+            f"SELECT timestamp FROM {snapshots_table} WHERE timestamp >= ? AND timestamp <= ? ORDER BY timestamp ASC LIMIT 1",
+            (reference, reference + half_range)).fetchone()
+        close_timestamps = [row[0] for row in (before, after) if row is not None]
+
+        if len(close_timestamps) == 0:
+            logging.debug(
+                f"SQLiteDatabase: Couldn't find any timestamps around {timestamp.isoformat()}")
+            return None
+        closest = self._from_key(
+            min(close_timestamps, key=lambda t: abs(reference - t)))
+        logging.debug(
+            f"SQLiteDatabase: found closest time: {closest.isoformat()}")
+        return closest
+
+    def _get_historical_data(self, limit: int, timestamp: datetime, resolution: Resolution) -> list[CryptoEntry]:
+        _, entries_table = self._tables(resolution)
+        rows = self.connection.execute(
+            f"SELECT name, value, rank FROM {entries_table} WHERE timestamp = ? ORDER BY rank LIMIT ?",
+            (self._to_key(timestamp), limit)).fetchall()
+        converted_results = list(map(
+            lambda row: CryptoEntry(name=row[0], value=row[1], rank=row[2], timestamp=timestamp), rows))
+        logging.debug(
+            f"SQLiteDatabase: retrieved {len(converted_results)} records of {resolution.value} historical data with timestamp {timestamp.isoformat()}")
+        return converted_results
+
+    def _get_timestamps_between(self, start: datetime, end: datetime, resolution: Resolution) -> list[datetime]:
+        snapshots_table, _ = self._tables(resolution)
+        rows = self.connection.execute(
+            f"SELECT timestamp FROM {snapshots_table} WHERE timestamp >= ? AND timestamp <= ? ORDER BY timestamp",
+            (self._to_key(start), self._to_key(end))).fetchall()
+        return [self._from_key(row[0]) for row in rows]
+
+    def _get_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime], resolution: Resolution) -> list[CryptoEntry]:
+        converted_results: list[CryptoEntry] = []
+        keys = sorted(map(self._to_key, timestamps))
+        for chunk_start in range(0, len(keys), SQLITE_MAX_QUERY_PARAMETERS):
+            chunk = keys[chunk_start:chunk_start + SQLITE_MAX_QUERY_PARAMETERS]
+            converted_results.extend(self._next_batch(
+                self._select_entries(limit, chunk, resolution), None))
+        logging.debug(
+            f"SQLiteDatabase: retrieved {len(converted_results)} records of {resolution.value} historical data for {len(timestamps)} timestamps")
+        return converted_results
+
+    def _get_symbol_history(self, name: str, start: datetime, end: datetime, resolution: Resolution) -> list[CryptoEntry]:
+        _, entries_table = self._tables(resolution)
+        cursor = self.connection.execute(
+            f"SELECT timestamp, name, value, rank FROM {entries_table} WHERE name = ? AND timestamp >= ? AND timestamp <= ? "
+            "ORDER BY timestamp", (name, self._to_key(start), self._to_key(end)))
+        converted_results = self._next_batch(cursor, None)
+        logging.debug(
+            f"SQLiteDatabase: retrieved {len(converted_results)} records of {resolution.value} historical data for {name}")
+        return converted_results
+
+    def _select_entries(self, limit: int, keys: list[int], resolution: Resolution) -> sqlite3.Cursor:
+        # Ranks start at 1 and have no gaps, so the rank bounds the number of entries per snapshot
+        _, entries_table = self._tables(resolution)
+        placeholders = ",".join("?" * len(keys))
+        return self.connection.execute(
+            f"SELECT timestamp, name, value, rank FROM {entries_table} WHERE timestamp IN ({placeholders}) AND rank <= ? "
+            "ORDER BY timestamp, rank", (*keys, limit))
+
+    def _next_batch(self, cursor: sqlite3.Cursor, num_rows: int | None) -> list[CryptoEntry]:
+        rows = cursor.fetchall() if num_rows is None else cursor.fetchmany(num_rows)
+        return list(map(
+            lambda row: CryptoEntry(name=row[1], value=row[2], rank=row[3], timestamp=self._from_key(row[0])), rows))
+
+    def _tables(self, resolution: Resolution) -> tuple[str, str]:
+        if resolution == Resolution.RAW:
+            return "snapshots", "entries"
+        return f"snapshots_{resolution.value}", f"entries_{resolution.value}"
+
+    def _to_key(self, timestamp: datetime) -> int:
+        return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+    def _from_key(self, key: int) -> datetime:
+        return EPOCH + timedelta(microseconds=key)
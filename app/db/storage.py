@@ -0,0 +1,156 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import AsyncIterator
+from app.models.models import CryptoEntry, Resolution, RollupEntry
+
+
+class Storage(ABC):
+    """Storage for historical coin data.
+
+    Each snapshot of top coins is identified by the timestamp shared by its entries.
+    Besides raw snapshots, hourly and daily rollups of them can be stored (see `Resolution`).
+    """
+
+    async def initialize(self) -> None:
+        """Prepares the storage for use, e.g. creating its indexes."""
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Frees up storage resources, once pending operations are done."""
+
+    @abstractmethod
+    async def insert_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        """Inserts several snapshots at once. Snapshots that are already stored are skipped,
+        so that a batch can be retried after a partial failure.
+
+        Args:
+            snapshots (list[list[CryptoEntry]]): snapshots to store, each one with crypto entries
+            sorted by rank and sharing the same timestamp
+        """
+
+    @abstractmethod
+    async def insert_rollup(self, resolution: Resolution, rollup_entries: list[RollupEntry]) -> None:
+        """Inserts or replaces the rollup of a time bucket.
+
+        Args:
+            resolution (Resolution): resolution of the rollup
+            rollup_entries (list[RollupEntry]): rollup entries to store, sorted by rank and sharing the same timestamp
+        """
+
+    @abstractmethod
+    async def delete_snapshots_before(self, timestamp: datetime) -> int:
+        """Deletes the raw snapshots taken before a given time. Rollups are kept.
+
+        Args:
+            timestamp (datetime): time before which raw snapshots are deleted
+
+        Returns:
+            int: number of snapshots deleted.
+        """
+
+    @abstractmethod
+    async def get_latest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        """Gets the timestamp of the latest snapshot stored in a resolution.
+
+        Args:
+            resolution (Resolution, optional): resolution of the snapshots. Defaults to Resolution.RAW.
+
+        Returns:
+            datetime | None: the latest timestamp or None, if there are no snapshots.
+        """
+
+    @abstractmethod
+    async def get_earliest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        """Gets the timestamp of the earliest snapshot stored in a resolution.
+
+        Args:
+            resolution (Resolution, optional): resolution of the snapshots. Defaults to Resolution.RAW.
+
+        Returns:
+            datetime | None: the earliest timestamp or None, if there are no snapshots.
+        """
+
+    @abstractmethod
+    async def get_closest_timestamp(self, timestamp: datetime, seconds_range: int, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        """Gets closest timestamps to the one given as reference within the input range of seconds.
+
+        Args:
+            timestamp (datetime): reference time to search around
+            seconds_range (int): number of seconds around the reference time for the search
+            resolution (Resolution, optional): resolution of the snapshots to search. Defaults to Resolution.RAW.
+
+        Returns
+            datetime | None: the closest timestamp to the reference withing the input range or None, if not found.
+        """
+
+    @abstractmethod
+    async def get_historical_data(self, limit: int, timestamp: datetime, resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        """Gets historical data for crypto entries for a given timestamp.
+
+        Args:
+            limit (int): maximum number of results to return, sorted by rank
+            timestamp (datetime): timestamp for the search
+            resolution (Resolution, optional): resolution of the snapshot. Defaults to Resolution.RAW.
+
+        Returns:
+            list[CryptoEntry]: list of crypto entries that matched the search criteria
+        """
+
+    @abstractmethod
+    async def get_timestamps_between(self, start: datetime, end: datetime, resolution: Resolution = Resolution.RAW) -> list[datetime]:
+        """Gets the timestamps of all snapshots stored in a resolution within a time range.
+
+        Args:
+            start (datetime): start of the range, inclusive
+            end (datetime): end of the range, inclusive
+            resolution (Resolution, optional): resolution of the snapshots. Defaults to Resolution.RAW.
+
+        Returns:
+            list[datetime]: sorted timestamps of the snapshots in the range.
+        """
+
+    @abstractmethod
+    async def get_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime],
+                                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        """Gets historical data for crypto entries for several timestamps at once.
+
+        Args:
+            limit (int): maximum number of results to return per timestamp, sorted by rank
+            timestamps (list[datetime]): timestamps for the search
+            resolution (Resolution, optional): resolution of the snapshots. Defaults to Resolution.RAW.
+
+        Returns:
+            list[CryptoEntry]: list of crypto entries that matched the search criteria, sorted by timestamp and rank
+        """
+
+    @abstractmethod
+    async def get_symbol_history(self, name: str, start: datetime, end: datetime,
+                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        """Gets the historical data of a single crypto within a time range.
+
+        Args:
+            name (str): name of the crypto
+            start (datetime): start of the range, inclusive
+            end (datetime): end of the range, inclusive
+            resolution (Resolution, optional): resolution of the snapshots. Defaults to Resolution.RAW.
+
+        Returns:
+            list[CryptoEntry]: crypto entries of the snapshots in the range that include the crypto, sorted by timestamp
+        """
+
+    @abstractmethod
+    def stream_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime], batch_size: int,
+                                              resolution: Resolution = Resolution.RAW) -> AsyncIterator[list[CryptoEntry]]:
+        """Streams historical data for crypto entries for several timestamps, in batches pulled from the database,
+        so that memory usage does not depend on the number of results.
+
+        Args:
+            limit (int): maximum number of results to return per timestamp, sorted by rank
+            timestamps (list[datetime]): timestamps for the search
+            batch_size (int): number of snapshots per batch
+            resolution (Resolution, optional): resolution of the snapshots. Defaults to Resolution.RAW.
+
+        Returns:
+            AsyncIterator[list[CryptoEntry]]: batches of crypto entries that matched the search criteria, sorted by timestamp and rank
+        """
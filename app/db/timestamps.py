@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
+import bisect
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_key(timestamp: datetime) -> int:
+    """Converts a timestamp to microseconds since the epoch, which sort like the timestamps."""
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def from_key(key: int) -> datetime:
+    """Converts microseconds since the epoch back to a timestamp."""
+    return EPOCH + timedelta(microseconds=key)
+
+
+def find_closest_key(keys: Sequence[int], reference: int, seconds_range: int) -> int | None:
+    """Finds the closest key to the reference within the input range of seconds by binary search.
+
+    Args:
+        keys (Sequence[int]): sorted timestamps as microseconds since the epoch, e.g. an array or a memory mapped view
+        reference (int): reference time to search around, as microseconds since the epoch
+        seconds_range (int): number of seconds around the reference time for the search
+
+    Returns:
+        int | None: the closest key to the reference within the input range or None, if not found.
+    """
+    position = bisect.bisect_left(keys, reference)
+    candidates = keys[max(0, position - 1):position + 1]
+    if len(candidates) == 0:
+        return None
+    closest = min(candidates, key=lambda key: abs(reference - key))
+    if abs(reference - closest) > timedelta(seconds=seconds_range/2) // timedelta(microseconds=1):
+        return None
+    return closest
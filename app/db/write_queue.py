@@ -0,0 +1,123 @@
+from dotenv import load_dotenv
+import os
+from app.db.storage import Storage
+from app.models.models import CryptoEntry
+from app.services.metrics import WRITE_QUEUE_DEPTH, WRITE_QUEUE_FLUSH_SECONDS, WRITE_QUEUE_DROPPED_SNAPSHOTS
+import logging
+import asyncio
+
+load_dotenv()
+
+WRITE_QUEUE_CAPACITY = int(os.getenv("WRITE_QUEUE_CAPACITY", "1000"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "50"))
+WRITE_FLUSH_INTERVAL_SECONDS = float(
+    os.getenv("WRITE_FLUSH_INTERVAL_SECONDS", "1"))
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", "3"))
+WRITE_RETRY_BACKOFF_SECONDS = 0.5
+
+
+class SnapshotWriteQueue:
+    """Bounded queue of snapshots to be stored in the database in batches.
+
+    Snapshots are grouped into batches, which are flushed once they reach the batch size or
+    once the flush interval has elapsed since the first snapshot of the batch was queued.
+    Failed batches are retried with exponential backoff, and the queue is drained when closed,
+    so that no snapshot is lost on shutdown. Snapshots are dropped, rather than blocking the
+    callers, if the queue is full, e.g. while the database is unavailable.
+    """
+    db: Storage
+    capacity: int
+    batch_size: int
+    flush_interval_seconds: float
+    max_retries: int
+    queue: asyncio.Queue[list[CryptoEntry] | None]
+    task: asyncio.Task | None
+    is_closed: bool
+
+    def __init__(self, db: Storage, capacity: int = WRITE_QUEUE_CAPACITY, batch_size: int = WRITE_BATCH_SIZE,
+                 flush_interval_seconds: float = WRITE_FLUSH_INTERVAL_SECONDS, max_retries: int = WRITE_MAX_RETRIES):
+        self.db = db
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max_retries
+        self.queue = asyncio.Queue(capacity)
+        self.task = None
+        self.is_closed = False
+
+    def put(self, crypto_entries: list[CryptoEntry]) -> bool:
+        """Queues a snapshot to be stored, without waiting for it to be stored.
+
+        Args:
+            crypto_entries (list[CryptoEntry]): crypto entries sorted by rank and sharing the same timestamp
+
+        Returns:
+            bool: whether the snapshot was queued, i.e. the queue is open and not full.
+        """
+        if self.is_closed:
+            logging.warning(
+                "SnapshotWriteQueue: Dropped snapshot queued after closing")
+            WRITE_QUEUE_DROPPED_SNAPSHOTS.inc("closed")
+            return False
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        try:
+            self.queue.put_nowait(crypto_entries)
+        except asyncio.QueueFull:
+            logging.warning(
+                f"SnapshotWriteQueue: Dropped snapshot, the queue is full with {self.capacity} snapshots")
+            WRITE_QUEUE_DROPPED_SNAPSHOTS.inc("full")
+            return False
+        WRITE_QUEUE_DEPTH.set(self.queue.qsize())
+        return True
+
+    async def close(self) -> None:
+        """Stops accepting snapshots and waits for the queued ones to be stored."""
+        self.is_closed = True
+        if (task := self.task) is None:
+            return
+        # The end of the queue is marked once there is room for it
+        await self.queue.put(None)
+        await task
+        self.task = None
+        logging.debug("SnapshotWriteQueue: Drained")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        is_draining = False
+        while not is_draining:
+            if (crypto_entries := await self.queue.get()) is None:
+                break
+            batch = [crypto_entries]
+            deadline = loop.time() + self.flush_interval_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    crypto_entries = await asyncio.wait_for(self.queue.get(), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if crypto_entries is None:
+                    is_draining = True
+                    break
+                batch.append(crypto_entries)
+            WRITE_QUEUE_DEPTH.set(self.queue.qsize())
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[list[CryptoEntry]]) -> None:
+        with WRITE_QUEUE_FLUSH_SECONDS.time():
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self.db.insert_snapshots(batch)
+                    logging.debug(
+                        f"SnapshotWriteQueue: Stored {len(batch)} snapshots")
+                    return
+                except Exception:
+                    if attempt == self.max_retries:
+                        logging.exception(
+                            f"SnapshotWriteQueue: Dropped {len(batch)} snapshots after {attempt + 1} failed attempts")
+                        WRITE_QUEUE_DROPPED_SNAPSHOTS.inc(
+                            "failed", amount=len(batch))
+                        return
+                    backoff_seconds = WRITE_RETRY_BACKOFF_SECONDS * 2 ** attempt
+                    logging.warning(
+                        f"SnapshotWriteQueue: Failed to store {len(batch)} snapshots, retrying in {backoff_seconds} seconds")
+                    await asyncio.sleep(backoff_seconds)
@@ -1,38 +1,91 @@
-from app.db.database import Database
+from dotenv import load_dotenv
+import os
+from app.db.storage import Storage
+from app.db.write_queue import SnapshotWriteQueue
+from app.db.timestamps import to_key, from_key, find_closest_key
 from app.services.coin_market_cap import CoinMarketCap
 from app.services.crypto_compare import CryptoCompare
 from app.services.time_service import TimeService
-from app.models.models import CryptoEntry
+from app.models.models import CryptoEntry, ResolvedSnapshot, Resolution, Snapshot
 from app.models.errors import UnavailableTime
-from datetime import datetime
+from app.logic.snapshot_cache import SnapshotCache
+from app.logic.symbol_table import SymbolTable
+from app.logic.historical_cache import HistoricalCache
+from app.logic.shared_snapshot_store import SharedSnapshotStore
+from app.services.metrics import SNAPSHOT_CACHE_REQUESTS, SNAPSHOT_REFRESHES, SNAPSHOT_COALESCED_REFRESHES
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Iterable
+import itertools
 import logging
 import asyncio
 
 CURRENT_SEARCH_SECONDS_RANGE = 60
 HISTORICAL_SEARCH_SECONDS_RANGE = 60 * 60 * 24
+SNAPSHOT_SIZE = 100
+STREAM_BATCH_SIZE = 100
+
+load_dotenv()
+
+SNAPSHOT_MAX_STALENESS_SECONDS = os.getenv("SNAPSHOT_MAX_STALENESS_SECONDS")
+
+
+def downsample_to_last(crypto_entries: list[CryptoEntry], bucket_seconds: int) -> list[CryptoEntry]:
+    """Downsamples the history of a crypto to the last entry of each time bucket.
+
+    Buckets are aligned to the epoch, so that they don't depend on the start of the history.
+
+    Args:
+        crypto_entries (list[CryptoEntry]): entries of a single crypto, sorted by timestamp
+        bucket_seconds (int): number of seconds per bucket
+
+    Returns:
+        list[CryptoEntry]: the last entry of each non-empty bucket, sorted by timestamp.
+    """
+    return [list(bucket_entries)[-1] for _, bucket_entries in itertools.groupby(
+        crypto_entries, key=lambda entry: entry.timestamp.timestamp() // bucket_seconds)]
 
 
 class CoinResolver:
     """Resolves coin data from different sources: 
     external API services for current time queries and database for historical queries.
     """
-    db: Database
+    db: Storage
     coin_market_cap: CoinMarketCap
     crypto_compare: CryptoCompare
     time_service: TimeService
-    db_tasks: set[asyncio.Task]
+    snapshot_cache: SnapshotCache
+    symbol_table: SymbolTable
+    historical_cache: HistoricalCache
+    shared_snapshot_store: SharedSnapshotStore | None
+    write_queue: SnapshotWriteQueue
+    background_refresh_tasks: set[asyncio.Task]
+    refresh_task: asyncio.Task | None
+    scheduled_refresh: bool
+    max_staleness_seconds: float | None
 
-    def __init__(self, db: Database, coin_market_cap: CoinMarketCap, crypto_compare: CryptoCompare, time_service: TimeService):
+    def __init__(self, db: Storage, coin_market_cap: CoinMarketCap, crypto_compare: CryptoCompare, time_service: TimeService,
+                 max_staleness_seconds: float | None = None, symbol_table: SymbolTable | None = None,
+                 historical_cache: HistoricalCache | None = None, shared_snapshot_store: SharedSnapshotStore | None = None,
+                 write_queue: SnapshotWriteQueue | None = None):
         self.db = db
         self.coin_market_cap = coin_market_cap
         self.crypto_compare = crypto_compare
         self.time_service = time_service
-        self.db_tasks = set()
+        self.snapshot_cache = SnapshotCache(CURRENT_SEARCH_SECONDS_RANGE)
+        self.symbol_table = symbol_table if symbol_table is not None else SymbolTable()
+        self.historical_cache = historical_cache if historical_cache is not None else HistoricalCache()
+        self.shared_snapshot_store = shared_snapshot_store
+        self.write_queue = write_queue if write_queue is not None else SnapshotWriteQueue(db)
+        self.background_refresh_tasks = set()
+        self.refresh_task = None
+        self.scheduled_refresh = False
+        self.max_staleness_seconds = max_staleness_seconds
         logging.debug("CoinResolver: Initialized coin resolver")
 
-    def close(self):
-        """Frees up resources."""
-        self.db.close()
+    async def close(self):
+        """Frees up resources, once the queued snapshots are stored."""
+        await self.write_queue.close()
+        await self.db.close()
         logging.debug("CoinResolver: Closed coin resolver")
 
     async def fetch_top_coins(self, limit: int, timestamp: datetime | None) -> list[CryptoEntry]:
@@ -44,13 +97,29 @@ class CoinResolver:
 
         When in "current" more, updated coin data is retrieved from external API services,
         unless another current query has been performed within CURRENT_SEARCH_SECONDS_RANGE,
-        in which case the cached result is returned.
+        in which case the cached result is returned. The latest snapshot is kept in memory,
+        so that the database is only queried for it if it was stored by another instance.
 
         Coin data retrieved from external services is stored in the database so that it
-        becomes available for historical queries.
+        becomes available for historical queries. Concurrent current queries share a single
+        refresh from the external services (see `refresh`). If snapshots are refreshed by
+        a background scheduler, the latest snapshot is returned regardless of its age.
+
+        If a maximum staleness is configured, an expired snapshot not older than that
+        is returned right away, while a refresh is started in the background
+        (stale-while-revalidate).
+
+        If a shared snapshot store is given, the worker processes on a host share the latest
+        snapshot through it, and only one of them refreshes it from the external services (see `refresh`).
 
         When in "historical" mode, the coin data is retrieved from the database, if available.
+        Raw snapshots are searched first and, if they have aged out, the hourly and then the
+        daily rollups, as long as their buckets fit within HISTORICAL_SEARCH_SECONDS_RANGE.
         If not available, an UnavailableTime exception is raised.
+        The historical cache keeps the snapshot resolved for each bucket of requested times
+        and the full ranked entries of each snapshot. The closest snapshot is searched around
+        the requested time, and it is only cached for its bucket if it is the closest one for
+        every time in the bucket, and newer snapshots can't be closer to any of them.
 
         Args:
             limit (int): The number of coins to return.
@@ -62,76 +131,410 @@ class CoinResolver:
         Returns:
             list[CryptoEntry]: a list of CryptoEntry objects.
         """
-        if (timestamp_for_query := self._get_fetch_timestamp(timestamp)) is not None:
+        snapshot = await self.fetch_top_snapshot(limit, timestamp)
+        return snapshot.top(limit)
+
+    async def fetch_top_snapshot(self, limit: int, timestamp: datetime | None,
+                                 resolved_snapshot: ResolvedSnapshot | None = None) -> Snapshot:
+        """Fetches a snapshot of top coins by market volume, as described in `fetch_top_coins`.
+
+        Args:
+            limit (int): The minimum number of coins the snapshot must hold, if available.
+            timestamp (datetime, optional): The timestamp to use for historical queries. Defaults to None.
+            resolved_snapshot (ResolvedSnapshot, optional): The snapshot resolved for the timestamp
+            by `resolve_snapshot`, so that it is not resolved again. Defaults to None.
+
+        Raises:
+            UnavailableTime: If we hold no data in the database for the requested timestamp.
+
+        Returns:
+            Snapshot: a snapshot holding at least the top `limit` coins, if available.
+            Current snapshots hold the full ranked list of coins.
+        """
+        if timestamp is None:
+            if resolved_snapshot is not None and resolved_snapshot.snapshot is not None:
+                # The snapshot cache was already looked up by `resolve_snapshot`
+                cached_snapshot = resolved_snapshot.snapshot
+            else:
+                cached_snapshot = self._get_cached_snapshot()
+            if cached_snapshot is not None:
+                SNAPSHOT_CACHE_REQUESTS.inc("hit")
+                return cached_snapshot
+            SNAPSHOT_CACHE_REQUESTS.inc("miss")
+
+        if timestamp is None or resolved_snapshot is None:
+            resolved_snapshot = await self._resolve_snapshot(timestamp)
+        if resolved_snapshot is not None:
             logging.info(
-                f"CoinResolver: Fetching coins from DB with timestamp {timestamp_for_query.isoformat()}")
-            return self.db.get_historical_data(limit, timestamp_for_query)
+                f"CoinResolver: Fetching {resolved_snapshot.resolution.value} coins from DB with timestamp {resolved_snapshot.timestamp.isoformat()}")
+            if timestamp is not None:
+                return await self._get_resolved_historical_snapshot(timestamp, resolved_snapshot)
+
+            # Keep the full snapshot stored by another instance for upcoming current queries
+            snapshot = Snapshot(await self.db.get_historical_data(
+                SNAPSHOT_SIZE, resolved_snapshot.timestamp))
+            self.snapshot_cache.publish(snapshot)
+            return snapshot
         else:
             logging.info(f"CoinResolver: Fetching coins from remote source")
 
             # Fetch coins from remote source
-            top_coins = await self._fetch_top_coins_from_API_services()
+            return await self.refresh()
+
+    async def fetch_top_snapshots_in_range(self, limit: int, start: datetime, end: datetime, step_seconds: int) -> list[Snapshot]:
+        """Fetches historical snapshots of top coins for a series of times.
+
+        For every time from start to end in steps of the given number of seconds, the closest
+        snapshot is resolved as for historical queries in `fetch_top_coins`, falling back to the
+        rollups for times without a raw snapshot. All the timestamps around the range are retrieved
+        at once and the coins of all resolved snapshots are retrieved at once for each resolution,
+        instead of querying the database for each time.
+
+        Args:
+            limit (int): The number of coins to return per snapshot.
+            start (datetime): The first time of the series.
+            end (datetime): The last time of the series, inclusive.
+            step_seconds (int): The number of seconds between consecutive times of the series.
+
+        Returns:
+            list[Snapshot]: the distinct snapshots closest to the times of the series, sorted by timestamp.
+            Times without a snapshot within the historical search range are skipped.
+        """
+        entries: list[CryptoEntry] = []
+        for resolution, snapshot_timestamps in await self._get_range_timestamps(start, end, step_seconds):
+            entries.extend(await self.db.get_historical_data_for_timestamps(limit, snapshot_timestamps, resolution))
+        return [Snapshot(list(snapshot_entries))
+                for _, snapshot_entries in itertools.groupby(entries, key=lambda entry: entry.timestamp)]
+
+    async def stream_top_coins_in_range(self, limit: int, start: datetime, end: datetime, step_seconds: int,
+                                        batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[list[CryptoEntry]]:
+        """Streams historical top coins for a series of times, as described in `fetch_top_snapshots_in_range`.
+
+        Coins are pulled from the database in batches as they are consumed,
+        so that memory usage does not depend on the number of coins returned.
+
+        Args:
+            limit (int): The number of coins to return per snapshot.
+            start (datetime): The first time of the series.
+            end (datetime): The last time of the series, inclusive.
+            step_seconds (int): The number of seconds between consecutive times of the series.
+            batch_size (int, optional): The number of snapshots per batch. Defaults to STREAM_BATCH_SIZE.
+
+        Returns:
+            AsyncIterator[list[CryptoEntry]]: batches of coins, sorted by timestamp and rank.
+        """
+        for resolution, snapshot_timestamps in await self._get_range_timestamps(start, end, step_seconds):
+            async for batch in self.db.stream_historical_data_for_timestamps(limit, snapshot_timestamps, batch_size, resolution):
+                yield batch
+
+    async def fetch_symbol_history(self, name: str, start: datetime, end: datetime,
+                                   bucket_seconds: int | None = None) -> list[CryptoEntry]:
+        """Fetches the historical prices of a single coin within a time range.
+
+        Prices older than the earliest raw snapshot stored, e.g. once raw snapshots have aged out,
+        are read from the hourly rollups, and prices older than those from the daily rollups.
+
+        Args:
+            name (str): The name of the coin.
+            start (datetime): The start of the range.
+            end (datetime): The end of the range, inclusive.
+            bucket_seconds (int | None, optional): If given, the history is downsampled to the last
+            price of each bucket of that many seconds. Defaults to None.
+
+        Returns:
+            list[CryptoEntry]: The coin entries found in the range, sorted by timestamp.
+        """
+        crypto_entries: list[CryptoEntry] = []
+        resolution_end = end
+        for resolution in Resolution:
+            if resolution_end < start:
+                break
+            crypto_entries[0:0] = await self.db.get_symbol_history(name, start, resolution_end, resolution)
+            if (earliest_timestamp := await self.db.get_earliest_timestamp(resolution)) is not None:
+                resolution_end = min(
+                    resolution_end, earliest_timestamp - timedelta(microseconds=1))
+        logging.info(
+            f"CoinResolver: Fetched {len(crypto_entries)} entries for {name} from DB between {start.isoformat()} and {end.isoformat()}")
+        if bucket_seconds is not None:
+            crypto_entries = downsample_to_last(crypto_entries, bucket_seconds)
+        return crypto_entries
+
+    async def resolve_snapshot(self, timestamp: datetime | None) -> ResolvedSnapshot | None:
+        """Resolves the snapshot that `fetch_top_snapshot` would return, without fetching its coins,
+        so that callers can validate their cached copies. Resolutions can be passed on to
+        `fetch_top_snapshot`, so that they are not resolved again. Current resolutions hold
+        the cached snapshot, so that the snapshot cache is only looked up once per query.
+
+        Args:
+            timestamp (datetime, optional): The timestamp to use for historical queries. Defaults to None.
+
+        Raises:
+            UnavailableTime: If we hold no data in the database for the requested timestamp.
+
+        Returns:
+            ResolvedSnapshot | None: the resolved snapshot or None, if a current snapshot is not cached.
+        """
+        if timestamp is None:
+            cached_snapshot = self._get_cached_snapshot()
+            if cached_snapshot is None or cached_snapshot.timestamp is None:
+                return None
+            return ResolvedSnapshot(cached_snapshot.timestamp, Resolution.RAW, False, cached_snapshot)
+        return await self._resolve_snapshot(timestamp)
+
+    async def refresh(self) -> Snapshot:
+        """Refreshes the latest snapshot of top coins from external API services.
+
+        At most one refresh is in flight at any time. Callers arriving while a refresh
+        is ongoing are coalesced: they wait for it and share its result.
 
-            # Store in DB for historical data in the background
-            db_task = asyncio.create_task(
-                self.db.insert_updated_data(top_coins))
-            self.db_tasks.add(db_task)
-            db_task.add_done_callback(self.db_tasks.discard)
+        With a shared snapshot store, refreshes are also serialized across worker processes.
+        The worker holding the lock of the store leads the refresh and shares the new snapshot,
+        while the others find it fresh in the store once they get the lock, without querying
+        the external services or storing it in the database again.
 
-            # Return within limit
-            return top_coins[0:limit]
+        Returns:
+            Snapshot: the new snapshot, holding the full ranked list of coins.
+        """
+        if (refresh_task := self.refresh_task) is not None:
+            SNAPSHOT_COALESCED_REFRESHES.inc()
+            logging.debug(
+                "CoinResolver: Waiting for refresh already in flight")
+        else:
+            refresh_task = self._start_refresh()
 
-    def _get_fetch_timestamp(self, reference: datetime | None) -> datetime | None:
+        # Shield the shared refresh so that a cancelled caller does not cancel it for the others
+        return await asyncio.shield(refresh_task)
+
+    async def _get_range_timestamps(self, start: datetime, end: datetime,
+                                    step_seconds: int) -> list[tuple[Resolution, list[datetime]]]:
+        references: list[datetime] = []
+        reference = start
+        while reference <= end:
+            references.append(reference)
+            reference += timedelta(seconds=step_seconds)
+
+        # As for single historical queries, rollups are only searched for the times without
+        # a close-enough raw snapshot, from the finest to the coarsest resolution
+        tolerance = timedelta(seconds=HISTORICAL_SEARCH_SECONDS_RANGE/2)
+        closest: list[tuple[datetime, Resolution] | None] = [None] * len(references)
+        for resolution in Resolution:
+            unresolved = [i for i, closest_timestamp in enumerate(closest) if closest_timestamp is None]
+            if len(unresolved) == 0:
+                break
+            if resolution.bucket_seconds > HISTORICAL_SEARCH_SECONDS_RANGE:
+                continue
+            keys = list(map(to_key, await self.db.get_timestamps_between(
+                references[unresolved[0]] - tolerance, references[unresolved[-1]] + tolerance, resolution)))
+            for i in unresolved:
+                if (closest_key := find_closest_key(keys, to_key(references[i]), HISTORICAL_SEARCH_SECONDS_RANGE)) is not None:
+                    closest[i] = (from_key(closest_key), resolution)
+
+        # Rollups are only found before the earliest raw snapshot, so the snapshots stay sorted by timestamp
+        snapshot_timestamps: list[tuple[datetime, Resolution]] = []
+        for closest_timestamp in closest:
+            if closest_timestamp is not None and closest_timestamp not in snapshot_timestamps[-1:]:
+                snapshot_timestamps.append(closest_timestamp)
+        logging.info(
+            f"CoinResolver: Fetching {len(snapshot_timestamps)} snapshots from DB between {start.isoformat()} and {end.isoformat()}")
+        return [(resolution, [timestamp for timestamp, _ in resolution_timestamps])
+                for resolution, resolution_timestamps in itertools.groupby(snapshot_timestamps, key=lambda t: t[1])]
+
+    async def _get_resolved_historical_snapshot(self, reference: datetime, resolved_snapshot: ResolvedSnapshot) -> Snapshot:
+        num_failures: dict[Resolution, int] = {}
+        while (snapshot := await self._get_historical_snapshot(resolved_snapshot.timestamp, resolved_snapshot.resolution)).timestamp is None:
+            # The raw snapshot was deleted since it was resolved, e.g. once it was rolled up by this or another instance
+            logging.info(
+                f"CoinResolver: Snapshot with timestamp {resolved_snapshot.timestamp.isoformat()} is gone, resolving {reference.isoformat()} again")
+            self.historical_cache.discard_timestamp(
+                self.historical_cache.bucket(reference))
+
+            # Raw snapshots are deleted from the oldest, so a newer one may still be close enough. A resolution
+            # is searched once more, since the storage may still report snapshots deleted by other instances,
+            # and then only the coarser ones are searched, down to the rollups.
+            resolution = resolved_snapshot.resolution
+            num_failures[resolution] = num_failures.get(resolution, 0) + 1
+            resolved_snapshot = await self._resolve_snapshot(reference, [
+                r for r in Resolution if r.bucket_seconds >= resolution.bucket_seconds and num_failures.get(r, 0) < 2])
+        return snapshot
+
+    async def _get_historical_snapshot(self, timestamp: datetime, resolution: Resolution) -> Snapshot:
+        # Fetch the full ranked snapshot, so that any limit can be served from the cache
+        if (snapshot := self.historical_cache.get_snapshot(timestamp, resolution)) is not None:
+            logging.debug(
+                "CoinResolver: Returning coins from historical cache")
+            return snapshot
+        snapshot = Snapshot(await self.db.get_historical_data(SNAPSHOT_SIZE, timestamp, resolution))
+        if snapshot.timestamp is not None:
+            self.historical_cache.put_snapshot(timestamp, resolution, snapshot)
+        return snapshot
+
+    def _get_cached_snapshot(self) -> Snapshot | None:
+        if (cached_snapshot := self.snapshot_cache.get(self.time_service.now())) is not None:
+            logging.debug("CoinResolver: Returning coins from snapshot cache")
+            return cached_snapshot
+        if self._publish_shared_snapshot() and \
+                (shared_snapshot := self.snapshot_cache.get(self.time_service.now())) is not None:
+            logging.debug(
+                "CoinResolver: Returning coins from shared snapshot store")
+            return shared_snapshot
+        if self.scheduled_refresh and (latest_snapshot := self.snapshot_cache.latest()) is not None:
+            logging.debug(
+                "CoinResolver: Returning latest scheduled snapshot from snapshot cache")
+            return latest_snapshot
+        if self.max_staleness_seconds is not None and \
+                (stale_snapshot := self.snapshot_cache.get(self.time_service.now(), self.max_staleness_seconds)) is not None:
+            logging.debug(
+                "CoinResolver: Returning stale coins from snapshot cache while refreshing")
+            self._refresh_in_background()
+            return stale_snapshot
+        return None
+
+    def _start_refresh(self) -> asyncio.Task:
+        refresh_task = asyncio.create_task(self._refresh_snapshot())
+        refresh_task.add_done_callback(self._clear_refresh_task)
+        self.refresh_task = refresh_task
+        SNAPSHOT_REFRESHES.inc()
+        return refresh_task
+
+    def _refresh_in_background(self) -> None:
+        # The refresh is started right away, so that queries arriving before it runs don't start another one
+        if self.refresh_task is not None:
+            return
+        background_task = asyncio.create_task(
+            self._refresh_quietly(self._start_refresh()))
+        self.background_refresh_tasks.add(background_task)
+        background_task.add_done_callback(
+            self.background_refresh_tasks.discard)
+
+    async def _refresh_quietly(self, refresh_task: asyncio.Task) -> None:
+        try:
+            await refresh_task
+        except Exception:
+            logging.exception("CoinResolver: Background refresh failed")
+
+    def _publish_shared_snapshot(self) -> bool:
+        if self.shared_snapshot_store is None or (shared_snapshot := self.shared_snapshot_store.read()) is None:
+            return False
+        self.snapshot_cache.publish(shared_snapshot)
+        return True
+
+    async def _refresh_snapshot(self) -> Snapshot:
+        if self.shared_snapshot_store is None:
+            return await self._refresh_snapshot_from_API_services()
+
+        async with self.shared_snapshot_store.refresh_lock():
+            # Another worker may have led the refresh while we waited for the lock
+            if self._publish_shared_snapshot() and \
+                    (shared_snapshot := self.snapshot_cache.get(self.time_service.now())) is not None:
+                logging.debug(
+                    "CoinResolver: Refresh was led by another worker")
+                return shared_snapshot
+            snapshot = await self._refresh_snapshot_from_API_services()
+            try:
+                await asyncio.to_thread(self.shared_snapshot_store.write, snapshot)
+            except OSError:
+                logging.exception(
+                    "CoinResolver: Could not share snapshot with other workers")
+            return snapshot
+
+    async def _refresh_snapshot_from_API_services(self) -> Snapshot:
+        top_coins, age_seconds = await self._fetch_top_coins_from_API_services()
+        # Data of an unavailable service is timestamped with its age, but only fetched again after the TTL
+        snapshot = Snapshot(top_coins, top_coins[0].timestamp + timedelta(seconds=age_seconds)
+                            if len(top_coins) > 0 else None)
+        self.snapshot_cache.publish(snapshot)
+
+        # Store in DB for historical data in the background, unless it holds
+        # the last good data of an unavailable service, which is only served
+        if age_seconds > 0:
+            logging.warning(
+                f"CoinResolver: Not storing snapshot built from data {age_seconds:.0f} seconds old")
+        else:
+            self.write_queue.put(top_coins)
+
+        return snapshot
+
+    def _clear_refresh_task(self, refresh_task: asyncio.Task) -> None:
+        if self.refresh_task is refresh_task:
+            self.refresh_task = None
+
+    async def _resolve_snapshot(self, reference: datetime | None,
+                                resolutions: Iterable[Resolution] = Resolution) -> ResolvedSnapshot | None:
         # No reference was given, we are performing a current search
         if reference is None:
             # If we fetched recently, return that timestamp
             now = self.time_service.now()
-            if (closest_timestamp := self.db.get_closest_timestamp(now, CURRENT_SEARCH_SECONDS_RANGE)) is not None:
-                return closest_timestamp
+            if (closest_timestamp := await self.db.get_closest_timestamp(now, CURRENT_SEARCH_SECONDS_RANGE)) is not None:
+                return ResolvedSnapshot(closest_timestamp, Resolution.RAW, False)
             # Otherwise, return None
             else:
                 return None
 
         # We are querying for historical data.
-        # If we have a close-enough timestamp in the db, use that
-        if (closest_timestamp := self.db.get_closest_timestamp(reference, HISTORICAL_SEARCH_SECONDS_RANGE)) is not None:
-            return closest_timestamp
+        # If we resolved the same bucket of times before, use that.
+        bucket = self.historical_cache.bucket(reference)
+        if (fetch_timestamp := self.historical_cache.get_timestamp(bucket)) is not None:
+            return ResolvedSnapshot(*fetch_timestamp, True)
+
+        # If we have a close-enough timestamp in the db, use that.
+        # Rollups are only used once raw snapshots have aged out, from the finest to the coarsest
+        # resolution whose buckets fit within the search range.
+        for resolution in resolutions:
+            if resolution.bucket_seconds > HISTORICAL_SEARCH_SECONDS_RANGE:
+                continue
+            if (closest_timestamp := await self.db.get_closest_timestamp(reference, HISTORICAL_SEARCH_SECONDS_RANGE, resolution)) is not None:
+                now = self.time_service.now()
+                is_final = self.historical_cache.is_final_resolution(
+                    reference, closest_timestamp, now, CURRENT_SEARCH_SECONDS_RANGE)
+                if is_final and await self._is_final_resolution_for_bucket(bucket, reference, closest_timestamp, resolution, now):
+                    self.historical_cache.put_timestamp(
+                        bucket, (closest_timestamp, resolution))
+                return ResolvedSnapshot(closest_timestamp, resolution, is_final)
 
         # If it's not found, we don't have it
         logging.debug(
             f"CoinResolver: could not find any timestamp for historical data around {reference.isoformat()}")
         raise UnavailableTime()
 
-    async def _fetch_top_coins_from_API_services(self) -> list[CryptoEntry]:
+    async def _is_final_resolution_for_bucket(self, bucket: datetime, reference: datetime, timestamp: datetime,
+                                              resolution: Resolution, now: datetime) -> bool:
+        # The closest snapshot only moves forward as the requested time does, so a snapshot closest
+        # to both edges of the bucket is the closest one for every time in it. Newer snapshots would
+        # be closer to the end of the bucket first.
+        bucket_end = bucket + \
+            timedelta(seconds=self.historical_cache.bucket_seconds)
+        if not self.historical_cache.is_final_resolution(bucket_end, timestamp, now, CURRENT_SEARCH_SECONDS_RANGE):
+            return False
+        for edge in (bucket, bucket_end):
+            if edge != reference and \
+                    await self.db.get_closest_timestamp(edge, HISTORICAL_SEARCH_SECONDS_RANGE, resolution) != timestamp:
+                return False
+        return True
+
+    async def _fetch_top_coins_from_API_services(self) -> tuple[list[CryptoEntry], float]:
         now = self.time_service.now()
 
         # Fetch network data in parallel
-        coin_prices, top_crypto = await asyncio.gather(
-            self.coin_market_cap.get_coin_prices(),
+        (coin_listings, listings_age_seconds), (top_crypto, top_crypto_age_seconds) = await asyncio.gather(
+            self.coin_market_cap.get_coin_listings(),
             self.crypto_compare.get_top_crypto_list()
         )
 
-        # Merge results
-        top_crypto_with_price: list[CryptoEntry] = []
-        idx = 1
-        for coin_symbol, coin_name in top_crypto:
-            # Try match by symbol
-            value = coin_prices.get(coin_symbol)
-            if value is None:
-                # If we couldn't find it, try match by name
-                value = coin_prices.get(coin_name)
-
-            if value is not None:
-                cryptoEntry = CryptoEntry(
-                    name=coin_symbol,
-                    value=value,
-                    rank=idx,
-                    timestamp=now
-                )
-                top_crypto_with_price.append(cryptoEntry)
-                idx += 1
-            else:
-                logging.debug(
-                    f"CoinResolver: could not find price for {coin_symbol}. Skipping.")
+        # Snapshots are as old as the oldest data they hold, e.g. the last good response of an
+        # unavailable service. Their timestamps are stored with millisecond precision.
+        age_seconds = max(listings_age_seconds, top_crypto_age_seconds)
+        timestamp = now - timedelta(seconds=age_seconds)
+        timestamp = timestamp.replace(
+            microsecond=timestamp.microsecond // 1000 * 1000)
+
+        # Merge results through the symbol table. Unmatched coins are skipped,
+        # so that ranks have no gaps, and they are reported by the symbol table.
+        matched_coins = self.symbol_table.merge(coin_listings, top_crypto)
+        if self.symbol_table.is_modified:
+            try:
+                await asyncio.to_thread(self.symbol_table.save)
+            except OSError:
+                logging.exception("CoinResolver: Could not save symbol table")
 
-        return top_crypto_with_price
+        return [CryptoEntry(coin_symbol, value, rank, timestamp)
+                for rank, (coin_symbol, value) in enumerate(matched_coins, start=1)], age_seconds
@@ -0,0 +1,196 @@
+from dotenv import load_dotenv
+import os
+from app.models.models import CryptoEntry, Resolution, Snapshot
+from app.services.metrics import HISTORICAL_CACHE_REQUESTS, HISTORICAL_CACHE_EVICTIONS
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Hashable
+import sys
+import logging
+
+load_dotenv()
+
+HISTORICAL_CACHE_MAX_MB = float(os.getenv("HISTORICAL_CACHE_MAX_MB", 32))
+HISTORICAL_CACHE_BUCKET_SECONDS = int(
+    os.getenv("HISTORICAL_CACHE_BUCKET_SECONDS", 60))
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Approximate size of a cached timestamp resolution: key, timestamp and resolution
+TIMESTAMP_ENTRY_SIZE = 2 * sys.getsizeof(EPOCH) + sys.getsizeof(())
+
+
+class LRUCache:
+    """Least recently used cache bounded by the approximate memory size of its values.
+
+    Sizes are given by the caller as values are stored, and the least recently used
+    values are evicted once the total size goes beyond the maximum.
+    """
+    max_bytes: int
+    size_bytes: int
+    values: OrderedDict[Hashable, tuple[Any, int]]
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of lookups that found a value, or 0 if there were no lookups."""
+        num_lookups = self.hits + self.misses
+        return self.hits / num_lookups if num_lookups > 0 else 0.0
+
+    def get(self, key: Hashable) -> Any | None:
+        """Gets a value and marks it as the most recently used.
+
+        Args:
+            key (Hashable): key of the value
+
+        Returns:
+            Any | None: the value or None, if it is not cached.
+        """
+        if (value_and_size := self.values.get(key)) is None:
+            self.misses += 1
+            return None
+        self.values.move_to_end(key)
+        self.hits += 1
+        return value_and_size[0]
+
+    def discard(self, key: Hashable) -> None:
+        """Removes a value, if it is cached."""
+        if (previous := self.values.pop(key, None)) is not None:
+            self.size_bytes -= previous[1]
+
+    def put(self, key: Hashable, value: Any, size_bytes: int) -> None:
+        """Stores a value as the most recently used, evicting the least recently used values to make room.
+        Values larger than the maximum size are not stored.
+
+        Args:
+            key (Hashable): key of the value
+            value (Any): value to store
+            size_bytes (int): approximate memory size of the value
+        """
+        if size_bytes > self.max_bytes:
+            return
+        if (previous := self.values.pop(key, None)) is not None:
+            self.size_bytes -= previous[1]
+        self.values[key] = (value, size_bytes)
+        self.size_bytes += size_bytes
+        while self.size_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.values.popitem(last=False)
+            self.size_bytes -= evicted_size
+            self.evictions += 1
+            HISTORICAL_CACHE_EVICTIONS.inc()
+
+
+class HistoricalCache:
+    """Cache of historical snapshots, which never change once they are written.
+
+    Two kinds of values share the same memory budget:
+    - the resolved snapshot timestamp and resolution, by bucket of the requested time, so that
+    queries for nearby times (e.g. "yesterday at midnight") share the same lookup
+    - the full ranked snapshot, by timestamp and resolution, along with the outputs rendered
+    for it, so that any limit can be served from it without serializing it again
+
+    Callers must only store the snapshot resolved for a bucket if it is the closest one for
+    every time in the bucket, and newer snapshots can't change that, see `is_final_resolution`.
+    """
+    bucket_seconds: int
+    lru: LRUCache
+
+    def __init__(self, max_bytes: int = int(HISTORICAL_CACHE_MAX_MB * 1024 * 1024),
+                 bucket_seconds: int = HISTORICAL_CACHE_BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.lru = LRUCache(max_bytes)
+        logging.debug(
+            f"HistoricalCache: Initialized with {max_bytes} bytes and buckets of {bucket_seconds} seconds")
+
+    def bucket(self, reference: datetime) -> datetime:
+        """Gets the start of the bucket of a requested time. Buckets are aligned to the epoch."""
+        bucket = timedelta(seconds=self.bucket_seconds)
+        return EPOCH + (reference - EPOCH) // bucket * bucket
+
+    def get_timestamp(self, bucket: datetime) -> tuple[datetime, Resolution] | None:
+        """Gets the snapshot timestamp and resolution resolved for a bucket of requested times, if cached."""
+        fetch_timestamp = self.lru.get(("timestamp", bucket))
+        HISTORICAL_CACHE_REQUESTS.inc(
+            "timestamp", "hit" if fetch_timestamp is not None else "miss")
+        return fetch_timestamp
+
+    def put_timestamp(self, bucket: datetime, fetch_timestamp: tuple[datetime, Resolution]) -> None:
+        """Stores the snapshot timestamp and resolution resolved for a bucket of requested times."""
+        self.lru.put(("timestamp", bucket), fetch_timestamp,
+                     TIMESTAMP_ENTRY_SIZE)
+
+    def discard_timestamp(self, bucket: datetime) -> None:
+        """Forgets the snapshot resolved for a bucket of requested times, e.g. once the snapshot is deleted."""
+        self.lru.discard(("timestamp", bucket))
+
+    def get_snapshot(self, timestamp: datetime, resolution: Resolution) -> Snapshot | None:
+        """Gets the full ranked snapshot with a timestamp and resolution, if cached.
+
+        Outputs are rendered for a snapshot on first use, so a snapshot is sized again
+        on lookup once outputs have been rendered for it since it was last sized.
+        """
+        cached_snapshot = self.lru.get(("snapshot", timestamp, resolution))
+        HISTORICAL_CACHE_REQUESTS.inc(
+            "snapshot", "hit" if cached_snapshot is not None else "miss")
+        if cached_snapshot is None:
+            return None
+        snapshot, num_rendered_outputs = cached_snapshot
+        if len(snapshot.rendered_outputs) != num_rendered_outputs:
+            self.put_snapshot(timestamp, resolution, snapshot)
+        return snapshot
+
+    def put_snapshot(self, timestamp: datetime, resolution: Resolution, snapshot: Snapshot) -> None:
+        """Stores a full ranked snapshot, sized by its entries and the outputs rendered for it."""
+        self.lru.put(("snapshot", timestamp, resolution), (snapshot, len(snapshot.rendered_outputs)),
+                     _snapshot_size(snapshot))
+
+    def is_final_resolution(self, reference: datetime, timestamp: datetime, now: datetime, margin_seconds: float) -> bool:
+        """Checks whether the snapshot resolved for a requested time stays the closest one as new snapshots come in.
+
+        New snapshots are taken at the current time, give or take a margin, so they can only be closer
+        to the requested time than the resolved snapshot at the edge of the newest search window.
+
+        Args:
+            reference (datetime): requested time
+            timestamp (datetime): timestamp of the resolved snapshot
+            now (datetime): current time
+            margin_seconds (float): margin for new snapshots taken slightly before the current time
+
+        Returns:
+            bool: whether the resolution is final.
+        """
+        earliest_new_timestamp = now - timedelta(seconds=margin_seconds)
+        return earliest_new_timestamp - reference > abs(timestamp - reference)
+
+
+def _snapshot_size(snapshot: Snapshot) -> int:
+    size_bytes = sys.getsizeof(snapshot) + _entries_size(snapshot.entries)
+    for rendered_output in snapshot.rendered_outputs.values():
+        size_bytes += sys.getsizeof(rendered_output.rows) + sys.getsizeof(rendered_output.row_ends)
+        # Offsets beyond the small integers shared by all are separate objects
+        size_bytes += len(rendered_output.row_ends) * sys.getsizeof(rendered_output.row_ends[-1])
+    return size_bytes
+
+
+def _entries_size(crypto_entries: list[CryptoEntry]) -> int:
+    # Timestamps are shared by the entries of a snapshot and small ranks are shared by all
+    size_bytes = sys.getsizeof(crypto_entries)
+    if len(crypto_entries) > 0:
+        size_bytes += sys.getsizeof(crypto_entries[0].timestamp)
+    for crypto_entry in crypto_entries:
+        size_bytes += sys.getsizeof(crypto_entry) + \
+            sys.getsizeof(crypto_entry.name) + \
+            sys.getsizeof(crypto_entry.value)
+    return size_bytes
@@ -0,0 +1,153 @@
+from dotenv import load_dotenv
+import os
+from app.models.models import CryptoEntry, OutputFormat, RenderedOutput, Snapshot
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+import array
+import asyncio
+import fcntl
+import mmap
+import orjson
+import struct
+import logging
+
+load_dotenv()
+
+SHARED_SNAPSHOT_PATH = os.getenv("SHARED_SNAPSHOT_PATH")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MAGIC = b"TCPLSNP2"
+# Magic, timestamp and fetch time as microseconds since the epoch and number of entries, padded to 8 bytes
+HEADER = struct.Struct("<8sqqI4x")
+ROW_END_TYPECODE = "I"
+
+
+class SharedSnapshot(Snapshot):
+    """Snapshot read from a shared snapshot store.
+
+    Its serialized outputs are views over the memory mapped store, and its entries
+    are only decoded from the JSON output if they are accessed.
+    """
+    decoded_entries: list[CryptoEntry] | None
+
+    def __init__(self, timestamp: datetime, fetched_at: datetime, rendered_outputs: dict[OutputFormat, RenderedOutput]):
+        self.timestamp = timestamp
+        self.fetched_at = fetched_at
+        self.rendered_outputs = rendered_outputs
+        self.decoded_entries = None
+
+    @property
+    def entries(self) -> list[CryptoEntry]:
+        if self.decoded_entries is None:
+            rendered_output = self.rendered_outputs[OutputFormat.JSON]
+            self.decoded_entries = [CryptoEntry(row["name"], row["value"], row["rank"], datetime.fromisoformat(row["timestamp"]))
+                                    for row in orjson.loads(rendered_output.top(len(rendered_output.row_ends)))]
+        return self.decoded_entries
+
+
+class SharedSnapshotStore:
+    """Latest snapshot of top coins, shared by all worker processes on a host through a memory mapped file.
+
+    The file holds the serialized outputs of the snapshot in every output format, so that workers
+    serve them straight from the shared pages, without deserializing or copying the snapshot:
+    - a header with the timestamp of the snapshot, when it was fetched and its number of entries
+    - for each output format, the end offsets of its rows (uint32)
+    - for each output format, its serialized rows
+
+    A new snapshot is written to a new file that atomically replaces the previous one, so that
+    readers holding views over a previous snapshot are never affected. Refreshes are serialized
+    across processes with a lock file: the worker holding the lock leads the refresh, and the
+    others find the refreshed snapshot once they get the lock.
+    """
+    path: str
+    lock_path: str
+    file_id: tuple[int, int] | None
+    snapshot: SharedSnapshot | None
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.file_id = None
+        self.snapshot = None
+
+    def read(self) -> SharedSnapshot | None:
+        """Reads the latest shared snapshot. The file is only mapped again once it has been replaced.
+
+        Returns:
+            SharedSnapshot | None: the latest shared snapshot or None, if no snapshot was shared yet.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if self.file_id == (stat.st_ino, stat.st_mtime_ns):
+            return self.snapshot
+
+        with open(self.path, "rb") as snapshot_file:
+            # The mapping outlives the file, and previous mappings live as long as views over them
+            mapping = mmap.mmap(snapshot_file.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        magic, key, fetched_key, num_entries = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            logging.warning(
+                f"SharedSnapshotStore: Ignored {self.path} with unknown format")
+            return None
+
+        row_ends_size = (num_entries + 1) * \
+            array.array(ROW_END_TYPECODE).itemsize
+        row_ends_offset = HEADER.size
+        rows_offset = HEADER.size + len(OutputFormat) * row_ends_size
+        rendered_outputs: dict[OutputFormat, RenderedOutput] = {}
+        for output_format in OutputFormat:
+            row_ends = view[row_ends_offset:row_ends_offset +
+                            row_ends_size].cast(ROW_END_TYPECODE)
+            rows = view[rows_offset:rows_offset + row_ends[-1]]
+            rendered_outputs[output_format] = RenderedOutput.from_rows(
+                output_format, rows, row_ends)
+            row_ends_offset += row_ends_size
+            rows_offset += len(rows)
+
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        self.snapshot = SharedSnapshot(EPOCH + timedelta(microseconds=key),
+                                       EPOCH + timedelta(microseconds=fetched_key), rendered_outputs)
+        logging.debug(
+            f"SharedSnapshotStore: Mapped snapshot with timestamp {self.snapshot.timestamp.isoformat()}")
+        return self.snapshot
+
+    def write(self, snapshot: Snapshot) -> None:
+        """Shares a snapshot with the other workers, replacing the latest shared snapshot.
+
+        Args:
+            snapshot (Snapshot): full ranked snapshot of crypto entries
+        """
+        if snapshot.timestamp is None or snapshot.fetched_at is None:
+            return
+        key = (snapshot.timestamp - EPOCH) // timedelta(microseconds=1)
+        fetched_key = (snapshot.fetched_at - EPOCH) // \
+            timedelta(microseconds=1)
+        rendered_outputs = [snapshot.rendered_output(output_format)
+                            for output_format in OutputFormat]
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(HEADER.pack(
+                MAGIC, key, fetched_key, len(snapshot.entries)))
+            for rendered_output in rendered_outputs:
+                snapshot_file.write(array.array(
+                    ROW_END_TYPECODE, rendered_output.row_ends).tobytes())
+            for rendered_output in rendered_outputs:
+                snapshot_file.write(rendered_output.rows)
+        os.replace(temporary_path, self.path)
+        logging.debug(
+            f"SharedSnapshotStore: Shared snapshot with timestamp {snapshot.timestamp.isoformat()}")
+
+    @asynccontextmanager
+    async def refresh_lock(self) -> AsyncIterator[None]:
+        """Holds the lock file that serializes refreshes across worker processes."""
+        with open(self.lock_path, "a") as lock_file:
+            await asyncio.to_thread(fcntl.flock, lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,65 @@
+from app.models.models import Snapshot
+from datetime import datetime
+
+
+class SnapshotCache:
+    """In-memory cache holding the latest snapshot of top coins.
+
+    The full ranked snapshot is kept once, along with its serialized outputs,
+    so that any limit can be served from it. Its freshness follows the latest fetch,
+    so that a snapshot of older data, served while a service is unavailable, is only
+    fetched again once per TTL.
+    """
+    ttl_seconds: int
+    snapshot: Snapshot | None
+    fetched_at: datetime | None
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.snapshot = None
+        self.fetched_at = None
+
+    @property
+    def timestamp(self) -> datetime | None:
+        """Timestamp of the cached snapshot, if any."""
+        return self.snapshot.timestamp if self.snapshot is not None else None
+
+    def publish(self, snapshot: Snapshot) -> None:
+        """Stores a snapshot, unless a newer one is already cached.
+
+        Args:
+            snapshot (Snapshot): full ranked snapshot of crypto entries
+        """
+        if snapshot.timestamp is None:
+            return
+        if self.timestamp is None or snapshot.timestamp >= self.timestamp:
+            self.snapshot = snapshot
+        # A later fetch keeps the cache fresh, even if the cached snapshot holds newer data
+        if self.fetched_at is None or snapshot.fetched_at > self.fetched_at:
+            self.fetched_at = snapshot.fetched_at
+
+    def get(self, now: datetime, max_age_seconds: float | None = None) -> Snapshot | None:
+        """Gets the cached snapshot if it was fetched recently enough.
+
+        Args:
+            now (datetime): current time
+            max_age_seconds (float, optional): maximum time since the snapshot was fetched. Defaults to the TTL of the cache.
+
+        Returns:
+            Snapshot | None: the cached snapshot or None, if there is no fresh snapshot.
+        """
+        if (fetched_at := self.fetched_at) is None:
+            return None
+        if max_age_seconds is None:
+            max_age_seconds = self.ttl_seconds
+        if (now - fetched_at).total_seconds() >= max_age_seconds:
+            return None
+        return self.snapshot
+
+    def latest(self) -> Snapshot | None:
+        """Gets the cached snapshot regardless of its age.
+
+        Returns:
+            Snapshot | None: the cached snapshot or None, if there is no snapshot.
+        """
+        return self.snapshot
@@ -0,0 +1,137 @@
+from dotenv import load_dotenv
+import os
+from app.db.storage import Storage
+from app.services.time_service import TimeService
+from app.models.models import CryptoEntry, Resolution, RollupEntry
+from app.logic.coin_resolver import SNAPSHOT_SIZE
+from datetime import datetime, timedelta, timezone
+import statistics
+import itertools
+import logging
+import asyncio
+
+load_dotenv()
+
+SNAPSHOT_COMPACTION_INTERVAL_SECONDS = os.getenv(
+    "SNAPSHOT_COMPACTION_INTERVAL_SECONDS")
+RAW_SNAPSHOT_RETENTION_DAYS = os.getenv("RAW_SNAPSHOT_RETENTION_DAYS")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def build_rollup(crypto_entries: list[CryptoEntry]) -> list[RollupEntry]:
+    """Aggregates the snapshots of a time bucket into a rollup.
+
+    The rollup holds the coins of the last snapshot in the bucket, with their last value and rank,
+    along with the minimum, maximum and mean values of each coin over all snapshots in the bucket.
+
+    Args:
+        crypto_entries (list[CryptoEntry]): entries of the snapshots in the bucket, sorted by timestamp and rank
+
+    Returns:
+        list[RollupEntry]: the rollup entries, sorted by rank.
+    """
+    if len(crypto_entries) == 0:
+        return []
+    last_timestamp = crypto_entries[-1].timestamp
+    values: dict[str, list[float]] = {}
+    for crypto_entry in crypto_entries:
+        values.setdefault(crypto_entry.name, []).append(crypto_entry.value)
+    return [RollupEntry(name=crypto_entry.name,
+                        value=crypto_entry.value,
+                        rank=crypto_entry.rank,
+                        timestamp=crypto_entry.timestamp,
+                        min_value=min(values[crypto_entry.name]),
+                        max_value=max(values[crypto_entry.name]),
+                        mean_value=statistics.fmean(values[crypto_entry.name]))
+            for crypto_entry in crypto_entries if crypto_entry.timestamp == last_timestamp]
+
+
+class SnapshotCompactor:
+    """Rolls up raw snapshots into hourly and daily snapshots and ages out raw snapshots.
+
+    Only complete buckets are rolled up, so that every rollup is built once. Raw snapshots
+    older than the retention period are deleted, as long as they are covered by daily rollups.
+    """
+    db: Storage
+    time_service: TimeService
+    retention_days: float | None
+    interval_seconds: float | None
+    task: asyncio.Task | None
+
+    def __init__(self, db: Storage, time_service: TimeService, retention_days: float | None = None):
+        self.db = db
+        self.time_service = time_service
+        self.retention_days = retention_days
+        self.interval_seconds = None
+        self.task = None
+
+    def start(self, interval_seconds: float) -> None:
+        """Starts compacting snapshots in the background.
+
+        Args:
+            interval_seconds (float): number of seconds between compactions
+        """
+        self.interval_seconds = interval_seconds
+        self.task = asyncio.create_task(self._run())
+        logging.debug(
+            f"SnapshotCompactor: Started compacting every {interval_seconds} seconds")
+
+    async def stop(self) -> None:
+        """Stops compacting snapshots and waits for the background task to finish."""
+        if (task := self.task) is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        logging.debug("SnapshotCompactor: Stopped")
+
+    async def compact(self) -> None:
+        """Rolls up the complete buckets that are not rolled up yet and applies the retention period."""
+        now = self.time_service.now()
+        for resolution in Resolution:
+            if resolution != Resolution.RAW:
+                await self._roll_up(resolution, now)
+        if self.retention_days is not None:
+            await self._delete_expired_snapshots(now)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.compact()
+            except Exception:
+                logging.exception("SnapshotCompactor: Compaction failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def _roll_up(self, resolution: Resolution, now: datetime) -> None:
+        # Resume after the bucket of the latest rollup, up to the current incomplete bucket
+        end = self._bucket_start(now, resolution)
+        start = EPOCH
+        if (latest_timestamp := await self.db.get_latest_timestamp(resolution)) is not None:
+            start = self._bucket_start(latest_timestamp, resolution) + \
+                timedelta(seconds=resolution.bucket_seconds)
+        if start >= end:
+            return
+
+        timestamps = [timestamp for timestamp in await self.db.get_timestamps_between(start, end) if timestamp < end]
+        num_rollups = 0
+        for _, bucket_timestamps in itertools.groupby(timestamps, key=lambda t: self._bucket_start(t, resolution)):
+            crypto_entries = await self.db.get_historical_data_for_timestamps(SNAPSHOT_SIZE, list(bucket_timestamps))
+            await self.db.insert_rollup(resolution, build_rollup(crypto_entries))
+            num_rollups += 1
+        logging.info(
+            f"SnapshotCompactor: Built {num_rollups} {resolution.value} rollups of {len(timestamps)} snapshots")
+
+    async def _delete_expired_snapshots(self, now: datetime) -> None:
+        # Keep raw snapshots that are not covered by daily rollups yet
+        if (latest_timestamp := await self.db.get_latest_timestamp(Resolution.DAILY)) is None:
+            return
+        rolled_up_until = self._bucket_start(latest_timestamp, Resolution.DAILY) + \
+            timedelta(seconds=Resolution.DAILY.bucket_seconds)
+        await self.db.delete_snapshots_before(min(now - timedelta(days=self.retention_days), rolled_up_until))
+
+    def _bucket_start(self, timestamp: datetime, resolution: Resolution) -> datetime:
+        bucket = timedelta(seconds=resolution.bucket_seconds)
+        return EPOCH + (timestamp - EPOCH) // bucket * bucket
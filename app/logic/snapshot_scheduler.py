@@ -0,0 +1,77 @@
+from dotenv import load_dotenv
+import os
+from app.logic.coin_resolver import CoinResolver
+import logging
+import asyncio
+import random
+
+load_dotenv()
+
+SNAPSHOT_REFRESH_INTERVAL_SECONDS = os.getenv(
+    "SNAPSHOT_REFRESH_INTERVAL_SECONDS")
+SNAPSHOT_REFRESH_JITTER_SECONDS = float(
+    os.getenv("SNAPSHOT_REFRESH_JITTER_SECONDS", "5"))
+SNAPSHOT_REFRESH_MAX_BACKOFF_SECONDS = float(
+    os.getenv("SNAPSHOT_REFRESH_MAX_BACKOFF_SECONDS", "300"))
+
+
+class SnapshotScheduler:
+    """Refreshes the latest snapshot of top coins in the background on a fixed cadence.
+
+    While the scheduler runs, the coin resolver serves current queries from the latest
+    snapshot, so that they don't wait for the external API services.
+    """
+    coin_resolver: CoinResolver
+    interval_seconds: float
+    jitter_seconds: float
+    max_backoff_seconds: float
+    num_consecutive_failures: int
+    task: asyncio.Task | None
+
+    def __init__(self, coin_resolver: CoinResolver, interval_seconds: float,
+                 jitter_seconds: float = SNAPSHOT_REFRESH_JITTER_SECONDS,
+                 max_backoff_seconds: float = SNAPSHOT_REFRESH_MAX_BACKOFF_SECONDS):
+        self.coin_resolver = coin_resolver
+        self.interval_seconds = interval_seconds
+        self.jitter_seconds = jitter_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.num_consecutive_failures = 0
+        self.task = None
+
+    def start(self) -> None:
+        """Starts refreshing snapshots in the background."""
+        self.coin_resolver.scheduled_refresh = True
+        self.task = asyncio.create_task(self._run())
+        logging.debug(
+            f"SnapshotScheduler: Started refreshing every {self.interval_seconds} seconds")
+
+    async def stop(self) -> None:
+        """Stops refreshing snapshots and waits for the background task to finish."""
+        self.coin_resolver.scheduled_refresh = False
+        if (task := self.task) is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        logging.debug("SnapshotScheduler: Stopped")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.coin_resolver.refresh()
+                self.num_consecutive_failures = 0
+            except Exception:
+                self.num_consecutive_failures += 1
+                logging.exception(
+                    f"SnapshotScheduler: Refresh failed {self.num_consecutive_failures} time(s) in a row")
+            await asyncio.sleep(self._next_delay())
+
+    def _next_delay(self) -> float:
+        # Back off exponentially on consecutive failures, up to the maximum backoff
+        delay = self.interval_seconds
+        if self.num_consecutive_failures > 0:
+            delay = min(self.interval_seconds * 2 ** (self.num_consecutive_failures - 1),
+                        max(self.interval_seconds, self.max_backoff_seconds))
+        return delay + random.uniform(0, self.jitter_seconds)
@@ -0,0 +1,112 @@
+from dotenv import load_dotenv
+import os
+import json
+import tempfile
+import logging
+
+load_dotenv()
+
+SYMBOL_TABLE_PATH = os.getenv("SYMBOL_TABLE_PATH", "symbol_table.json")
+
+
+class SymbolTable:
+    """Table resolving the coins of the top list to the symbols of the price listings.
+
+    A coin is resolved to the symbol under which it is listed with a price: first by its own symbol,
+    which always takes precedence, then by the known aliases, and then by the names of the listings.
+    Names are learnt incrementally as listings are seen, and later listings correct them. The table
+    is persisted as JSON, so that known aliases can be added by hand and mismatches can be inspected:
+    the coins of the top list that could not be matched in the latest merge are stored along with it.
+    Aliases are only ever added by hand, so that they stick across listings.
+    """
+    path: str | None
+    aliases: dict[str, str]
+    names: dict[str, str]
+    unmatched: dict[str, str]
+    is_modified: bool
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.aliases = {}
+        self.names = {}
+        self.unmatched = {}
+        self.is_modified = False
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as table_file:
+                table = json.load(table_file)
+            self.aliases = table.get("aliases", {})
+            self.names = table.get("names", {})
+            self.unmatched = table.get("unmatched", {})
+
+    def update(self, coin_listings: list[tuple[str, str, float]]) -> None:
+        """Learns the names of price listings, replacing the symbols of names that were listed
+        under another symbol. Within the listings, the first one listed under a name wins.
+
+        Args:
+            coin_listings (list[tuple[str, str, float]]): listings of symbol, name and price
+        """
+        names: dict[str, str] = {}
+        for symbol, name, _ in coin_listings:
+            names.setdefault(name, symbol)
+        for name, symbol in names.items():
+            if self.names.get(name) != symbol:
+                self.names[name] = symbol
+                self.is_modified = True
+
+    def merge(self, coin_listings: list[tuple[str, str, float]], top_crypto: list[tuple[str, str]]) -> list[tuple[str, float]]:
+        """Matches the coins of the top list with their prices, first by symbol and then by name.
+
+        Args:
+            coin_listings (list[tuple[str, str, float]]): listings of symbol, name and price
+            top_crypto (list[tuple[str, str]]): top list of symbol and name, sorted by rank
+
+        Returns:
+            list[tuple[str, float]]: symbol and price of the matched coins, sorted by rank.
+        """
+        self.update(coin_listings)
+        prices: dict[str, float] = {}
+        for symbol, _, price in coin_listings:
+            prices.setdefault(symbol, price)
+        matched: list[tuple[str, float]] = []
+        unmatched: dict[str, str] = {}
+        for symbol, name in top_crypto:
+            if (price := prices.get(self._resolve(symbol, prices))) is None:
+                price = prices.get(self._resolve(name, prices))
+            if price is not None:
+                matched.append((symbol, float(price)))
+            else:
+                unmatched[symbol] = name
+
+        if unmatched != self.unmatched:
+            self.unmatched = unmatched
+            self.is_modified = True
+        if len(unmatched) > 0:
+            logging.info(
+                f"SymbolTable: could not find prices for {len(unmatched)} coins: {', '.join(unmatched)}")
+        return matched
+
+    def save(self) -> None:
+        """Persists the table, if it was modified since it was loaded or last saved."""
+        if self.path is None or not self.is_modified:
+            return
+        # Workers sharing the table each write their own temporary file
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(os.path.abspath(self.path)),
+                                         prefix=os.path.basename(self.path), suffix=".tmp", delete=False) as table_file:
+            json.dump({"aliases": self.aliases, "names": self.names, "unmatched": self.unmatched},
+                      table_file, indent=2, sort_keys=True)
+        try:
+            os.replace(table_file.name, self.path)
+        except OSError:
+            os.unlink(table_file.name)
+            raise
+        self.is_modified = False
+        logging.debug(
+            f"SymbolTable: saved {len(self.names)} names and {len(self.aliases)} aliases to {self.path}")
+
+    def _resolve(self, alias: str, prices: dict[str, float]) -> str | None:
+        # The symbol of a listing takes precedence over aliases and names
+        if alias in prices:
+            return alias
+        if (symbol := self.aliases.get(alias)) is not None:
+            return symbol
+        return self.names.get(alias)
@@ -1,32 +1,105 @@
+from dotenv import load_dotenv
+import os
 from fastapi import FastAPI
 from app.api.routes import router
+from app.db.storage import Storage
 from app.db.database import Database
-from app.services.coin_market_cap import CoinMarketCap
-from app.services.crypto_compare import CryptoCompare
+from app.db.sqlite_database import SQLiteDatabase
+from app.db.snapshot_archive import ArchiveBackedStorage, SnapshotArchive, SNAPSHOT_ARCHIVE_PATH
+from app.db.indexed_storage import IndexedStorage
+from app.services.coin_market_cap import CoinMarketCap, COIN_MARKET_CAP_HOST
+from app.services.crypto_compare import CryptoCompare, CRYPTO_COMPARE_HOST
+from app.services.http_client import create_http_client
 from app.services.time_service import TimeService
-from app.logic.coin_resolver import CoinResolver
+from app.logic.coin_resolver import CoinResolver, SNAPSHOT_MAX_STALENESS_SECONDS
+from app.logic.snapshot_scheduler import SnapshotScheduler, SNAPSHOT_REFRESH_INTERVAL_SECONDS
+from app.logic.symbol_table import SymbolTable, SYMBOL_TABLE_PATH
+from app.logic.historical_cache import HistoricalCache
+from app.logic.shared_snapshot_store import SharedSnapshotStore, SHARED_SNAPSHOT_PATH
+from app.logic.snapshot_compactor import SnapshotCompactor, SNAPSHOT_COMPACTION_INTERVAL_SECONDS, RAW_SNAPSHOT_RETENTION_DAYS
 import uvicorn
+import logging
+import sys
+
+load_dotenv()
+
+DB_BACKEND = os.getenv("DB_BACKEND", "mongo")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+logging.basicConfig(level=LOG_LEVEL.upper(),
+                    format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
 
 app = FastAPI()
 app.include_router(router)
 
 
+def create_storage(backend: str) -> Storage:
+    """Creates the storage for historical coin data.
+
+    Args:
+        backend (str): either "mongo" for the MongoDB database or "sqlite" for an embedded local database
+
+    Raises:
+        ValueError: If the backend is not supported.
+
+    Returns:
+        Storage: the storage, still to be initialized.
+    """
+    if backend.lower() == "mongo":
+        return Database()
+    elif backend.lower() == "sqlite":
+        return SQLiteDatabase()
+    raise ValueError(f"Unsupported database backend: {backend}")
+
+
 @app.on_event("startup")
-def startup_db_client():
+async def startup_db_client():
     """Startup of app resources"""
-    db = Database()
-    coin_market_cap = CoinMarketCap()
-    crypto_compare = CryptoCompare()
+    http_client = create_http_client(
+        [COIN_MARKET_CAP_HOST, CRYPTO_COMPARE_HOST])
     time_service = TimeService()
+    db = create_storage(DB_BACKEND)
+    if SNAPSHOT_ARCHIVE_PATH is not None:
+        db = ArchiveBackedStorage(db, SnapshotArchive(SNAPSHOT_ARCHIVE_PATH))
+    db = IndexedStorage(db, time_service)
+    await db.initialize()
+    coin_market_cap = CoinMarketCap(http_client)
+    crypto_compare = CryptoCompare(http_client)
+    max_staleness_seconds = float(
+        SNAPSHOT_MAX_STALENESS_SECONDS) if SNAPSHOT_MAX_STALENESS_SECONDS is not None else None
+    shared_snapshot_store = SharedSnapshotStore(
+        SHARED_SNAPSHOT_PATH) if SHARED_SNAPSHOT_PATH is not None else None
     app.coin_resolver = CoinResolver(
-        db, coin_market_cap, crypto_compare, time_service)
+        db, coin_market_cap, crypto_compare, time_service, max_staleness_seconds, SymbolTable(SYMBOL_TABLE_PATH), HistoricalCache(),
+        shared_snapshot_store)
     app.time_service = time_service
+    app.http_client = http_client
+
+    app.snapshot_scheduler = None
+    if SNAPSHOT_REFRESH_INTERVAL_SECONDS is not None:
+        app.snapshot_scheduler = SnapshotScheduler(
+            app.coin_resolver, float(SNAPSHOT_REFRESH_INTERVAL_SECONDS))
+        app.snapshot_scheduler.start()
+
+    app.snapshot_compactor = None
+    if SNAPSHOT_COMPACTION_INTERVAL_SECONDS is not None:
+        retention_days = float(
+            RAW_SNAPSHOT_RETENTION_DAYS) if RAW_SNAPSHOT_RETENTION_DAYS is not None else None
+        app.snapshot_compactor = SnapshotCompactor(
+            db, time_service, retention_days)
+        app.snapshot_compactor.start(
+            float(SNAPSHOT_COMPACTION_INTERVAL_SECONDS))
 
 
 @app.on_event("shutdown")
-def shutdown_db_client():
+async def shutdown_db_client():
     """Tear down of app resources"""
-    app.coin_resolver.close()
+    if app.snapshot_scheduler is not None:
+        await app.snapshot_scheduler.stop()
+    if app.snapshot_compactor is not None:
+        await app.snapshot_compactor.stop()
+    await app.coin_resolver.close()
+    await app.http_client.aclose()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,8 @@
 class UnavailableTime(Exception):
     """An exception representing a time for which there is no available record."""
     pass
+
+
+class UpstreamUnavailable(Exception):
+    """An exception representing an external API service that is unavailable, with no recent response to fall back to."""
+    pass
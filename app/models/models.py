@@ -1,25 +1,42 @@
-from pydantic import BaseModel, model_serializer
 from enum import Enum
 from datetime import datetime
-import json
-from typing import Any
+import orjson
+from typing import Any, AsyncIterator
 
 
-class CryptoEntry(BaseModel):
+class CryptoEntry:
     """A model to represent a crypto entry.
 
+    Entries are created for every coin fetched from the external services and read from the
+    database, so they are plain slotted objects without validation.
+
     Fields:
         name: The name of the crypto.
         value: The value of the crypto in USD.
         rank: The rank of the crypto, starting with 1 for the top coin.
         timestamp: The timestamp corresponding to the value sampled.
     """
+    __slots__ = ("name", "value", "rank", "timestamp")
     name: str
     value: float
     rank: int
     timestamp: datetime
 
-    @model_serializer
+    def __init__(self, name: str, value: float, rank: int, timestamp: datetime):
+        self.name = name
+        self.value = value
+        self.rank = rank
+        self.timestamp = timestamp
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CryptoEntry):
+            return NotImplemented
+        return (self.name, self.value, self.rank, self.timestamp) == \
+            (other.name, other.value, other.rank, other.timestamp)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(name={self.name!r}, value={self.value!r}, rank={self.rank!r}, timestamp={self.timestamp!r})"
+
     def serialize(self) -> dict[str, Any]:
         return {
             "name": self.name,
@@ -29,20 +46,242 @@ class CryptoEntry(BaseModel):
         }
 
 
+class RollupEntry(CryptoEntry):
+    """A model to represent a crypto entry aggregated over a time bucket.
+
+    The value, rank and timestamp are those of the last snapshot in the bucket.
+
+    Fields:
+        min_value: The minimum value of the crypto in USD within the bucket.
+        max_value: The maximum value of the crypto in USD within the bucket.
+        mean_value: The mean value of the crypto in USD within the bucket.
+    """
+    __slots__ = ("min_value", "max_value", "mean_value")
+    min_value: float
+    max_value: float
+    mean_value: float
+
+    def __init__(self, name: str, value: float, rank: int, timestamp: datetime,
+                 min_value: float, max_value: float, mean_value: float):
+        super().__init__(name, value, rank, timestamp)
+        self.min_value = min_value
+        self.max_value = max_value
+        self.mean_value = mean_value
+
+
+class Resolution(Enum):
+    """Resolution of stored snapshots.
+
+    Raw snapshots are stored as they are taken. Hourly and daily snapshots are rollups
+    of the raw snapshots in each hour or day.
+    """
+    RAW = "raw"
+    HOURLY = "hourly"
+    DAILY = "daily"
+
+    @property
+    def bucket_seconds(self) -> int:
+        if self == Resolution.HOURLY:
+            return 60 * 60
+        elif self == Resolution.DAILY:
+            return 60 * 60 * 24
+        else:
+            return 0
+
+
+class ResolvedSnapshot:
+    """Stored snapshot resolved for a requested time, before its entries are fetched.
+
+    A resolution is final once newer snapshots can't be closer to the requested time,
+    so that the response for that time never changes. Snapshots resolved from memory,
+    e.g. current snapshots, are held along with their resolution.
+    """
+    __slots__ = ("timestamp", "resolution", "is_final", "snapshot")
+
+    timestamp: datetime
+    resolution: Resolution
+    is_final: bool
+    snapshot: "Snapshot | None"
+
+    def __init__(self, timestamp: datetime, resolution: Resolution, is_final: bool, snapshot: "Snapshot | None" = None):
+        self.timestamp = timestamp
+        self.resolution = resolution
+        self.is_final = is_final
+        self.snapshot = snapshot
+
+
 class OutputFormat(Enum):
     """Output format for the crypto entries.
 
-    It can be either JSON or CSV.
+    It can be either JSON, CSV or NDJSON (newline-delimited JSON, one entry per line).
     """
     JSON = "JSON"
     CSV = "CSV"
+    NDJSON = "NDJSON"
+
+    @property
+    def media_type(self) -> str:
+        if self == OutputFormat.JSON:
+            return "application/json"
+        elif self == OutputFormat.NDJSON:
+            return "application/x-ndjson"
+        else:
+            return "text/plain; charset=utf-8"
+
+    @property
+    def prefix(self) -> bytes:
+        if self == OutputFormat.JSON:
+            return b"["
+        elif self == OutputFormat.NDJSON:
+            return b""
+        else:
+            return b"rank,symbol,price_USD,timestamp\n"
+
+    @property
+    def separator(self) -> bytes:
+        if self == OutputFormat.JSON:
+            return b","
+        else:
+            return b""
+
+    @property
+    def suffix(self) -> bytes:
+        if self == OutputFormat.JSON:
+            return b"]"
+        else:
+            return b""
 
-    def output(self, crypto_entries: list[CryptoEntry]) -> Any:
+    def render_row(self, crypto_entry: CryptoEntry) -> bytes:
         if self == OutputFormat.JSON:
-            return list(map(lambda x: x.model_dump(mode="json"), crypto_entries))
+            return orjson.dumps(crypto_entry.serialize())
+        elif self == OutputFormat.NDJSON:
+            return orjson.dumps(crypto_entry.serialize(), option=orjson.OPT_APPEND_NEWLINE)
         else:
-            output = "rank,symbol,price_USD,timestamp\n"
-            for crypto_entry in crypto_entries:
-                timestamp = crypto_entry.timestamp.isoformat()
-                output += f"{crypto_entry.rank},{crypto_entry.name},{crypto_entry.value},{timestamp}\n"
-            return output
+            timestamp = crypto_entry.timestamp.isoformat()
+            return f"{crypto_entry.rank},{crypto_entry.name},{crypto_entry.value},{timestamp}\n".encode()
+
+    def output(self, crypto_entries: list[CryptoEntry]) -> bytes:
+        rows = self.separator.join(map(self.render_row, crypto_entries))
+        return self.prefix + rows + self.suffix
+
+    async def stream(self, batches: AsyncIterator[list[CryptoEntry]]) -> AsyncIterator[bytes]:
+        """Serializes batches of crypto entries as they arrive, one chunk of output per batch.
+
+        Args:
+            batches (AsyncIterator[list[CryptoEntry]]): batches of crypto entries
+
+        Returns:
+            AsyncIterator[bytes]: chunks of serialized output.
+        """
+        yield self.prefix
+        is_first_row = True
+        async for batch in batches:
+            if len(batch) == 0:
+                continue
+            rows = self.separator.join(map(self.render_row, batch))
+            yield rows if is_first_row else self.separator + rows
+            is_first_row = False
+        yield self.suffix
+
+
+class RenderedOutput:
+    """Crypto entries serialized in an output format, which can be sliced
+    to the top entries without serializing them again.
+    """
+    output_format: OutputFormat
+    rows: bytes | memoryview
+    row_ends: list[int] | memoryview
+
+    def __init__(self, output_format: OutputFormat, crypto_entries: list[CryptoEntry]):
+        self.output_format = output_format
+        self.row_ends = [0]
+        rendered_rows: list[bytes] = []
+        end = 0
+        for crypto_entry in crypto_entries:
+            row = output_format.render_row(crypto_entry)
+            if len(rendered_rows) > 0:
+                rendered_rows.append(output_format.separator)
+                end += len(output_format.separator)
+            rendered_rows.append(row)
+            end += len(row)
+            self.row_ends.append(end)
+        self.rows = b"".join(rendered_rows)
+
+    @classmethod
+    def from_rows(cls, output_format: OutputFormat, rows: bytes | memoryview, row_ends: list[int] | memoryview) -> "RenderedOutput":
+        """Creates a rendered output from rows that were already serialized, e.g. views over shared memory.
+
+        Args:
+            output_format (OutputFormat): output format of the rows
+            rows (bytes | memoryview): serialized rows, joined by the separator of the output format
+            row_ends (list[int] | memoryview): end offset of the rows, starting with 0
+
+        Returns:
+            RenderedOutput: the rendered output, without copying the rows.
+        """
+        rendered_output = cls.__new__(cls)
+        rendered_output.output_format = output_format
+        rendered_output.rows = rows
+        rendered_output.row_ends = row_ends
+        return rendered_output
+
+    def top(self, limit: int) -> bytes:
+        """Gets the output for the top entries.
+
+        Args:
+            limit (int): maximum number of entries to output, sorted by rank
+
+        Returns:
+            bytes: the serialized output.
+        """
+        end = self.row_ends[min(limit, len(self.row_ends) - 1)]
+        return self.output_format.prefix + self.rows[0:end] + self.output_format.suffix
+
+
+class Snapshot:
+    """A snapshot of top crypto entries sharing the same timestamp, sorted by rank.
+
+    The serialized outputs of a snapshot are rendered once and sliced for each limit.
+    A snapshot built from the last good data of an unavailable service is timestamped
+    with the age of its data, and `fetched_at` keeps when it was fetched.
+    """
+    timestamp: datetime | None
+    fetched_at: datetime | None
+    entries: list[CryptoEntry]
+    rendered_outputs: dict[OutputFormat, RenderedOutput]
+
+    def __init__(self, entries: list[CryptoEntry], fetched_at: datetime | None = None):
+        self.timestamp = entries[0].timestamp if len(entries) > 0 else None
+        self.fetched_at = fetched_at if fetched_at is not None else self.timestamp
+        self.entries = entries
+        self.rendered_outputs = {}
+
+    def top(self, limit: int) -> list[CryptoEntry]:
+        """Gets the top entries of the snapshot.
+
+        Args:
+            limit (int): maximum number of entries to return, sorted by rank
+
+        Returns:
+            list[CryptoEntry]: the top crypto entries.
+        """
+        return self.entries[0:limit]
+
+    def render(self, output_format: OutputFormat, limit: int) -> bytes:
+        """Gets the serialized output for the top entries of the snapshot.
+
+        Args:
+            output_format (OutputFormat): output format
+            limit (int): maximum number of entries to output, sorted by rank
+
+        Returns:
+            bytes: the serialized output.
+        """
+        return self.rendered_output(output_format).top(limit)
+
+    def rendered_output(self, output_format: OutputFormat) -> RenderedOutput:
+        """Gets the serialized output for all entries of the snapshot, rendering it on first use."""
+        if (rendered_output := self.rendered_outputs.get(output_format)) is None:
+            rendered_output = RenderedOutput(output_format, self.entries)
+            self.rendered_outputs[output_format] = rendered_output
+        return rendered_output
@@ -1,6 +1,8 @@
 from dotenv import load_dotenv
 import os
-import requests
+import httpx
+from app.services.metrics import UPSTREAM_REQUEST_SECONDS
+from app.services.resilience import ResilientProvider
 from typing import Any, cast
 import logging
 import time
@@ -8,32 +10,41 @@ import asyncio
 
 load_dotenv()
 
-COIN_MARKET_CAP_API_KEY = os.getenv("COIN_MARKET_CAP_API_KEY")
+COIN_MARKET_CAP_API_KEY = os.getenv("COIN_MARKET_CAP_API_KEY", "")
+COIN_MARKET_CAP_HOST = "https://pro-api.coinmarketcap.com"
 
 
 class CoinMarketCap:
     """API external service from CoinMarketCap"""
+    client: httpx.AsyncClient
     host: str
     headers: dict[str, Any]
+    resilience: ResilientProvider
 
-    def __init__(self):
-        self.host = "https://pro-api.coinmarketcap.com/v1/"
+    def __init__(self, client: httpx.AsyncClient, resilience: ResilientProvider | None = None):
+        self.client = client
+        self.resilience = resilience if resilience is not None else ResilientProvider("coinmarketcap")
+        self.host = COIN_MARKET_CAP_HOST + "/v1/"
         self.headers = {
             "Accept": "application/json",
             "X-CMC_PRO_API_KEY": COIN_MARKET_CAP_API_KEY
         }
 
-    async def get_coin_prices(self) -> dict[str, float]:
+    async def get_coin_listings(self) -> tuple[list[tuple[str, str, float]], float]:
         """Gets the current price of the top 500 coins by market volume in the last 24 hours.
 
-        In order to increase chances of a match with external data, we record each coin by
-        the symbol name and the full name.
+        In order to increase chances of a match with external data, each coin is listed with
+        its symbol name and its full name.
 
         Returns:
-            dict[str, float]: A dictionary of coin names and their prices in USD.
-            For example: {"BTC": 29434.824505477198, "Bitcoin": 29434.824505477198,  
-            "ETH": 1851.0382543598475, "Ethereum": 1851.0382543598475, ...}
+            tuple[list[tuple[str, str, float]], float]: List of tuples of coin symbol name, full name and price in USD.
+            For example: [("BTC", "Bitcoin", 29434.824505477198), ("ETH", "Ethereum", 1851.0382543598475), ...]
+            Along with the age of the listings in seconds, which is 0 unless the last good listings are returned
+            while the service is unavailable.
         """
+        return await self.resilience.call(self._get_coin_listings)
+
+    async def _get_coin_listings(self) -> list[tuple[str, str, float]]:
         url = self.host + "cryptocurrency/listings/latest"
         url_params: dict[str, Any] = {
             "limit": 500,
@@ -42,20 +53,16 @@ class CoinMarketCap:
         }
         logging.debug(
             f"CoinMarketCap: starting request at {time.strftime('%X')}")
-        response = requests.get(url, headers=self.headers, params=url_params)
+        with UPSTREAM_REQUEST_SECONDS.time("coinmarketcap"):
+            response = await self.client.get(url, headers=self.headers, params=url_params)
+        response.raise_for_status()
         data = response.json()["data"]
-        coin_prices: dict[str, float] = {}
-        for item in data:
-            # Add relation by symbol
-            name = item["symbol"]
-            value = item["quote"]["USD"]["price"]
-            coin_prices[name] = value
-
-            # Add relation by name
-            name = item["name"]
-            coin_prices[name] = value
+        coin_listings = list(map(
+            lambda x: (x["symbol"], x["name"], x["quote"]["USD"]["price"]),
+            data
+        ))
 
         logging.debug(
-            f"CoinMarketCap: Got following coin prices: \n{coin_prices}")
+            "CoinMarketCap: Got %d coin listings", len(coin_listings))
 
-        return coin_prices
+        return coin_listings
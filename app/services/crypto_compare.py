@@ -1,6 +1,8 @@
 from dotenv import load_dotenv
 import os
-import requests
+import httpx
+from app.services.metrics import UPSTREAM_REQUEST_SECONDS
+from app.services.resilience import ResilientProvider
 from typing import Any, cast
 import logging
 import time
@@ -8,28 +10,38 @@ import asyncio
 
 load_dotenv()
 
-CRYPTO_COMPARE_API_KEY = os.getenv("CRYPTO_COMPARE_API_KEY")
+CRYPTO_COMPARE_API_KEY = os.getenv("CRYPTO_COMPARE_API_KEY", "")
+CRYPTO_COMPARE_HOST = "https://min-api.cryptocompare.com"
 
 
 class CryptoCompare:
     """API external service for CryptoCompare"""
+    client: httpx.AsyncClient
     host: str
     headers: dict[str, Any]
+    resilience: ResilientProvider
 
-    def __init__(self):
-        self.host = "https://min-api.cryptocompare.com/"
+    def __init__(self, client: httpx.AsyncClient, resilience: ResilientProvider | None = None):
+        self.client = client
+        self.resilience = resilience if resilience is not None else ResilientProvider("cryptocompare")
+        self.host = CRYPTO_COMPARE_HOST + "/"
         self.headers = {
             "Accept": "application/json",
             "Authorization": "Apikey {}".format(CRYPTO_COMPARE_API_KEY)
         }
 
-    async def get_top_crypto_list(self) -> list[tuple[str, str]]:
+    async def get_top_crypto_list(self) -> tuple[list[tuple[str, str]], float]:
         """Gets symbol name and full name of the top 100 crypto currencies sorted by market volume in the last 24 hours.
 
         Returns:
-            list[tuple[str, str]]: List of tuples of crypto currency symbol name and full name.
+            tuple[list[tuple[str, str]], float]: List of tuples of crypto currency symbol name and full name.
             For example: [("BTC", "Bitcoin"), ("ETH", "Ethereum"), ...]
+            Along with the age of the list in seconds, which is 0 unless the last good list is returned
+            while the service is unavailable.
         """
+        return await self.resilience.call(self._get_top_crypto_list)
+
+    async def _get_top_crypto_list(self) -> list[tuple[str, str]]:
         url = self.host + "data/top/totalvolfull"
         url_params: dict[str, Any] = {
             "limit": 100,
@@ -37,7 +49,9 @@ class CryptoCompare:
         }
         logging.debug(
             f"CryptoCompare: starting request at {time.strftime('%X')}")
-        response = requests.get(url, headers=self.headers, params=url_params)
+        with UPSTREAM_REQUEST_SECONDS.time("cryptocompare"):
+            response = await self.client.get(url, headers=self.headers, params=url_params)
+        response.raise_for_status()
         data = response.json()["Data"]
         top_crypto = list(map(
             lambda x: (x["CoinInfo"]["Name"], x["CoinInfo"]["FullName"]),
@@ -45,6 +59,6 @@ class CryptoCompare:
         ))
 
         logging.debug(
-            f"CryptoCompare: Got following top coins: \n{top_crypto}")
+            "CryptoCompare: Got %d top coins", len(top_crypto))
 
         return top_crypto
@@ -0,0 +1,40 @@
+from dotenv import load_dotenv
+import os
+import httpx
+
+load_dotenv()
+
+HTTP_MAX_CONNECTIONS_PER_HOST = int(
+    os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS_PER_HOST = int(
+    os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS_PER_HOST", "5"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(
+    os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(
+    os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+
+
+def create_http_client(hosts: list[str]) -> httpx.AsyncClient:
+    """Creates the async HTTP client shared by the external API services.
+
+    Each host is mounted on its own transport, so that every external service
+    gets a dedicated pool of keep-alive connections bounded by the per-host limits.
+
+    Args:
+        hosts (list[str]): base URLs of the hosts to pool connections for, e.g. "https://min-api.cryptocompare.com"
+
+    Returns:
+        httpx.AsyncClient: the client, which must be closed with `aclose` on shutdown.
+    """
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS_PER_HOST,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+    )
+    timeout = httpx.Timeout(HTTP_TIMEOUT_SECONDS,
+                            connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+    mounts: dict[str, httpx.AsyncBaseTransport] = {
+        host: httpx.AsyncHTTPTransport(limits=limits) for host in hosts
+    }
+    return httpx.AsyncClient(timeout=timeout, limits=limits, mounts=mounts)
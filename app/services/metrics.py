@@ -0,0 +1,186 @@
+from contextlib import contextmanager
+from typing import Iterator
+import bisect
+import time
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SNAPSHOT_AGE_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0,
+                        120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+class Counter:
+    """Counter of events by label values, in the Prometheus exposition format."""
+    name: str
+    description: str
+    label_names: tuple[str, ...]
+    values: dict[tuple[str, ...], float]
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Increments the counter for the given label values."""
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(
+                f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+
+class Gauge:
+    """Gauge of a value that goes up and down, in the Prometheus exposition format."""
+    name: str
+    description: str
+    value: float
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def set(self, value: float) -> None:
+        """Sets the value of the gauge."""
+        self.value = value
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.description}",
+                f"# TYPE {self.name} gauge",
+                f"{self.name} {_number(self.value)}"]
+
+
+class Histogram:
+    """Histogram of observed values by label values, in the Prometheus exposition format."""
+    name: str
+    description: str
+    label_names: tuple[str, ...]
+    buckets: tuple[float, ...]
+    bucket_counts: dict[tuple[str, ...], list[int]]
+    sums: dict[tuple[str, ...], float]
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.bucket_counts = {}
+        self.sums = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Records a value for the given label values."""
+        if (bucket_counts := self.bucket_counts.get(label_values)) is None:
+            # The last count is for the implicit +Inf bucket
+            bucket_counts = [0] * (len(self.buckets) + 1)
+            self.bucket_counts[label_values] = bucket_counts
+            self.sums[label_values] = 0.0
+        bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[label_values] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """Records the duration in seconds of the enclosed block for the given label values."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, *label_values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} histogram"]
+        for label_values, bucket_counts in sorted(self.bucket_counts.items()):
+            cumulative_count = 0
+            for upper_bound, count in zip([*map(_number, self.buckets), "+Inf"], bucket_counts):
+                cumulative_count += count
+                labels = _labels((*self.label_names, "le"),
+                                 (*label_values, upper_bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative_count}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(
+                f"{self.name}_sum{labels} {_number(self.sums[label_values])}")
+            lines.append(f"{self.name}_count{labels} {cumulative_count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registry of the metrics of the service, rendered in the Prometheus text exposition format."""
+    metrics: list[Counter | Gauge | Histogram]
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, description: str, label_names: tuple[str, ...] = ()) -> Counter:
+        counter = Counter(name, description, label_names)
+        self.metrics.append(counter)
+        return counter
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        gauge = Gauge(name, description)
+        self.metrics.append(gauge)
+        return gauge
+
+    def histogram(self, name: str, description: str, label_names: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        histogram = Histogram(name, description, label_names, buckets)
+        self.metrics.append(histogram)
+        return histogram
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        return "".join(line + "\n" for metric in self.metrics for line in metric.render())
+
+
+def _labels(label_names: tuple[str, ...], label_values: tuple[str, ...]) -> str:
+    if len(label_names) == 0:
+        return ""
+    escaped_values = (value.replace("\\", "\\\\").replace('"', '\\"')
+                      for value in label_values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(label_names, escaped_values)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+UPSTREAM_REQUEST_SECONDS = REGISTRY.histogram(
+    "upstream_request_seconds", "Latency of requests to the external API services.", ("provider",))
+DB_OPERATION_SECONDS = REGISTRY.histogram(
+    "db_operation_seconds", "Latency of database operations, including waiting for a database thread.", ("method",))
+SNAPSHOT_CACHE_REQUESTS = REGISTRY.counter(
+    "snapshot_cache_requests_total", "Current queries by outcome of the snapshot cache lookup.", ("result",))
+SNAPSHOT_REFRESHES = REGISTRY.counter(
+    "snapshot_refreshes_total", "Refreshes of the latest snapshot from the external API services.")
+SNAPSHOT_COALESCED_REFRESHES = REGISTRY.counter(
+    "snapshot_coalesced_refreshes_total", "Callers that waited for a refresh already in flight instead of starting one.")
+REQUEST_STAGE_SECONDS = REGISTRY.histogram(
+    "request_stage_seconds", "Latency of the stages of handling a request: validation, resolver and serialization.", ("stage",))
+SNAPSHOT_AGE_SECONDS = REGISTRY.histogram(
+    "snapshot_age_seconds", "Age of the snapshots returned for current queries.", buckets=SNAPSHOT_AGE_BUCKETS)
+HISTORICAL_CACHE_REQUESTS = REGISTRY.counter(
+    "historical_cache_requests_total", "Lookups of the historical cache by kind of value and outcome.", ("cache", "result"))
+HISTORICAL_CACHE_EVICTIONS = REGISTRY.counter(
+    "historical_cache_evictions_total", "Values evicted from the historical cache to stay within its memory budget.")
+WRITE_QUEUE_DEPTH = REGISTRY.gauge(
+    "write_queue_depth", "Snapshots waiting in the write queue to be stored in the database.")
+WRITE_QUEUE_FLUSH_SECONDS = REGISTRY.histogram(
+    "write_queue_flush_seconds", "Latency of storing a batch of snapshots from the write queue, including retries.")
+WRITE_QUEUE_DROPPED_SNAPSHOTS = REGISTRY.counter(
+    "write_queue_dropped_snapshots_total", "Snapshots that were not stored, by reason: the queue was full or the writes kept failing.", ("reason",))
+UPSTREAM_FAILURES = REGISTRY.counter(
+    "upstream_failures_total", "Failed or timed out requests to the external API services.", ("provider",))
+UPSTREAM_FALLBACKS = REGISTRY.counter(
+    "upstream_fallbacks_total", "Last good responses returned instead of the responses of the external API services.", ("provider",))
+UPSTREAM_HEDGED_REQUESTS = REGISTRY.counter(
+    "upstream_hedged_requests_total", "Requests to the external API services hedged with a second request.", ("provider",))
+UPSTREAM_CIRCUIT_OPENINGS = REGISTRY.counter(
+    "upstream_circuit_openings_total", "Times the circuit breaker of an external API service opened.", ("provider",))
@@ -0,0 +1,198 @@
+from dotenv import load_dotenv
+import os
+from app.models.errors import UpstreamUnavailable
+from app.services.metrics import UPSTREAM_FAILURES, UPSTREAM_FALLBACKS, UPSTREAM_HEDGED_REQUESTS, UPSTREAM_CIRCUIT_OPENINGS
+from collections import deque
+from typing import Awaitable, Callable, Generic, TypeVar
+import statistics
+import logging
+import asyncio
+import time
+
+load_dotenv()
+
+UPSTREAM_DEADLINE_SECONDS = float(os.getenv("UPSTREAM_DEADLINE_SECONDS", "5"))
+UPSTREAM_HEDGE_PERCENTILE = os.getenv("UPSTREAM_HEDGE_PERCENTILE")
+UPSTREAM_BREAKER_FAILURE_THRESHOLD = int(
+    os.getenv("UPSTREAM_BREAKER_FAILURE_THRESHOLD", "5"))
+UPSTREAM_BREAKER_RESET_SECONDS = float(
+    os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "30"))
+UPSTREAM_FALLBACK_MAX_AGE_SECONDS = float(
+    os.getenv("UPSTREAM_FALLBACK_MAX_AGE_SECONDS", "300"))
+
+LATENCY_WINDOW_SIZE = 100
+MIN_HEDGE_LATENCY_SAMPLES = 20
+
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """Circuit breaker for the requests to an external API service.
+
+    The circuit opens after a number of consecutive failures, so that requests fail fast
+    instead of waiting for a degraded service. Once the reset time has elapsed, a single
+    trial request is let through (half-open): the circuit closes again if it succeeds,
+    and opens for another reset time if it fails.
+    """
+    name: str
+    failure_threshold: int
+    reset_seconds: float
+    num_consecutive_failures: int
+    opened_at: float | None
+    is_trial_in_flight: bool
+
+    def __init__(self, name: str, failure_threshold: int = UPSTREAM_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = UPSTREAM_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.num_consecutive_failures = 0
+        self.opened_at = None
+        self.is_trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow_request(self) -> bool:
+        """Checks whether a request can be made, letting a single trial request through once the reset time has elapsed."""
+        if self.opened_at is None:
+            return True
+        if self.is_trial_in_flight or time.monotonic() - self.opened_at < self.reset_seconds:
+            return False
+        self.is_trial_in_flight = True
+        return True
+
+    def release_trial(self) -> None:
+        """Lets another trial request through, if the trial request was abandoned without a result."""
+        self.is_trial_in_flight = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logging.info(f"CircuitBreaker: Closed circuit for {self.name}")
+        self.num_consecutive_failures = 0
+        self.opened_at = None
+        self.is_trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.num_consecutive_failures += 1
+        if self.is_trial_in_flight or (self.opened_at is None and self.num_consecutive_failures >= self.failure_threshold):
+            logging.warning(
+                f"CircuitBreaker: Opened circuit for {self.name} after {self.num_consecutive_failures} consecutive failures")
+            UPSTREAM_CIRCUIT_OPENINGS.inc(self.name)
+            self.opened_at = time.monotonic()
+        self.is_trial_in_flight = False
+
+
+class ResilientProvider(Generic[T]):
+    """Resilience layer for the requests to an external API service.
+
+    Each request is bounded by a deadline and guarded by a circuit breaker. If the request fails,
+    times out or the circuit is open, the last good response is returned instead, as long as it
+    is recent enough, so that a degraded service does not fail or slow down our own requests.
+    Responses are returned along with their age, so that callers can tell the last good response
+    from a fresh one.
+
+    Optionally, a request that takes longer than a percentile of the recent latencies of the
+    service is hedged: a second identical request is sent, and the first response wins.
+    """
+    name: str
+    deadline_seconds: float
+    hedge_percentile: float | None
+    fallback_max_age_seconds: float
+    circuit_breaker: CircuitBreaker
+    latencies: deque[float]
+    last_good_response: T | None
+    last_good_response_time: float | None
+
+    def __init__(self, name: str, deadline_seconds: float = UPSTREAM_DEADLINE_SECONDS,
+                 hedge_percentile: float | None = float(
+                     UPSTREAM_HEDGE_PERCENTILE) if UPSTREAM_HEDGE_PERCENTILE is not None else None,
+                 fallback_max_age_seconds: float = UPSTREAM_FALLBACK_MAX_AGE_SECONDS,
+                 circuit_breaker: CircuitBreaker | None = None):
+        self.name = name
+        self.deadline_seconds = deadline_seconds
+        self.hedge_percentile = hedge_percentile
+        self.fallback_max_age_seconds = fallback_max_age_seconds
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker(
+            name)
+        self.latencies = deque(maxlen=LATENCY_WINDOW_SIZE)
+        self.last_good_response = None
+        self.last_good_response_time = None
+
+    async def call(self, request: Callable[[], Awaitable[T]]) -> tuple[T, float]:
+        """Makes a request to the external API service through the resilience layer.
+
+        Args:
+            request (Callable[[], Awaitable[T]]): makes the request, and can be called again to hedge it
+
+        Raises:
+            UpstreamUnavailable: If the request failed or the circuit is open, and there is no recent good response.
+
+        Returns:
+            tuple[T, float]: the response, or the last good response if the service is unavailable,
+            and its age in seconds, which is 0 for a fresh response.
+        """
+        if not self.circuit_breaker.allow_request():
+            return self._fallback("circuit is open")
+
+        start_time = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._hedged_request(request), self.deadline_seconds)
+        except asyncio.CancelledError:
+            self.circuit_breaker.release_trial()
+            raise
+        except Exception as e:
+            self.circuit_breaker.record_failure()
+            UPSTREAM_FAILURES.inc(self.name)
+            logging.warning(
+                f"ResilientProvider: Request to {self.name} failed: {e!r}")
+            return self._fallback("request failed", e)
+
+        self.latencies.append(time.perf_counter() - start_time)
+        self.circuit_breaker.record_success()
+        self.last_good_response = response
+        self.last_good_response_time = time.monotonic()
+        return response, 0.0
+
+    def _hedge_delay(self) -> float | None:
+        if self.hedge_percentile is None or len(self.latencies) < MIN_HEDGE_LATENCY_SAMPLES:
+            return None
+        # The quantiles are the 1st to the 99th percentiles, so lower and higher percentiles are clamped to them
+        percentile = max(1, min(int(self.hedge_percentile), 99))
+        return statistics.quantiles(self.latencies, n=100, method="inclusive")[percentile - 1]
+
+    async def _hedged_request(self, request: Callable[[], Awaitable[T]]) -> T:
+        first_attempt = asyncio.ensure_future(request())
+        if (hedge_delay := self._hedge_delay()) is None:
+            return await first_attempt
+
+        attempts = {first_attempt}
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=hedge_delay)
+            if len(done) == 0:
+                logging.debug(
+                    f"ResilientProvider: Hedging request to {self.name} after {hedge_delay:.3f} seconds")
+                UPSTREAM_HEDGED_REQUESTS.inc(self.name)
+                attempts.add(asyncio.ensure_future(request()))
+
+            # The first successful attempt wins, and the last failure is raised if all of them fail
+            pending = attempts
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if len(successes := [attempt for attempt in done if attempt.exception() is None]) > 0:
+                    return successes[0].result()
+                if len(pending) == 0:
+                    return done.pop().result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def _fallback(self, reason: str, error: Exception | None = None) -> tuple[T, float]:
+        if self.last_good_response is None or self.last_good_response_time is None or \
+                (age_seconds := time.monotonic() - self.last_good_response_time) > self.fallback_max_age_seconds:
+            raise UpstreamUnavailable(self.name) from error
+        logging.warning(
+            f"ResilientProvider: Returning last good response from {self.name}, {age_seconds:.0f} seconds old, {reason}")
+        UPSTREAM_FALLBACKS.inc(self.name)
+        return self.last_good_response, age_seconds
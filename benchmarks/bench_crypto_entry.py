@@ -0,0 +1,89 @@
+"""Micro-benchmark of the representation of crypto entries, per snapshot of 100 entries.
+
+Compares the slotted `CryptoEntry` with the pydantic model it replaced, for building a
+snapshot as done for every row fetched from the external services or read from the database,
+and for serializing it to JSON.
+
+Run with `python -m benchmarks.bench_crypto_entry`.
+"""
+from pydantic import BaseModel, model_serializer
+from datetime import datetime, timezone
+from typing import Any
+from app.models.models import CryptoEntry, OutputFormat
+import orjson
+import timeit
+import tracemalloc
+
+SNAPSHOT_SIZE = 100
+NUM_REPETITIONS = 2000
+TIMESTAMP = datetime(2023, 8, 12, 17, 0, tzinfo=timezone.utc)
+ROWS = [(f"COIN{rank}", 1000.0 / rank, rank) for rank in range(1, SNAPSHOT_SIZE + 1)]
+
+
+class PydanticCryptoEntry(BaseModel):
+    """Previous representation of crypto entries, as a validated pydantic model."""
+    name: str
+    value: float
+    rank: int
+    timestamp: datetime
+
+    @model_serializer
+    def serialize(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "value": self.value,
+            "rank": self.rank,
+            "timestamp": self.timestamp.isoformat()
+        }
+
+
+def build_pydantic_snapshot() -> list[PydanticCryptoEntry]:
+    return [PydanticCryptoEntry(name=name, value=value, rank=rank, timestamp=TIMESTAMP) for name, value, rank in ROWS]
+
+
+def build_slotted_snapshot() -> list[CryptoEntry]:
+    return [CryptoEntry(name, value, rank, TIMESTAMP) for name, value, rank in ROWS]
+
+
+def serialize_snapshot(snapshot: list) -> bytes:
+    return OutputFormat.JSON.output(snapshot)
+
+
+def serialize_pydantic_snapshot(snapshot: list[PydanticCryptoEntry]) -> bytes:
+    return b"[" + b",".join(orjson.dumps(entry.serialize()) for entry in snapshot) + b"]"
+
+
+def microseconds_per_call(function, *args) -> float:
+    return min(timeit.repeat(lambda: function(*args), number=NUM_REPETITIONS, repeat=5)) / NUM_REPETITIONS * 1_000_000
+
+
+def allocated_bytes(function) -> int:
+    tracemalloc.start()
+    snapshot = function()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del snapshot
+    return allocated
+
+
+def main():
+    pydantic_snapshot = build_pydantic_snapshot()
+    slotted_snapshot = build_slotted_snapshot()
+    assert serialize_pydantic_snapshot(pydantic_snapshot) == serialize_snapshot(slotted_snapshot)
+
+    results = [
+        ("build", microseconds_per_call(build_pydantic_snapshot), microseconds_per_call(build_slotted_snapshot)),
+        ("serialize", microseconds_per_call(serialize_pydantic_snapshot, pydantic_snapshot),
+         microseconds_per_call(serialize_snapshot, slotted_snapshot)),
+    ]
+    print(f"Per snapshot of {SNAPSHOT_SIZE} entries:")
+    print(f"{'':<16}{'pydantic':>12}{'slotted':>12}{'speedup':>10}")
+    for name, pydantic_time, slotted_time in results:
+        print(f"{name + ' (us)':<16}{pydantic_time:>12.1f}{slotted_time:>12.1f}{pydantic_time / slotted_time:>9.1f}x")
+    pydantic_bytes = allocated_bytes(build_pydantic_snapshot)
+    slotted_bytes = allocated_bytes(build_slotted_snapshot)
+    print(f"{'memory (B)':<16}{pydantic_bytes:>12}{slotted_bytes:>12}{pydantic_bytes / slotted_bytes:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
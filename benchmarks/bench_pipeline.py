@@ -0,0 +1,229 @@
+"""Benchmark of the request pipeline of `/top_price_list`, driven end to end through the ASGI app.
+
+The external API services are replaced by fakes with a configurable latency, and historical data
+is held in an in-memory SQLite database pre-populated with a day of snapshots taken every minute.
+Current and historical queries, formatted as JSON and CSV, are run at several concurrency levels,
+reporting throughput and p50/p95/p99 latencies. The stages of the pipeline (validation, resolver,
+database and serialization) are also timed on their own.
+
+Results are compared against the baseline stored in `benchmarks/baseline.json`, if any, and the
+benchmark exits with an error if the throughput or the median latency of any result regressed
+beyond the tolerance. Baselines are only comparable on the same machine, so they are recorded
+locally and never committed.
+
+Run with `python -m benchmarks.bench_pipeline`, or `python -m benchmarks.bench_pipeline --save-baseline`
+to store the results as the new baseline.
+"""
+from app.main import app
+from app.api import routes
+from app.db.sqlite_database import SQLiteDatabase
+from app.db.indexed_storage import IndexedStorage
+from app.logic.coin_resolver import CoinResolver, HISTORICAL_SEARCH_SECONDS_RANGE
+from app.models.models import CryptoEntry, OutputFormat, Snapshot
+from app.services.time_service import TimeService
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+import argparse
+import asyncio
+import httpx
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+NUM_LISTINGS = 500
+NUM_TOP_COINS = 100
+HISTORY_MINUTES = 60 * 24
+NUM_STAGE_ITERATIONS = 500
+# Tail latencies are reported but too noisy to gate on, and so are changes below half a millisecond
+GATED_METRICS = ("throughput_rps", "p50_ms")
+MIN_LATENCY_CHANGE_MS = 0.5
+
+
+class FakeCoinMarketCap:
+    """Stand-in for CoinMarketCap returning fixed listings after a given latency."""
+    latency_seconds: float
+    coin_listings: list[tuple[str, str, float]]
+
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.coin_listings = [(f"COIN{rank}", f"Coin {rank}", 1000.0 / rank)
+                              for rank in range(1, NUM_LISTINGS + 1)]
+
+    async def get_coin_listings(self) -> tuple[list[tuple[str, str, float]], float]:
+        await asyncio.sleep(self.latency_seconds)
+        return self.coin_listings, 0.0
+
+
+class FakeCryptoCompare:
+    """Stand-in for CryptoCompare returning a fixed top list after a given latency."""
+    latency_seconds: float
+    top_crypto: list[tuple[str, str]]
+
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.top_crypto = [(f"COIN{rank}", f"Coin {rank}")
+                           for rank in range(1, NUM_TOP_COINS + 1)]
+
+    async def get_top_crypto_list(self) -> tuple[list[tuple[str, str]], float]:
+        await asyncio.sleep(self.latency_seconds)
+        return self.top_crypto, 0.0
+
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50_ms": quantiles[49] * 1000, "p95_ms": quantiles[94] * 1000, "p99_ms": quantiles[98] * 1000}
+
+
+async def populate_history(db: IndexedStorage, start: datetime) -> None:
+    await db.insert_snapshots([[CryptoEntry(f"COIN{rank}", 1000.0 / rank + minute, rank, start + timedelta(minutes=minute))
+                                for rank in range(1, NUM_TOP_COINS + 1)]
+                               for minute in range(HISTORY_MINUTES)])
+
+
+def random_history_time(history_start: datetime) -> datetime:
+    return history_start + timedelta(seconds=random.uniform(0, HISTORY_MINUTES * 60))
+
+
+async def run_scenario(client: httpx.AsyncClient, url: Callable[[], str], concurrency: int, num_requests: int) -> dict[str, float]:
+    latencies: list[float] = []
+
+    async def worker(num_worker_requests: int) -> None:
+        for _ in range(num_worker_requests):
+            start_time = time.perf_counter()
+            response = await client.get(url())
+            latencies.append(time.perf_counter() - start_time)
+            response.raise_for_status()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker(num_requests // concurrency) for _ in range(concurrency)))
+    elapsed_seconds = time.perf_counter() - start_time
+    return {"throughput_rps": len(latencies) / elapsed_seconds, **percentiles(latencies)}
+
+
+async def time_stage(stage: Callable[[], Awaitable[Any]]) -> dict[str, float]:
+    latencies: list[float] = []
+    for _ in range(NUM_STAGE_ITERATIONS):
+        start_time = time.perf_counter()
+        await stage()
+        latencies.append(time.perf_counter() - start_time)
+    return percentiles(latencies)
+
+
+async def run_benchmark(upstream_latency_seconds: float, concurrency_levels: list[int], num_requests: int) -> dict[str, dict[str, float]]:
+    random.seed(0)
+    time_service = TimeService()
+    history_start = time_service.now() - timedelta(days=2)
+    db = IndexedStorage(SQLiteDatabase(":memory:"), time_service)
+    await db.initialize()
+    await populate_history(db, history_start)
+    coin_resolver = CoinResolver(db, FakeCoinMarketCap(upstream_latency_seconds),
+                                 FakeCryptoCompare(upstream_latency_seconds), time_service)
+    app.coin_resolver = coin_resolver
+    app.time_service = time_service
+
+    def historical_url(format: str) -> Callable[[], str]:
+        return lambda: f"/top_price_list?limit={NUM_TOP_COINS}&format={format}&datetime={random_history_time(history_start).isoformat().replace('+', '%2B')}"
+
+    scenarios: dict[str, Callable[[], str]] = {
+        "current-json": lambda: f"/top_price_list?limit={NUM_TOP_COINS}&format=json",
+        "current-csv": lambda: f"/top_price_list?limit={NUM_TOP_COINS}&format=csv",
+        "historical-json": historical_url("json"),
+        "historical-csv": historical_url("csv"),
+    }
+
+    results: dict[str, dict[str, float]] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for name, url in scenarios.items():
+            for concurrency in concurrency_levels:
+                results[f"{name}@{concurrency}"] = await run_scenario(client, url, concurrency, num_requests)
+
+    async def validation() -> None:
+        routes._validate_limit(NUM_TOP_COINS)
+        routes._validate_timestamp(
+            time_service, random_history_time(history_start).isoformat())
+        routes._validate_output_format("csv")
+
+    async def resolver() -> None:
+        await coin_resolver.fetch_top_snapshot(NUM_TOP_COINS, random_history_time(history_start))
+
+    async def database() -> None:
+        timestamp = await db.get_closest_timestamp(random_history_time(history_start), HISTORICAL_SEARCH_SECONDS_RANGE)
+        await db.get_historical_data(NUM_TOP_COINS, timestamp)
+
+    entries = await db.get_historical_data(NUM_TOP_COINS, await db.get_closest_timestamp(
+        history_start, HISTORICAL_SEARCH_SECONDS_RANGE))
+
+    async def serialization() -> None:
+        # Snapshots render each format once, so a new snapshot is rendered every time
+        Snapshot(entries).render(OutputFormat.JSON, NUM_TOP_COINS)
+
+    for name, stage in {"validation": validation, "resolver": resolver, "db": database, "serialization": serialization}.items():
+        results[f"stage-{name}"] = await time_stage(stage)
+
+    await coin_resolver.close()
+    return results
+
+
+def compare_with_baseline(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], tolerance: float) -> bool:
+    print(f"{'benchmark':<24}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+    has_regressed = False
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            baseline_value = baseline.get(name, {}).get(metric)
+            if baseline_value is None or baseline_value == 0:
+                print(f"{name:<24}{metric:<16}{'-':>12}{value:>12.2f}{'-':>10}")
+                continue
+            change = (value - baseline_value) / baseline_value
+            # Throughput regresses when it drops, latencies when they grow
+            if metric not in GATED_METRICS:
+                regressed = False
+            elif metric == "throughput_rps":
+                regressed = change < -tolerance
+            else:
+                regressed = change > tolerance and value - baseline_value > MIN_LATENCY_CHANGE_MS
+            has_regressed = has_regressed or regressed
+            print(f"{name:<24}{metric:<16}{baseline_value:>12.2f}{value:>12.2f}{change:>+9.0%}{' REGRESSION' if regressed else ''}")
+    return has_regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the /top_price_list request pipeline")
+    parser.add_argument("--upstream-latency-ms", type=float, default=50,
+                        help="latency of the fake external API services")
+    parser.add_argument("--concurrency", type=str, default="1,10,50",
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="number of requests per scenario and concurrency level")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change beyond which a result is a regression")
+    parser.add_argument("--baseline", type=str, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = asyncio.run(run_benchmark(args.upstream_latency_ms / 1000,
+                                        [int(level) for level in args.concurrency.split(",")], args.requests))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    has_regressed = compare_with_baseline(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+    elif has_regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,8 @@ from urllib import parse
 
 from app.main import app
 
-from tests.services.time_service_mock import TimeServiceMock, SAMPLE_TIME, SAMPLE_TIME_SHORTLY_AFTER
+from tests.services.time_service_mock import TimeServiceMock, SAMPLE_TIME, SAMPLE_TIME_SHORTLY_AFTER, SAMPLE_TIME_LONG_AFTER
+from tests.services.time_service_mock import SAMPLE_PREVIOUS_TIME_WITHIN_HISTORICAL_RANGE
 from tests.logic.coin_resolver_mock import CoinResolverMock, SAMPLE_RESULTS, SAMPLE_RESULTS_JSON, SAMPLE_RESULTS_CSV
 
 
@@ -87,6 +88,48 @@ def test_top_price_request_for_current_data_succeeds():
     assert response.json() == json.loads(SAMPLE_RESULTS_JSON)
 
 
+def test_top_price_request_for_current_data_carries_snapshot_age():
+    # Arrange
+    time_service_mock = TimeServiceMock(SAMPLE_TIME_LONG_AFTER)
+    coin_resolver_mock = CoinResolverMock(SAMPLE_RESULTS)
+    app.time_service = time_service_mock
+    app.coin_resolver = coin_resolver_mock
+    client = TestClient(app)
+
+    # Act
+    response = client.get("/top_price_list?limit=10")
+
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["x-snapshot-age"] == "60"
+
+
+def test_top_price_request_for_current_data_is_not_modified_if_etag_matches():
+    # Arrange
+    time_service_mock = TimeServiceMock(SAMPLE_TIME_SHORTLY_AFTER)
+    coin_resolver_mock = CoinResolverMock(SAMPLE_RESULTS)
+    app.time_service = time_service_mock
+    app.coin_resolver = coin_resolver_mock
+    client = TestClient(app)
+
+    # Act
+    response = client.get("/top_price_list?limit=10")
+    etag = response.headers["etag"]
+    cached_response = client.get(
+        "/top_price_list?limit=10", headers={"If-None-Match": etag})
+    other_format_response = client.get(
+        "/top_price_list?limit=10&format=csv", headers={"If-None-Match": etag})
+
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "max-age=1"
+    assert cached_response.status_code == 304
+    assert cached_response.headers["etag"] == etag
+    assert other_format_response.status_code == 200
+    assert other_format_response.headers["etag"] != etag
+    assert coin_resolver_mock.num_fetches == 2
+
+
 def test_top_price_request_for_historical_data_succeeds():
     # Arrange
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
@@ -105,6 +148,29 @@ def test_top_price_request_for_historical_data_succeeds():
     assert response.json() == json.loads(SAMPLE_RESULTS_JSON)
 
 
+def test_top_price_request_for_historical_data_is_immutable_and_resolved_once():
+    # Arrange
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    coin_resolver_mock = CoinResolverMock(SAMPLE_RESULTS)
+    app.time_service = time_service_mock
+    app.coin_resolver = coin_resolver_mock
+    client = TestClient(app)
+    timestamp = SAMPLE_TIME.isoformat()
+
+    # Act
+    response = client.get(
+        f"/top_price_list?limit=10&datetime={parse.quote(timestamp)}")
+    cached_response = client.get(
+        f"/top_price_list?limit=10&datetime={parse.quote(timestamp)}", headers={"If-None-Match": response.headers["etag"]})
+
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "max-age=31536000, immutable"
+    assert cached_response.status_code == 304
+    assert coin_resolver_mock.num_resolutions == 2
+    assert coin_resolver_mock.num_fetches == 1
+
+
 def test_top_price_request_for_historical_data_fails_if_data_is_not_found():
     # Arrange
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
@@ -137,3 +203,97 @@ def test_top_price_request_can_be_formatted_as_csv():
     # Assert
     assert response.status_code == 200
     assert response.text == SAMPLE_RESULTS_CSV
+
+
+def test_top_price_range_request_can_be_formatted_as_ndjson():
+    # Arrange
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    coin_resolver_mock = CoinResolverMock(SAMPLE_RESULTS)
+    app.time_service = time_service_mock
+    app.coin_resolver = coin_resolver_mock
+    client = TestClient(app)
+    start = parse.quote(SAMPLE_TIME.isoformat())
+
+    # Act
+    response = client.get(
+        f"/top_price_list/range?limit=10&start={start}&end={start}&step=60&format=ndjson")
+
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == json.loads(SAMPLE_RESULTS_JSON)
+
+
+def test_top_price_range_request_fails_if_range_has_too_many_steps():
+    # Arrange
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    app.time_service = time_service_mock
+    client = TestClient(app)
+    start = parse.quote(SAMPLE_PREVIOUS_TIME_WITHIN_HISTORICAL_RANGE.isoformat())
+    end = parse.quote(SAMPLE_TIME.isoformat())
+
+    # Act
+    response = client.get(
+        f"/top_price_list/range?limit=10&start={start}&end={end}&step=1")
+
+    # Assert
+    assert response.status_code == 400
+    assert "steps" in response.json()["detail"].lower()
+
+
+def test_top_price_range_request_can_be_streamed_as_json():
+    # Arrange
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    coin_resolver_mock = CoinResolverMock(SAMPLE_RESULTS)
+    app.time_service = time_service_mock
+    app.coin_resolver = coin_resolver_mock
+    client = TestClient(app)
+    start = parse.quote(SAMPLE_PREVIOUS_TIME_WITHIN_HISTORICAL_RANGE.isoformat())
+    end = parse.quote(SAMPLE_TIME.isoformat())
+
+    # Act
+    response = client.get(
+        f"/top_price_list/range?limit=10&start={start}&end={end}&step=1&stream=true")
+
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == json.loads(SAMPLE_RESULTS_JSON)
+
+
+def test_price_history_request_returns_prices_of_symbol():
+    # Arrange
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    coin_resolver_mock = CoinResolverMock(SAMPLE_RESULTS)
+    app.time_service = time_service_mock
+    app.coin_resolver = coin_resolver_mock
+    client = TestClient(app)
+    start = parse.quote(SAMPLE_PREVIOUS_TIME_WITHIN_HISTORICAL_RANGE.isoformat())
+    end = parse.quote(SAMPLE_TIME.isoformat())
+
+    # Act
+    response = client.get(
+        f"/price_history?symbol=eth&start={start}&end={end}&bucket=3600")
+
+    # Assert
+    assert response.status_code == 200
+    assert response.json() == json.loads(SAMPLE_RESULTS_JSON)[1:]
+
+
+def test_metrics_request_returns_request_stage_latencies():
+    # Arrange
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    coin_resolver_mock = CoinResolverMock(SAMPLE_RESULTS)
+    app.time_service = time_service_mock
+    app.coin_resolver = coin_resolver_mock
+    client = TestClient(app)
+    client.get("/top_price_list?limit=10")
+
+    # Act
+    response = client.get("/metrics")
+
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'request_stage_seconds_count{stage="serialization"}' in response.text
+    assert "snapshot_age_seconds_count" in response.text
@@ -1,29 +1,70 @@
 from datetime import datetime, timedelta
-from app.models.models import CryptoEntry
+from typing import AsyncIterator
+from app.models.models import CryptoEntry, Resolution
 
 
 class DatabaseMock:
     closest_timestamp: datetime | None
     historical_data: list[CryptoEntry]
     num_historical_data_fetches: int
+    num_insert_failures: int
+    inserted_batches: list[list[list[CryptoEntry]]]
 
-    def __init__(self, closest_timestamp: datetime | None = None, historical_data: list[CryptoEntry] = []):
+    def __init__(self, closest_timestamp: datetime | None = None, historical_data: list[CryptoEntry] = [], num_insert_failures: int = 0):
         self.closest_timestamp = closest_timestamp
         self.historical_data = historical_data
         self.num_historical_data_fetches = 0
+        self.num_insert_failures = num_insert_failures
+        self.inserted_batches = []
 
-    async def insert_updated_data(self, crypto_entries: list[CryptoEntry]) -> None:
-        self.historical_data = crypto_entries
-        if len(crypto_entries) > 0:
-            self.closest_timestamp = crypto_entries[0].timestamp
+    async def close(self) -> None:
+        pass
 
-    def get_closest_timestamp(self, timestamp: datetime, seconds_range: int) -> datetime | None:
-        if (closest_timestamp := self.closest_timestamp) is not None:
-            if (closest_timestamp - timedelta(seconds=seconds_range)) <= timestamp <= (closest_timestamp + timedelta(seconds=seconds_range)):
+    async def insert_snapshots(self, snapshots: list[list[CryptoEntry]]) -> None:
+        if self.num_insert_failures > 0:
+            self.num_insert_failures -= 1
+            raise ConnectionError("Database is unavailable")
+        self.inserted_batches.append(snapshots)
+        for crypto_entries in snapshots:
+            self.historical_data = crypto_entries
+            if len(crypto_entries) > 0:
+                self.closest_timestamp = crypto_entries[0].timestamp
+
+    async def get_closest_timestamp(self, timestamp: datetime, seconds_range: int, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        if (closest_timestamp := self.closest_timestamp) is not None and resolution == Resolution.RAW:
+            if (closest_timestamp - timedelta(seconds=seconds_range)) <= timestamp < (closest_timestamp + timedelta(seconds=seconds_range)):
                 return self.closest_timestamp
 
         return None
 
-    def get_historical_data(self, limit: int, timestamp: datetime) -> list[CryptoEntry]:
+    async def get_historical_data(self, limit: int, timestamp: datetime, resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
         self.num_historical_data_fetches += 1
         return self.historical_data
+
+    async def get_earliest_timestamp(self, resolution: Resolution = Resolution.RAW) -> datetime | None:
+        if resolution != Resolution.RAW or len(self.historical_data) == 0:
+            return None
+        return min(entry.timestamp for entry in self.historical_data)
+
+    async def get_timestamps_between(self, start: datetime, end: datetime, resolution: Resolution = Resolution.RAW) -> list[datetime]:
+        if (closest_timestamp := self.closest_timestamp) is not None and resolution == Resolution.RAW and start <= closest_timestamp <= end:
+            return [closest_timestamp]
+        return []
+
+    async def get_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime],
+                                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        self.num_historical_data_fetches += 1
+        if resolution != Resolution.RAW:
+            return []
+        return [entry for entry in self.historical_data if entry.timestamp in timestamps][0:limit]
+
+    async def get_symbol_history(self, name: str, start: datetime, end: datetime,
+                                 resolution: Resolution = Resolution.RAW) -> list[CryptoEntry]:
+        self.num_historical_data_fetches += 1
+        if resolution != Resolution.RAW:
+            return []
+        return [entry for entry in self.historical_data if entry.name == name and start <= entry.timestamp <= end]
+
+    async def stream_historical_data_for_timestamps(self, limit: int, timestamps: list[datetime], batch_size: int,
+                                                    resolution: Resolution = Resolution.RAW) -> AsyncIterator[list[CryptoEntry]]:
+        yield await self.get_historical_data_for_timestamps(limit, timestamps, resolution)
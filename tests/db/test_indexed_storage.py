@@ -0,0 +1,120 @@
+import pytest
+from datetime import timedelta
+
+from app.db.indexed_storage import IndexedStorage, TimestampIndex
+from app.db.sqlite_database import SQLiteDatabase
+from app.services.metrics import DB_OPERATION_SECONDS
+from app.logic.coin_resolver import CURRENT_SEARCH_SECONDS_RANGE, HISTORICAL_SEARCH_SECONDS_RANGE
+
+from tests.services.time_service_mock import TimeServiceMock, SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER
+
+
+def test_closest_timestamp_is_found_by_binary_search():
+    # Arrange
+    sut = TimestampIndex()
+    sut.add(SAMPLE_TIME_LONG_AFTER)
+    sut.add(SAMPLE_TIME)
+    sut.add(SAMPLE_TIME)
+
+    # Act and assert
+    assert len(sut) == 2
+    assert sut.find_closest(SAMPLE_TIME + timedelta(seconds=10),
+                            CURRENT_SEARCH_SECONDS_RANGE) == SAMPLE_TIME
+    assert sut.find_closest(SAMPLE_TIME_LONG_AFTER + timedelta(seconds=10),
+                            CURRENT_SEARCH_SECONDS_RANGE) == SAMPLE_TIME_LONG_AFTER
+    assert sut.find_closest(SAMPLE_TIME - timedelta(seconds=CURRENT_SEARCH_SECONDS_RANGE),
+                            CURRENT_SEARCH_SECONDS_RANGE) is None
+    assert sut.between(SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER) == [
+        SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER]
+
+
+@pytest.mark.asyncio
+async def test_indexed_storage_loads_timestamps_on_initialization_and_keeps_them_up_to_date():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS])
+    time_service_mock = TimeServiceMock(
+        SAMPLE_TIME + timedelta(seconds=HISTORICAL_SEARCH_SECONDS_RANGE))
+    sut = IndexedStorage(db, time_service_mock)
+    await sut.initialize()
+
+    # Act
+    await sut.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    await sut.delete_snapshots_before(SAMPLE_TIME_LONG_AFTER)
+
+    # Assert
+    assert sut.index.between(SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER) == [
+        SAMPLE_TIME_LONG_AFTER]
+    assert await sut.get_closest_timestamp(SAMPLE_TIME, HISTORICAL_SEARCH_SECONDS_RANGE) == SAMPLE_TIME_LONG_AFTER
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_indexed_storage_picks_up_snapshots_stored_by_other_instances():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    sut = IndexedStorage(db, time_service_mock)
+    await sut.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    time_service_mock.time = SAMPLE_TIME_LONG_AFTER
+
+    # Act
+    results = await sut.get_closest_timestamp(SAMPLE_TIME_LONG_AFTER, CURRENT_SEARCH_SECONDS_RANGE)
+
+    # Assert
+    assert results == SAMPLE_TIME_LONG_AFTER
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_indexed_storage_syncs_with_other_instances_at_most_once_per_interval():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    sut = IndexedStorage(db, time_service_mock, sync_interval_seconds=10)
+    await sut.initialize()
+    await sut.insert_snapshots([SAMPLE_RESULTS])
+
+    def num_timestamp_queries() -> int:
+        return sum(DB_OPERATION_SECONDS.bucket_counts[("get_timestamps_between",)])
+    num_queries = num_timestamp_queries()
+
+    # Act
+    results = [await sut.get_closest_timestamp(SAMPLE_TIME + timedelta(seconds=seconds), CURRENT_SEARCH_SECONDS_RANGE)
+               for seconds in range(0, 10)]
+    num_queries_within_interval = num_timestamp_queries() - num_queries
+    time_service_mock.time = SAMPLE_TIME + timedelta(seconds=10)
+    await sut.get_closest_timestamp(time_service_mock.time, CURRENT_SEARCH_SECONDS_RANGE)
+
+    # Assert
+    assert results == [SAMPLE_TIME] * 10
+    assert num_queries_within_interval == 0
+    assert num_timestamp_queries() - num_queries == 1
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_indexed_storage_drops_snapshots_deleted_by_other_instances_on_sync():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER])
+    time_service_mock = TimeServiceMock(SAMPLE_TIME_LONG_AFTER)
+    sut = IndexedStorage(db, time_service_mock, sync_interval_seconds=10)
+    await sut.initialize()
+    await db.delete_snapshots_before(SAMPLE_TIME_LONG_AFTER)
+    time_service_mock.time = SAMPLE_TIME_LONG_AFTER + timedelta(seconds=10)
+
+    # Act
+    await sut.get_closest_timestamp(time_service_mock.time, CURRENT_SEARCH_SECONDS_RANGE)
+
+    # Assert
+    assert sut.index.between(SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER) == [
+        SAMPLE_TIME_LONG_AFTER]
+    assert await sut.get_closest_timestamp(SAMPLE_TIME, CURRENT_SEARCH_SECONDS_RANGE) is None
+    await sut.close()
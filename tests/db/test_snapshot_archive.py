@@ -0,0 +1,90 @@
+import pytest
+from datetime import timedelta
+
+from app.db.snapshot_archive import SnapshotArchive, ArchiveBackedStorage, NO_SYMBOL
+from app.db.sqlite_database import SQLiteDatabase
+from app.db.export_archive import export_snapshots
+from app.models.models import CryptoEntry
+from app.logic.coin_resolver import CURRENT_SEARCH_SECONDS_RANGE
+
+from tests.services.time_service_mock import SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER
+
+
+def test_archived_snapshots_can_be_read_after_reopening(tmp_path):
+    # Arrange
+    archive = SnapshotArchive(str(tmp_path), width=4)
+    archive.append(SAMPLE_RESULTS)
+    archive.append(SAMPLE_RESULTS_LONG_AFTER)
+    archive.close()
+
+    # Act
+    sut = SnapshotArchive(str(tmp_path), width=4)
+    results = sut.get_entries(10, SAMPLE_TIME_LONG_AFTER)
+    symbol_ids, prices = sut.top(10, SAMPLE_TIME)
+
+    # Assert
+    assert len(sut) == 2
+    assert results == SAMPLE_RESULTS_LONG_AFTER
+    assert prices.tolist()[0:2] == [entry.value for entry in SAMPLE_RESULTS]
+    assert symbol_ids.tolist()[2:] == [NO_SYMBOL, NO_SYMBOL]
+    assert sut.get_entries(10, SAMPLE_TIME + timedelta(seconds=1)) is None
+    sut.close()
+
+
+def test_closest_timestamp_is_found_by_binary_search(tmp_path):
+    # Arrange
+    sut = SnapshotArchive(str(tmp_path))
+    sut.append(SAMPLE_RESULTS)
+    sut.append(SAMPLE_RESULTS_LONG_AFTER)
+
+    # Act and assert
+    assert not sut.append(SAMPLE_RESULTS)
+    assert sut.find_closest_timestamp(SAMPLE_TIME + timedelta(seconds=20), CURRENT_SEARCH_SECONDS_RANGE) == SAMPLE_TIME
+    assert sut.find_closest_timestamp(SAMPLE_TIME + timedelta(seconds=40), CURRENT_SEARCH_SECONDS_RANGE) == SAMPLE_TIME_LONG_AFTER
+    assert sut.find_closest_timestamp(SAMPLE_TIME_LONG_AFTER + timedelta(seconds=31), CURRENT_SEARCH_SECONDS_RANGE) is None
+    sut.close()
+
+
+def test_writers_sharing_an_archive_agree_on_symbol_ids(tmp_path):
+    # Arrange
+    writer = SnapshotArchive(str(tmp_path))
+    other_writer = SnapshotArchive(str(tmp_path))
+    later_entries = [CryptoEntry("SOL", 20.0, 1, SAMPLE_TIME_LONG_AFTER),
+                     *SAMPLE_RESULTS_LONG_AFTER]
+
+    # Act
+    writer.append(SAMPLE_RESULTS)
+    other_writer.append(later_entries)
+    sut = SnapshotArchive(str(tmp_path))
+
+    # Assert
+    assert sut.get_entries(10, SAMPLE_TIME) == SAMPLE_RESULTS
+    assert [entry.name for entry in sut.get_entries(10, SAMPLE_TIME_LONG_AFTER)] == ["SOL", "ETH", "BTC"]
+    assert writer.get_entries(10, SAMPLE_TIME_LONG_AFTER) == other_writer.get_entries(10, SAMPLE_TIME_LONG_AFTER)
+    for archive in (writer, other_writer, sut):
+        archive.close()
+
+
+@pytest.mark.asyncio
+async def test_snapshots_are_exported_to_archive_and_read_through_it(tmp_path):
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS])
+    archive = SnapshotArchive(str(tmp_path))
+    sut = ArchiveBackedStorage(db, archive)
+
+    # Act
+    num_exported = await export_snapshots(db, archive, SAMPLE_TIME_LONG_AFTER)
+    await sut.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    closest_timestamp = await sut.get_closest_timestamp(SAMPLE_TIME_LONG_AFTER, CURRENT_SEARCH_SECONDS_RANGE)
+    results = archive.get_entries(1, SAMPLE_TIME)
+    num_archived = len(archive)
+    await sut.close()
+
+    # Assert
+    assert num_exported == 1
+    assert num_archived == 2
+    assert closest_timestamp == SAMPLE_TIME_LONG_AFTER
+    assert results == SAMPLE_RESULTS[:1]
@@ -0,0 +1,130 @@
+import pytest
+from datetime import timedelta
+
+from app.db.sqlite_database import SQLiteDatabase
+from app.models.models import Resolution
+from app.logic.snapshot_compactor import build_rollup
+from app.logic.coin_resolver import CURRENT_SEARCH_SECONDS_RANGE, HISTORICAL_SEARCH_SECONDS_RANGE
+
+from tests.services.time_service_mock import SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER
+from tests.services.time_service_mock import SAMPLE_PREVIOUS_TIME_WITHIN_HISTORICAL_RANGE
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER
+
+
+@pytest.mark.asyncio
+async def test_historical_data_can_be_retrieved_after_insertion():
+    # Arrange
+    sut = SQLiteDatabase(":memory:")
+    await sut.initialize()
+
+    # Act
+    await sut.insert_snapshots([SAMPLE_RESULTS])
+    results = await sut.get_historical_data(1, SAMPLE_TIME)
+    await sut.close()
+
+    # Assert
+    assert SAMPLE_RESULTS[:1] == results
+
+
+@pytest.mark.asyncio
+async def test_closest_timestamp_is_found_within_range():
+    # Arrange
+    sut = SQLiteDatabase(":memory:")
+    await sut.initialize()
+    await sut.insert_snapshots([SAMPLE_RESULTS])
+    await sut.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+
+    # Act and assert
+    assert await sut.get_closest_timestamp(SAMPLE_TIME + timedelta(seconds=20), CURRENT_SEARCH_SECONDS_RANGE) == SAMPLE_TIME
+    assert await sut.get_closest_timestamp(SAMPLE_TIME + timedelta(seconds=40), CURRENT_SEARCH_SECONDS_RANGE) == SAMPLE_TIME_LONG_AFTER
+    assert await sut.get_closest_timestamp(SAMPLE_TIME_LONG_AFTER + timedelta(seconds=31), CURRENT_SEARCH_SECONDS_RANGE) is None
+    assert await sut.get_closest_timestamp(SAMPLE_PREVIOUS_TIME_WITHIN_HISTORICAL_RANGE, 2 * HISTORICAL_SEARCH_SECONDS_RANGE) == SAMPLE_TIME
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_historical_data_is_empty_for_unknown_timestamp():
+    # Arrange
+    sut = SQLiteDatabase(":memory:")
+    await sut.initialize()
+
+    # Act
+    results = await sut.get_historical_data(10, SAMPLE_TIME)
+    await sut.close()
+
+    # Assert
+    assert results == []
+
+
+@pytest.mark.asyncio
+async def test_historical_data_can_be_streamed_in_batches():
+    # Arrange
+    sut = SQLiteDatabase(":memory:")
+    await sut.initialize()
+    await sut.insert_snapshots([SAMPLE_RESULTS])
+    await sut.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+
+    # Act
+    batches = [batch async for batch in sut.stream_historical_data_for_timestamps(
+        2, [SAMPLE_TIME_LONG_AFTER, SAMPLE_TIME], 1)]
+    await sut.close()
+
+    # Assert
+    assert batches == [SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER]
+
+
+@pytest.mark.asyncio
+async def test_symbol_history_is_retrieved_within_range():
+    # Arrange
+    sut = SQLiteDatabase(":memory:")
+    await sut.initialize()
+    await sut.insert_snapshots([SAMPLE_RESULTS])
+    await sut.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+
+    # Act
+    results = await sut.get_symbol_history("ETH", SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER)
+    results_before_long_after = await sut.get_symbol_history(
+        "ETH", SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER - timedelta(seconds=1))
+    await sut.close()
+
+    # Assert
+    assert results == [SAMPLE_RESULTS[1], SAMPLE_RESULTS_LONG_AFTER[0]]
+    assert results_before_long_after == [SAMPLE_RESULTS[1]]
+
+
+@pytest.mark.asyncio
+async def test_snapshots_are_inserted_in_batches_skipping_stored_ones():
+    # Arrange
+    sut = SQLiteDatabase(":memory:")
+    await sut.initialize()
+    await sut.insert_snapshots([SAMPLE_RESULTS])
+
+    # Act
+    await sut.insert_snapshots([SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER])
+
+    # Assert
+    assert await sut.get_timestamps_between(SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER) == [SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER]
+    assert await sut.get_historical_data(10, SAMPLE_TIME_LONG_AFTER) == SAMPLE_RESULTS_LONG_AFTER
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_rollups_are_retrieved_within_range_in_their_resolution():
+    # Arrange
+    sut = SQLiteDatabase(":memory:")
+    await sut.initialize()
+    await sut.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    await sut.insert_rollup(Resolution.HOURLY, build_rollup(SAMPLE_RESULTS))
+
+    # Act
+    timestamps = await sut.get_timestamps_between(SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER, Resolution.HOURLY)
+    results = await sut.get_historical_data_for_timestamps(1, timestamps, Resolution.HOURLY)
+    batches = [batch async for batch in sut.stream_historical_data_for_timestamps(1, timestamps, 1, Resolution.HOURLY)]
+    history = await sut.get_symbol_history("ETH", SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER, Resolution.HOURLY)
+    await sut.close()
+
+    # Assert
+    assert timestamps == [SAMPLE_TIME]
+    assert results == SAMPLE_RESULTS[:1]
+    assert batches == [SAMPLE_RESULTS[:1]]
+    assert history == [SAMPLE_RESULTS[1]]
@@ -0,0 +1,25 @@
+import array
+from datetime import timedelta
+
+from app.db.timestamps import to_key, from_key, find_closest_key
+from app.logic.coin_resolver import CURRENT_SEARCH_SECONDS_RANGE
+
+from tests.services.time_service_mock import SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER
+
+
+def test_closest_key_is_found_in_lists_and_memory_views_alike():
+    # Arrange
+    keys = [to_key(SAMPLE_TIME), to_key(SAMPLE_TIME_LONG_AFTER)]
+    view = memoryview(array.array("q", keys).tobytes()).cast("q")
+    reference = to_key(SAMPLE_TIME + timedelta(seconds=20))
+    out_of_range_reference = to_key(SAMPLE_TIME - timedelta(seconds=31))
+
+    # Act
+    results = [find_closest_key(sorted_keys, reference, CURRENT_SEARCH_SECONDS_RANGE) for sorted_keys in (keys, view)]
+    results_out_of_range = [find_closest_key(sorted_keys, out_of_range_reference, CURRENT_SEARCH_SECONDS_RANGE)
+                            for sorted_keys in (keys, view)]
+
+    # Assert
+    assert [from_key(key) for key in results] == [SAMPLE_TIME, SAMPLE_TIME]
+    assert results_out_of_range == [None, None]
+    assert find_closest_key([], reference, CURRENT_SEARCH_SECONDS_RANGE) is None
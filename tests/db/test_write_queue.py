@@ -0,0 +1,71 @@
+import pytest
+import asyncio
+
+from app.db import write_queue
+from app.db.write_queue import SnapshotWriteQueue
+
+from tests.db.database_mock import DatabaseMock
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER
+
+
+@pytest.mark.asyncio
+async def test_queued_snapshots_are_stored_in_batches_and_drained_on_close():
+    # Arrange
+    db_mock = DatabaseMock()
+    sut = SnapshotWriteQueue(db_mock, batch_size=2, flush_interval_seconds=60)
+
+    # Act
+    for snapshot in (SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER, SAMPLE_RESULTS):
+        assert sut.put(snapshot)
+    await sut.close()
+
+    # Assert
+    assert db_mock.inserted_batches == [
+        [SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER], [SAMPLE_RESULTS]]
+    assert not sut.put(SAMPLE_RESULTS)
+
+
+@pytest.mark.asyncio
+async def test_queued_snapshots_are_stored_once_the_flush_interval_elapses():
+    # Arrange
+    db_mock = DatabaseMock()
+    sut = SnapshotWriteQueue(db_mock, batch_size=10, flush_interval_seconds=0.01)
+
+    # Act
+    sut.put(SAMPLE_RESULTS)
+    while len(db_mock.inserted_batches) == 0:
+        await asyncio.sleep(0.01)
+
+    # Assert
+    assert db_mock.inserted_batches == [[SAMPLE_RESULTS]]
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried(monkeypatch):
+    # Arrange
+    monkeypatch.setattr(write_queue, "WRITE_RETRY_BACKOFF_SECONDS", 0)
+    db_mock = DatabaseMock(num_insert_failures=2)
+    sut = SnapshotWriteQueue(db_mock, flush_interval_seconds=0, max_retries=2)
+
+    # Act
+    sut.put(SAMPLE_RESULTS)
+    await sut.close()
+
+    # Assert
+    assert db_mock.inserted_batches == [[SAMPLE_RESULTS]]
+
+
+@pytest.mark.asyncio
+async def test_snapshots_are_dropped_if_the_queue_is_full():
+    # Arrange
+    db_mock = DatabaseMock()
+    sut = SnapshotWriteQueue(db_mock, capacity=1, flush_interval_seconds=0)
+
+    # Act
+    results = [sut.put(SAMPLE_RESULTS), sut.put(SAMPLE_RESULTS_LONG_AFTER)]
+    await sut.close()
+
+    # Assert
+    assert results == [True, False]
+    assert db_mock.inserted_batches == [[SAMPLE_RESULTS]]
@@ -1,6 +1,7 @@
 from datetime import datetime
+from typing import AsyncIterator
 
-from app.models.models import CryptoEntry
+from app.models.models import CryptoEntry, ResolvedSnapshot, Resolution, Snapshot
 from app.models.errors import UnavailableTime
 
 from tests.services.time_service_mock import SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER
@@ -41,11 +42,48 @@ rank,symbol,price_USD,timestamp
 
 class CoinResolverMock:
     results: list[CryptoEntry] | None
+    num_fetches: int
+    num_resolutions: int
 
     def __init__(self, results: list[CryptoEntry] | None = None):
         self.results = results
+        self.num_fetches = 0
+        self.num_resolutions = 0
 
     async def fetch_top_coins(self, limit: int, timestamp: datetime | None) -> list[CryptoEntry]:
+        return (await self.fetch_top_snapshot(limit, timestamp)).top(limit)
+
+    async def fetch_top_snapshot(self, limit: int, timestamp: datetime | None,
+                                 resolved_snapshot: ResolvedSnapshot | None = None) -> Snapshot:
+        self.num_fetches += 1
         if self.results is None:
             raise UnavailableTime
-        return self.results
+        return Snapshot(self.results)
+
+    async def resolve_snapshot(self, timestamp: datetime | None) -> ResolvedSnapshot | None:
+        self.num_resolutions += 1
+        if self.results is None:
+            if timestamp is None:
+                return None
+            raise UnavailableTime
+        # Historical results are final, as if they were taken long before the requested time
+        return ResolvedSnapshot(Snapshot(self.results).timestamp, Resolution.RAW, timestamp is not None)
+
+    async def fetch_top_snapshots_in_range(self, limit: int, start: datetime, end: datetime, step_seconds: int) -> list[Snapshot]:
+        self.num_fetches += 1
+        if self.results is None:
+            return []
+        return [Snapshot(self.results)]
+
+    async def fetch_symbol_history(self, name: str, start: datetime, end: datetime, bucket_seconds: int | None = None) -> list[CryptoEntry]:
+        self.num_fetches += 1
+        if self.results is None:
+            return []
+        return [entry for entry in self.results if entry.name == name]
+
+    async def stream_top_coins_in_range(self, limit: int, start: datetime, end: datetime, step_seconds: int) -> AsyncIterator[list[CryptoEntry]]:
+        self.num_fetches += 1
+        if self.results is not None:
+            # One batch per entry, to exercise the separators between batches
+            for entry in self.results:
+                yield [entry]
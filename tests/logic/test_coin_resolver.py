@@ -3,11 +3,18 @@ import asyncio
 from datetime import datetime, timedelta
 
 from app.logic.coin_resolver import CoinResolver, CURRENT_SEARCH_SECONDS_RANGE, HISTORICAL_SEARCH_SECONDS_RANGE
-from app.models.models import CryptoEntry
+from app.models.models import CryptoEntry, OutputFormat, Resolution
 from app.models.errors import UnavailableTime
 
+from app.db.sqlite_database import SQLiteDatabase
+from app.db.indexed_storage import IndexedStorage
+from app.db.write_queue import SnapshotWriteQueue
+from app.logic.historical_cache import HistoricalCache, TIMESTAMP_ENTRY_SIZE
+from app.logic.snapshot_compactor import build_rollup
+from app.services.metrics import SNAPSHOT_REFRESHES, SNAPSHOT_COALESCED_REFRESHES
+
 from tests.db.database_mock import DatabaseMock
-from tests.services.coin_market_cap_mock import CoinMarketCapMock, SAMPLE_COIN_PRICES, SAMPLE_COIN_PRICES_LATER
+from tests.services.coin_market_cap_mock import CoinMarketCapMock, SAMPLE_COIN_LISTINGS, SAMPLE_COIN_LISTINGS_LATER
 from tests.services.crypto_compare_mock import CryptoCompareMock, SAMPLE_TOP_CRYPTO, SAMPLE_TOP_CRYPTO_LATER
 from tests.services.time_service_mock import TimeServiceMock
 from tests.services.time_service_mock import SAMPLE_TIME, SAMPLE_TIME_SHORTLY_AFTER, SAMPLE_TIME_LONG_AFTER
@@ -19,7 +26,7 @@ from tests.logic.coin_resolver_mock import SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_A
 async def test_current_fetch_for_top_coins_retrieves_data_from_API_services():
     # Arrange
     db_mock = DatabaseMock()
-    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_PRICES)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
     crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
 
@@ -34,18 +41,20 @@ async def test_current_fetch_for_top_coins_retrieves_data_from_API_services():
     assert db_mock.num_historical_data_fetches == 0
     assert coin_market_cap_mock.num_invocations == 1
     assert crypto_compare_mock.num_invocations == 1
+    await sut.close()
 
 
 @pytest.mark.asyncio
 async def test_current_fetch_for_top_coins_shortly_after_a_previous_fetch_returns_cached_data():
     # Arrange
     db_mock = DatabaseMock()
-    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_PRICES)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
     crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
 
     sut = CoinResolver(db_mock, coin_market_cap_mock,
-                       crypto_compare_mock, time_service_mock)
+                       crypto_compare_mock, time_service_mock,
+                       write_queue=SnapshotWriteQueue(db_mock, flush_interval_seconds=0))
 
     # Act and assert
     results = await sut.fetch_top_coins(2, None)
@@ -62,16 +71,41 @@ async def test_current_fetch_for_top_coins_shortly_after_a_previous_fetch_return
     time_service_mock.time = SAMPLE_TIME_SHORTLY_AFTER
     results = await sut.fetch_top_coins(2, None)
     assert SAMPLE_RESULTS == results
-    assert db_mock.num_historical_data_fetches == 1
+    assert db_mock.num_historical_data_fetches == 0
     assert coin_market_cap_mock.num_invocations == 1
     assert crypto_compare_mock.num_invocations == 1
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_current_fetch_for_top_coins_retrieves_recent_data_stored_by_another_instance_from_database_once():
+    # Arrange
+    db_mock = DatabaseMock(SAMPLE_TIME, SAMPLE_RESULTS)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME_SHORTLY_AFTER)
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act and assert
+    results = await sut.fetch_top_coins(2, None)
+    assert SAMPLE_RESULTS == results
+    assert db_mock.num_historical_data_fetches == 1
+    assert coin_market_cap_mock.num_invocations == 0
+
+    # Act and assert
+    results = await sut.fetch_top_coins(1, None)
+    assert SAMPLE_RESULTS[:1] == results
+    assert db_mock.num_historical_data_fetches == 1
+    assert coin_market_cap_mock.num_invocations == 0
 
 
 @pytest.mark.asyncio
 async def test_current_fetch_for_top_coins_long_after_a_previous_fetch_retrieves_data_from_API_services_again():
     # Arrange
     db_mock = DatabaseMock()
-    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_PRICES)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
     crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
 
@@ -87,20 +121,115 @@ async def test_current_fetch_for_top_coins_long_after_a_previous_fetch_retrieves
 
     # Act and assert
     time_service_mock.time = SAMPLE_TIME_LONG_AFTER
-    coin_market_cap_mock.coin_prices = SAMPLE_COIN_PRICES_LATER
+    coin_market_cap_mock.coin_listings = SAMPLE_COIN_LISTINGS_LATER
     crypto_compare_mock.top_crypto_list = SAMPLE_TOP_CRYPTO_LATER
     results = await sut.fetch_top_coins(2, None)
     assert SAMPLE_RESULTS_LONG_AFTER == results
     assert db_mock.num_historical_data_fetches == 0
     assert coin_market_cap_mock.num_invocations == 2
     assert crypto_compare_mock.num_invocations == 2
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_current_fetches_for_top_coins_share_a_single_refresh_from_API_services():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+    num_refreshes = SNAPSHOT_REFRESHES.values.get((), 0)
+    num_coalesced_refreshes = SNAPSHOT_COALESCED_REFRESHES.values.get((), 0)
+
+    # Act
+    results = await asyncio.gather(*[sut.fetch_top_coins(2, None) for _ in range(3)])
+
+    # Assert
+    assert all(SAMPLE_RESULTS == result for result in results)
+    assert coin_market_cap_mock.num_invocations == 1
+    assert crypto_compare_mock.num_invocations == 1
+    assert SNAPSHOT_REFRESHES.values[()] - num_refreshes == 1
+    assert SNAPSHOT_COALESCED_REFRESHES.values[()] - \
+        num_coalesced_refreshes == 2
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_current_fetch_for_top_coins_within_max_staleness_returns_stale_data_and_refreshes_in_background():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock,
+                       max_staleness_seconds=CURRENT_SEARCH_SECONDS_RANGE * 2)
+
+    # Act and assert
+    results = await sut.fetch_top_coins(2, None)
+    assert SAMPLE_RESULTS == results
+    assert coin_market_cap_mock.num_invocations == 1
+
+    # Act and assert
+    time_service_mock.time = SAMPLE_TIME_LONG_AFTER
+    coin_market_cap_mock.coin_listings = SAMPLE_COIN_LISTINGS_LATER
+    crypto_compare_mock.top_crypto_list = SAMPLE_TOP_CRYPTO_LATER
+    results = await sut.fetch_top_coins(2, None)
+    assert SAMPLE_RESULTS == results
+
+    # Wait until background refresh is done
+    while len(sut.background_refresh_tasks) > 0:
+        await asyncio.sleep(0.01)
+
+    # Act and assert
+    results = await sut.fetch_top_coins(2, None)
+    assert SAMPLE_RESULTS_LONG_AFTER == results
+    assert coin_market_cap_mock.num_invocations == 2
+    assert crypto_compare_mock.num_invocations == 2
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_resolved_stale_snapshots_are_fetched_without_starting_more_than_one_background_refresh():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock,
+                       max_staleness_seconds=CURRENT_SEARCH_SECONDS_RANGE * 2)
+    await sut.fetch_top_coins(2, None)
+    time_service_mock.time = SAMPLE_TIME_LONG_AFTER
+    num_refreshes = SNAPSHOT_REFRESHES.values.get((), 0)
+    num_coalesced_refreshes = SNAPSHOT_COALESCED_REFRESHES.values.get((), 0)
+
+    # Act
+    results = []
+    for _ in range(2):
+        resolved_snapshot = await sut.resolve_snapshot(None)
+        results.append(await sut.fetch_top_snapshot(2, None, resolved_snapshot))
+    while len(sut.background_refresh_tasks) > 0:
+        await asyncio.sleep(0.01)
+
+    # Assert
+    assert [snapshot.top(2) for snapshot in results] == [SAMPLE_RESULTS, SAMPLE_RESULTS]
+    assert coin_market_cap_mock.num_invocations == 2
+    assert SNAPSHOT_REFRESHES.values[()] - num_refreshes == 1
+    assert SNAPSHOT_COALESCED_REFRESHES.values.get((), 0) - num_coalesced_refreshes == 0
+    await sut.close()
 
 
 @pytest.mark.asyncio
 async def test_historical_fetch_for_top_coins_retrieves_data_from_database_if_exact_timestamp_is_found():
     # Arrange
     db_mock = DatabaseMock(SAMPLE_TIME, SAMPLE_RESULTS)
-    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_PRICES)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
     crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
 
@@ -121,7 +250,7 @@ async def test_historical_fetch_for_top_coins_retrieves_data_from_database_if_ex
 async def test_historical_fetch_for_top_coins_retrieves_data_from_database_if_timestamp_within_range_is_found():
     # Arrange
     db_mock = DatabaseMock(SAMPLE_TIME, SAMPLE_RESULTS)
-    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_PRICES)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
     crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
 
@@ -142,7 +271,7 @@ async def test_historical_fetch_for_top_coins_retrieves_data_from_database_if_ti
 async def test_historical_fetch_for_top_coins_raises_error_if_timestamp_within_range_is_not_found():
     # Arrange
     db_mock = DatabaseMock(SAMPLE_TIME, SAMPLE_RESULTS)
-    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_PRICES)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
     crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
 
@@ -158,7 +287,7 @@ async def test_historical_fetch_for_top_coins_raises_error_if_timestamp_within_r
 async def test_fetch_for_top_coins_returns_number_of_results_given_in_limit():
     # Arrange
     db_mock = DatabaseMock()
-    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_PRICES)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
     crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
     time_service_mock = TimeServiceMock(SAMPLE_TIME)
 
@@ -173,3 +302,384 @@ async def test_fetch_for_top_coins_returns_number_of_results_given_in_limit():
     assert db_mock.num_historical_data_fetches == 0
     assert coin_market_cap_mock.num_invocations == 1
     assert crypto_compare_mock.num_invocations == 1
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_range_fetch_for_top_coins_retrieves_distinct_closest_snapshots_from_database():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS])
+    await db.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME_LONG_AFTER)
+
+    sut = CoinResolver(db, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    snapshots = await sut.fetch_top_snapshots_in_range(
+        1, SAMPLE_TIME - timedelta(minutes=2), SAMPLE_TIME_LONG_AFTER, 20)
+    await db.close()
+
+    # Assert
+    assert [snapshot.entries for snapshot in snapshots] == [
+        SAMPLE_RESULTS[:1], SAMPLE_RESULTS_LONG_AFTER[:1]]
+    assert coin_market_cap_mock.num_invocations == 0
+
+
+@pytest.mark.asyncio
+async def test_range_stream_for_top_coins_yields_batches_of_closest_snapshots():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS])
+    await db.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME_LONG_AFTER)
+
+    sut = CoinResolver(db, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    batches = [batch async for batch in sut.stream_top_coins_in_range(
+        1, SAMPLE_TIME - timedelta(minutes=2), SAMPLE_TIME_LONG_AFTER, 20, batch_size=1)]
+    await db.close()
+
+    # Assert
+    assert batches == [SAMPLE_RESULTS[:1], SAMPLE_RESULTS_LONG_AFTER[:1]]
+    assert coin_market_cap_mock.num_invocations == 0
+
+
+@pytest.mark.asyncio
+async def test_symbol_history_is_downsampled_to_last_price_per_bucket():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS])
+    await db.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME_LONG_AFTER)
+
+    sut = CoinResolver(db, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    raw_results = await sut.fetch_symbol_history("BTC", SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER)
+    downsampled_results = await sut.fetch_symbol_history(
+        "BTC", SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER, HISTORICAL_SEARCH_SECONDS_RANGE)
+    await db.close()
+
+    # Assert
+    assert raw_results == [SAMPLE_RESULTS[0], SAMPLE_RESULTS_LONG_AFTER[1]]
+    assert downsampled_results == [SAMPLE_RESULTS_LONG_AFTER[1]]
+
+
+@pytest.mark.asyncio
+async def test_fetch_for_current_data_skips_unmatched_coins_without_rank_gaps():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(
+        [("DOGE", "Dogecoin")] + SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    results = await sut.fetch_top_coins(10, None)
+
+    # Assert
+    assert results == SAMPLE_RESULTS
+    assert sut.symbol_table.unmatched == {"DOGE": "Dogecoin"}
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_historical_fetches_for_top_coins_within_the_same_bucket_retrieve_data_from_database_once():
+    # Arrange
+    db_mock = DatabaseMock(SAMPLE_TIME, SAMPLE_RESULTS)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(
+        SAMPLE_TIME + timedelta(seconds=HISTORICAL_SEARCH_SECONDS_RANGE))
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    results = await sut.fetch_top_coins(2, SAMPLE_TIME)
+    results_within_bucket = await sut.fetch_top_coins(2, SAMPLE_TIME + timedelta(seconds=10))
+
+    # Assert
+    assert SAMPLE_RESULTS == results
+    assert SAMPLE_RESULTS == results_within_bucket
+    assert db_mock.num_historical_data_fetches == 1
+    assert sut.historical_cache.lru.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_historical_fetches_for_top_coins_share_the_cached_rendered_snapshot():
+    # Arrange
+    db_mock = DatabaseMock(SAMPLE_TIME, SAMPLE_RESULTS)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(
+        SAMPLE_TIME + timedelta(seconds=HISTORICAL_SEARCH_SECONDS_RANGE))
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    results = await sut.fetch_top_snapshot(2, SAMPLE_TIME)
+    rendered_output = results.rendered_output(OutputFormat.JSON)
+    results_again = await sut.fetch_top_snapshot(10, SAMPLE_TIME)
+
+    # Assert
+    assert results_again is results
+    assert results_again.rendered_output(OutputFormat.JSON) is rendered_output
+    assert db_mock.num_historical_data_fetches == 1
+
+
+@pytest.mark.asyncio
+async def test_historical_fetch_for_top_coins_at_the_edge_of_the_newest_window_finds_newer_snapshots():
+    # Arrange
+    reference = SAMPLE_TIME + timedelta(seconds=2 * CURRENT_SEARCH_SECONDS_RANGE)
+    db_mock = DatabaseMock(SAMPLE_TIME, SAMPLE_RESULTS)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(reference + timedelta(seconds=10))
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    results = await sut.fetch_top_coins(2, reference)
+    await db_mock.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    results_after_insertion = await sut.fetch_top_coins(2, reference)
+
+    # Assert
+    assert SAMPLE_RESULTS == results
+    assert SAMPLE_RESULTS_LONG_AFTER == results_after_insertion
+
+
+@pytest.mark.asyncio
+async def test_historical_resolution_is_final_once_newer_snapshots_cant_be_closer():
+    # Arrange
+    reference = SAMPLE_TIME + timedelta(seconds=2 * CURRENT_SEARCH_SECONDS_RANGE)
+    db_mock = DatabaseMock(SAMPLE_TIME, SAMPLE_RESULTS)
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(reference + timedelta(seconds=10))
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    resolved_snapshot = await sut.resolve_snapshot(reference)
+    time_service_mock.time = SAMPLE_TIME + \
+        timedelta(seconds=HISTORICAL_SEARCH_SECONDS_RANGE)
+    final_resolved_snapshot = await sut.resolve_snapshot(reference)
+    results = await sut.fetch_top_snapshot(2, reference, final_resolved_snapshot)
+
+    # Assert
+    assert resolved_snapshot is not None and not resolved_snapshot.is_final
+    assert final_resolved_snapshot is not None and final_resolved_snapshot.is_final
+    assert final_resolved_snapshot.timestamp == SAMPLE_TIME
+    assert SAMPLE_RESULTS == results.top(2)
+    assert db_mock.num_historical_data_fetches == 1
+
+
+@pytest.mark.asyncio
+async def test_historical_fetches_for_top_coins_resolve_the_closest_snapshot_to_the_requested_time_within_a_bucket():
+    # Arrange
+    earlier_entries = [CryptoEntry(entry.name, entry.value, entry.rank, SAMPLE_TIME - timedelta(seconds=2))
+                       for entry in SAMPLE_RESULTS]
+    later_entries = [CryptoEntry(entry.name, entry.value, entry.rank, SAMPLE_TIME + timedelta(seconds=60))
+                     for entry in SAMPLE_RESULTS_LONG_AFTER]
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([earlier_entries])
+    await db.insert_snapshots([later_entries])
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(
+        SAMPLE_TIME + timedelta(seconds=HISTORICAL_SEARCH_SECONDS_RANGE))
+
+    sut = CoinResolver(db, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    results_at_end_of_bucket = await sut.fetch_top_coins(2, SAMPLE_TIME + timedelta(seconds=59))
+    results_at_start_of_bucket = await sut.fetch_top_coins(2, SAMPLE_TIME + timedelta(seconds=1))
+    await sut.close()
+
+    # Assert
+    assert results_at_end_of_bucket == later_entries
+    assert results_at_start_of_bucket == earlier_entries
+    assert len(sut.historical_cache.lru) == 2
+
+
+@pytest.mark.asyncio
+async def test_historical_fetch_for_top_coins_falls_back_to_rollup_once_a_cached_raw_snapshot_is_deleted():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS])
+    await db.insert_rollup(Resolution.HOURLY, build_rollup(SAMPLE_RESULTS))
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(
+        SAMPLE_TIME + timedelta(seconds=HISTORICAL_SEARCH_SECONDS_RANGE))
+    # Only timestamp resolutions fit in the cache, so entries are always read from the database
+    historical_cache = HistoricalCache(max_bytes=TIMESTAMP_ENTRY_SIZE)
+
+    sut = CoinResolver(db, coin_market_cap_mock, crypto_compare_mock, time_service_mock,
+                       historical_cache=historical_cache)
+
+    # Act
+    results = await sut.fetch_top_coins(2, SAMPLE_TIME)
+    await db.delete_snapshots_before(SAMPLE_TIME + timedelta(seconds=1))
+    results_after_deletion = await sut.fetch_top_coins(2, SAMPLE_TIME)
+    resolved_snapshot = await sut.resolve_snapshot(SAMPLE_TIME)
+    await sut.close()
+
+    # Assert
+    assert SAMPLE_RESULTS == results
+    assert SAMPLE_RESULTS == results_after_deletion
+    assert resolved_snapshot is not None and resolved_snapshot.resolution == Resolution.HOURLY
+
+
+@pytest.mark.asyncio
+async def test_current_fetch_for_top_coins_from_fallback_responses_is_dated_by_their_age_and_not_stored():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS, age_seconds=120)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    results = await sut.fetch_top_coins(2, None)
+    await sut.close()
+
+    # Assert
+    assert [entry.timestamp for entry in results] == [SAMPLE_TIME - timedelta(seconds=120)] * 2
+    assert db_mock.inserted_batches == []
+
+
+@pytest.mark.asyncio
+async def test_current_fetches_for_top_coins_from_fallback_responses_retrieve_data_from_API_services_once_per_TTL():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS, age_seconds=120)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+
+    sut = CoinResolver(db_mock, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act and assert
+    for seconds in range(5):
+        time_service_mock.time = SAMPLE_TIME + timedelta(seconds=seconds)
+        await sut.fetch_top_coins(2, None)
+    assert coin_market_cap_mock.num_invocations == 1
+    assert crypto_compare_mock.num_invocations == 1
+
+    # Act and assert
+    time_service_mock.time = SAMPLE_TIME + timedelta(seconds=CURRENT_SEARCH_SECONDS_RANGE)
+    await sut.fetch_top_coins(2, None)
+    assert coin_market_cap_mock.num_invocations == 2
+    assert crypto_compare_mock.num_invocations == 2
+    await sut.close()
+
+
+@pytest.mark.asyncio
+async def test_historical_fetch_for_top_coins_falls_back_to_rollup_once_raw_snapshots_are_deleted_by_another_instance():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    snapshots = [[CryptoEntry(entry.name, entry.value, entry.rank, SAMPLE_TIME + timedelta(minutes=minute))
+                  for entry in SAMPLE_RESULTS] for minute in range(60)]
+    await db.insert_snapshots(snapshots)
+    await db.insert_rollup(Resolution.HOURLY, build_rollup([entry for snapshot in snapshots for entry in snapshot]))
+    time_service_mock = TimeServiceMock(
+        SAMPLE_TIME + timedelta(seconds=HISTORICAL_SEARCH_SECONDS_RANGE))
+    indexed_storage = IndexedStorage(db, time_service_mock)
+    await indexed_storage.initialize()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+
+    sut = CoinResolver(indexed_storage, coin_market_cap_mock, crypto_compare_mock, time_service_mock)
+
+    # Act
+    await db.delete_snapshots_before(SAMPLE_TIME + timedelta(hours=1))
+    results = await sut.fetch_top_coins(10, SAMPLE_TIME + timedelta(minutes=30))
+    await sut.close()
+
+    # Assert
+    assert snapshots[-1] == results
+
+
+@pytest.mark.asyncio
+async def test_range_fetch_for_top_coins_falls_back_to_rollups_once_raw_snapshots_are_deleted():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    snapshots = [[CryptoEntry(entry.name, entry.value, entry.rank, SAMPLE_TIME + timedelta(minutes=minute))
+                  for entry in SAMPLE_RESULTS] for minute in range(60)]
+    later_snapshot = [CryptoEntry(entry.name, entry.value, entry.rank, SAMPLE_TIME + timedelta(days=2))
+                      for entry in SAMPLE_RESULTS_LONG_AFTER]
+    await db.insert_snapshots(snapshots + [later_snapshot])
+    await db.insert_rollup(Resolution.HOURLY, build_rollup([entry for snapshot in snapshots for entry in snapshot]))
+    await db.delete_snapshots_before(SAMPLE_TIME + timedelta(days=1))
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME + timedelta(days=2))
+
+    sut = CoinResolver(db, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    snapshots_in_range = await sut.fetch_top_snapshots_in_range(
+        1, SAMPLE_TIME, SAMPLE_TIME + timedelta(days=2), HISTORICAL_SEARCH_SECONDS_RANGE)
+    batches = [batch async for batch in sut.stream_top_coins_in_range(
+        1, SAMPLE_TIME, SAMPLE_TIME + timedelta(days=2), HISTORICAL_SEARCH_SECONDS_RANGE, batch_size=1)]
+    await db.close()
+
+    # Assert
+    assert [snapshot.entries for snapshot in snapshots_in_range] == [snapshots[-1][:1], later_snapshot[:1]]
+    assert batches == [snapshots[-1][:1], later_snapshot[:1]]
+
+
+@pytest.mark.asyncio
+async def test_symbol_history_falls_back_to_rollups_before_the_earliest_raw_snapshot():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    days = [[[CryptoEntry(entry.name, entry.value, entry.rank, SAMPLE_TIME + timedelta(days=day, minutes=minute))
+              for entry in SAMPLE_RESULTS] for minute in range(60)] for day in range(3)]
+    await db.insert_snapshots([snapshot for snapshots in days for snapshot in snapshots])
+    await db.insert_rollup(Resolution.DAILY, build_rollup([entry for snapshot in days[0] for entry in snapshot]))
+    await db.insert_rollup(Resolution.HOURLY, build_rollup([entry for snapshot in days[1] for entry in snapshot]))
+    await db.delete_snapshots_before(SAMPLE_TIME + timedelta(days=2))
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME + timedelta(days=3))
+
+    sut = CoinResolver(db, coin_market_cap_mock,
+                       crypto_compare_mock, time_service_mock)
+
+    # Act
+    results = await sut.fetch_symbol_history("BTC", SAMPLE_TIME, SAMPLE_TIME + timedelta(days=2, minutes=1))
+    await db.close()
+
+    # Assert
+    assert results == [days[0][-1][0], days[1][-1][0], days[2][0][0], days[2][1][0]]
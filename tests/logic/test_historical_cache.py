@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+from app.logic.historical_cache import HistoricalCache, LRUCache
+from app.models.models import OutputFormat, Resolution, Snapshot
+
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS
+from tests.services.time_service_mock import SAMPLE_TIME
+
+
+def test_lru_cache_evicts_least_recently_used_values_beyond_max_size():
+    # Arrange
+    sut = LRUCache(max_bytes=100)
+    sut.put("a", 1, 40)
+    sut.put("b", 2, 40)
+    sut.get("a")
+
+    # Act
+    sut.put("c", 3, 40)
+
+    # Assert
+    assert sut.get("a") == 1
+    assert sut.get("b") is None
+    assert sut.get("c") == 3
+    assert sut.size_bytes == 80
+    assert sut.evictions == 1
+    assert sut.hit_rate == 3 / 4
+
+
+def test_lru_cache_skips_values_larger_than_max_size():
+    # Arrange
+    sut = LRUCache(max_bytes=100)
+    sut.put("a", 1, 40)
+
+    # Act
+    sut.put("b", 2, 101)
+
+    # Assert
+    assert sut.get("a") == 1
+    assert sut.get("b") is None
+    assert sut.size_bytes == 40
+
+
+def test_requested_times_are_cached_by_bucket():
+    # Arrange
+    sut = HistoricalCache(bucket_seconds=60)
+    sut.put_timestamp(sut.bucket(SAMPLE_TIME + timedelta(seconds=10)),
+                      (SAMPLE_TIME, Resolution.RAW))
+
+    # Act
+    results = sut.get_timestamp(sut.bucket(SAMPLE_TIME + timedelta(seconds=50)))
+    results_next_bucket = sut.get_timestamp(sut.bucket(SAMPLE_TIME + timedelta(seconds=60)))
+
+    # Assert
+    assert results == (SAMPLE_TIME, Resolution.RAW)
+    assert results_next_bucket is None
+
+
+def test_snapshots_are_cached_by_timestamp_and_resolution_and_sized_with_their_rendered_outputs():
+    # Arrange
+    sut = HistoricalCache()
+    snapshot = Snapshot(SAMPLE_RESULTS)
+    sut.put_snapshot(SAMPLE_TIME, Resolution.RAW, snapshot)
+    size_bytes = sut.lru.size_bytes
+    rendered_output = snapshot.rendered_output(OutputFormat.JSON)
+
+    # Act
+    results = sut.get_snapshot(SAMPLE_TIME, Resolution.RAW)
+    results_rollup = sut.get_snapshot(SAMPLE_TIME, Resolution.HOURLY)
+
+    # Assert
+    assert results is snapshot
+    assert results_rollup is None
+    assert sut.lru.size_bytes >= size_bytes + len(rendered_output.rows)
+
+
+def test_resolution_is_final_unless_new_snapshots_can_be_closer():
+    # Arrange
+    sut = HistoricalCache()
+    bucket = datetime(2023, 8, 11, tzinfo=timezone.utc)
+
+    # Act
+    results_far_from_now = sut.is_final_resolution(
+        bucket, bucket + timedelta(minutes=5), bucket + timedelta(days=1), 60)
+    results_close_to_now = sut.is_final_resolution(
+        bucket, bucket - timedelta(minutes=5), bucket + timedelta(minutes=5), 60)
+
+    # Assert
+    assert results_far_from_now
+    assert not results_close_to_now
@@ -0,0 +1,91 @@
+import pytest
+from datetime import timedelta
+
+from app.logic.coin_resolver import CoinResolver
+from app.logic.shared_snapshot_store import SharedSnapshotStore
+from app.models.models import OutputFormat, Snapshot
+
+from tests.db.database_mock import DatabaseMock
+from tests.services.coin_market_cap_mock import CoinMarketCapMock, SAMPLE_COIN_LISTINGS
+from tests.services.crypto_compare_mock import CryptoCompareMock, SAMPLE_TOP_CRYPTO
+from tests.services.time_service_mock import TimeServiceMock, SAMPLE_TIME, SAMPLE_TIME_SHORTLY_AFTER
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER
+
+
+def test_shared_snapshot_is_read_by_other_workers_as_views_over_the_store(tmp_path):
+    # Arrange
+    snapshot = Snapshot(SAMPLE_RESULTS)
+    SharedSnapshotStore(str(tmp_path / "snapshot")).write(snapshot)
+    sut = SharedSnapshotStore(str(tmp_path / "snapshot"))
+
+    # Act
+    results = sut.read()
+
+    # Assert
+    assert results.timestamp == SAMPLE_TIME
+    assert results.entries == SAMPLE_RESULTS
+    assert isinstance(results.rendered_output(OutputFormat.JSON).rows, memoryview)
+    for output_format in OutputFormat:
+        assert results.render(output_format, 1) == snapshot.render(output_format, 1)
+        assert results.render(output_format, 10) == snapshot.render(output_format, 10)
+
+
+def test_shared_snapshot_is_mapped_again_only_once_replaced(tmp_path):
+    # Arrange
+    writer = SharedSnapshotStore(str(tmp_path / "snapshot"))
+    writer.write(Snapshot(SAMPLE_RESULTS))
+    sut = SharedSnapshotStore(str(tmp_path / "snapshot"))
+    previous_snapshot = sut.read()
+    previous_output = previous_snapshot.render(OutputFormat.CSV, 10)
+
+    # Act
+    results_unchanged = sut.read()
+    writer.write(Snapshot(SAMPLE_RESULTS_LONG_AFTER))
+    results_replaced = sut.read()
+
+    # Assert
+    assert results_unchanged is previous_snapshot
+    assert results_replaced.entries == SAMPLE_RESULTS_LONG_AFTER
+    assert previous_snapshot.render(OutputFormat.CSV, 10) == previous_output
+
+
+@pytest.mark.asyncio
+async def test_only_one_worker_refreshes_from_API_services_with_a_shared_snapshot_store(tmp_path):
+    # Arrange
+    workers = []
+    for _ in range(3):
+        workers.append((CoinResolver(DatabaseMock(), CoinMarketCapMock(SAMPLE_COIN_LISTINGS),
+                                     CryptoCompareMock(SAMPLE_TOP_CRYPTO), TimeServiceMock(SAMPLE_TIME),
+                                     shared_snapshot_store=SharedSnapshotStore(str(tmp_path / "snapshot")))))
+
+    # Act
+    results = [await worker.fetch_top_coins(2, None) for worker in workers]
+
+    # Assert
+    assert results == [SAMPLE_RESULTS] * 3
+    assert [worker.coin_market_cap.num_invocations for worker in workers] == [1, 0, 0]
+    assert [worker.db.num_historical_data_fetches for worker in workers] == [0, 0, 0]
+    for worker in workers:
+        await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_other_workers_dont_refresh_a_shared_snapshot_of_fallback_responses_fetched_recently(tmp_path):
+    # Arrange
+    workers = []
+    for _ in range(3):
+        workers.append((CoinResolver(DatabaseMock(), CoinMarketCapMock(SAMPLE_COIN_LISTINGS, age_seconds=120),
+                                     CryptoCompareMock(SAMPLE_TOP_CRYPTO), TimeServiceMock(SAMPLE_TIME),
+                                     shared_snapshot_store=SharedSnapshotStore(str(tmp_path / "snapshot")))))
+    await workers[0].fetch_top_coins(2, None)
+
+    # Act
+    for worker in workers[1:]:
+        worker.time_service.time = SAMPLE_TIME_SHORTLY_AFTER
+        await worker.fetch_top_coins(2, None)
+
+    # Assert
+    assert [worker.coin_market_cap.num_invocations for worker in workers] == [1, 0, 0]
+    assert [worker.snapshot_cache.timestamp for worker in workers] == [SAMPLE_TIME - timedelta(seconds=120)] * 3
+    for worker in workers:
+        await worker.close()
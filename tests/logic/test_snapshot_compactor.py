@@ -0,0 +1,66 @@
+import pytest
+from datetime import timedelta
+
+from app.db.sqlite_database import SQLiteDatabase
+from app.logic.coin_resolver import CoinResolver
+from app.logic.snapshot_compactor import SnapshotCompactor, build_rollup
+from app.models.models import Resolution
+
+from tests.services.coin_market_cap_mock import CoinMarketCapMock, SAMPLE_COIN_LISTINGS
+from tests.services.crypto_compare_mock import CryptoCompareMock, SAMPLE_TOP_CRYPTO
+from tests.services.time_service_mock import TimeServiceMock, SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS, SAMPLE_RESULTS_LONG_AFTER
+
+
+def test_rollup_holds_last_snapshot_with_value_statistics():
+    # Act
+    results = build_rollup(SAMPLE_RESULTS + SAMPLE_RESULTS_LONG_AFTER)
+
+    # Assert
+    assert [(entry.name, entry.value, entry.rank, entry.timestamp) for entry in results] == [
+        (entry.name, entry.value, entry.rank, entry.timestamp) for entry in SAMPLE_RESULTS_LONG_AFTER]
+    assert results[1].min_value == SAMPLE_RESULTS_LONG_AFTER[1].value
+    assert results[1].max_value == SAMPLE_RESULTS[0].value
+    assert results[1].mean_value == (SAMPLE_RESULTS[0].value + SAMPLE_RESULTS_LONG_AFTER[1].value) / 2
+
+
+@pytest.mark.asyncio
+async def test_compaction_rolls_up_complete_buckets_only():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS])
+    await db.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    sut = SnapshotCompactor(db, TimeServiceMock(SAMPLE_TIME + timedelta(hours=1)))
+
+    # Act
+    await sut.compact()
+    await sut.compact()
+
+    # Assert
+    assert await db.get_latest_timestamp(Resolution.HOURLY) == SAMPLE_TIME_LONG_AFTER
+    assert await db.get_latest_timestamp(Resolution.DAILY) is None
+    assert await db.get_latest_timestamp(Resolution.RAW) == SAMPLE_TIME_LONG_AFTER
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_historical_query_is_served_from_rollups_after_raw_snapshots_expire():
+    # Arrange
+    db = SQLiteDatabase(":memory:")
+    await db.initialize()
+    await db.insert_snapshots([SAMPLE_RESULTS])
+    await db.insert_snapshots([SAMPLE_RESULTS_LONG_AFTER])
+    time_service_mock = TimeServiceMock(SAMPLE_TIME + timedelta(days=2))
+    sut = SnapshotCompactor(db, time_service_mock, retention_days=1)
+    coin_resolver = CoinResolver(db, CoinMarketCapMock(SAMPLE_COIN_LISTINGS),
+                                 CryptoCompareMock(SAMPLE_TOP_CRYPTO), time_service_mock)
+
+    # Act
+    await sut.compact()
+    results = await coin_resolver.fetch_top_coins(10, SAMPLE_TIME)
+
+    # Assert
+    assert await db.get_latest_timestamp(Resolution.RAW) is None
+    assert results == SAMPLE_RESULTS_LONG_AFTER
+    await db.close()
@@ -0,0 +1,91 @@
+import pytest
+import asyncio
+
+from app.logic.coin_resolver import CoinResolver
+from app.logic.snapshot_scheduler import SnapshotScheduler
+from app.services.metrics import SNAPSHOT_REFRESHES
+
+from tests.db.database_mock import DatabaseMock
+from tests.services.coin_market_cap_mock import CoinMarketCapMock, SAMPLE_COIN_LISTINGS
+from tests.services.crypto_compare_mock import CryptoCompareMock, SAMPLE_TOP_CRYPTO
+from tests.services.time_service_mock import TimeServiceMock, SAMPLE_TIME, SAMPLE_TIME_LONG_AFTER
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS
+
+
+@pytest.mark.asyncio
+async def test_scheduler_refreshes_snapshots_in_the_background():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    coin_resolver = CoinResolver(db_mock, coin_market_cap_mock,
+                                 crypto_compare_mock, time_service_mock)
+    sut = SnapshotScheduler(coin_resolver, 0.01, jitter_seconds=0)
+    num_refreshes = SNAPSHOT_REFRESHES.values.get((), 0)
+
+    # Act
+    sut.start()
+    while coin_market_cap_mock.num_invocations < 2:
+        await asyncio.sleep(0.01)
+    await sut.stop()
+    await coin_resolver.close()
+
+    # Assert
+    assert sut.task is None
+    assert SNAPSHOT_REFRESHES.values[()] - num_refreshes >= 2
+    assert db_mock.historical_data == SAMPLE_RESULTS
+
+
+@pytest.mark.asyncio
+async def test_current_fetch_for_top_coins_with_scheduler_returns_latest_snapshot_without_API_services():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(SAMPLE_COIN_LISTINGS)
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    coin_resolver = CoinResolver(db_mock, coin_market_cap_mock,
+                                 crypto_compare_mock, time_service_mock)
+    sut = SnapshotScheduler(coin_resolver, 60, jitter_seconds=0)
+
+    # Act
+    sut.start()
+    while coin_resolver.snapshot_cache.timestamp is None:
+        await asyncio.sleep(0.01)
+    time_service_mock.time = SAMPLE_TIME_LONG_AFTER
+    results = await coin_resolver.fetch_top_coins(2, None)
+    await sut.stop()
+
+    # Assert
+    assert SAMPLE_RESULTS == results
+    assert coin_market_cap_mock.num_invocations == 1
+    await coin_resolver.close()
+
+
+@pytest.mark.asyncio
+async def test_scheduler_backs_off_on_consecutive_failures():
+    # Arrange
+    db_mock = DatabaseMock()
+    coin_market_cap_mock = CoinMarketCapMock(error=RuntimeError("upstream"))
+    crypto_compare_mock = CryptoCompareMock(SAMPLE_TOP_CRYPTO)
+    time_service_mock = TimeServiceMock(SAMPLE_TIME)
+    coin_resolver = CoinResolver(db_mock, coin_market_cap_mock,
+                                 crypto_compare_mock, time_service_mock)
+    sut = SnapshotScheduler(coin_resolver, 10, jitter_seconds=0,
+                            max_backoff_seconds=25)
+
+    # Act and assert
+    assert sut._next_delay() == 10
+    sut.num_consecutive_failures = 1
+    assert sut._next_delay() == 10
+    sut.num_consecutive_failures = 2
+    assert sut._next_delay() == 20
+    sut.num_consecutive_failures = 3
+    assert sut._next_delay() == 25
+
+    sut.num_consecutive_failures = 0
+    sut.start()
+    while sut.num_consecutive_failures < 1:
+        await asyncio.sleep(0.01)
+    await sut.stop()
+    assert db_mock.historical_data == []
@@ -0,0 +1,57 @@
+import json
+import os
+
+from app.logic.symbol_table import SymbolTable
+
+from tests.services.coin_market_cap_mock import SAMPLE_COIN_LISTINGS
+
+SAMPLE_TOP_CRYPTO_WITH_ALIASES = [
+    ("XBT", "Bitcoin"), ("ETHER", "Ether"), ("DOGE", "Dogecoin")]
+
+
+def test_merge_matches_by_symbol_then_name_and_reports_unmatched():
+    # Arrange
+    sut = SymbolTable()
+    sut.aliases["Ether"] = "ETH"
+
+    # Act
+    results = sut.merge(SAMPLE_COIN_LISTINGS, SAMPLE_TOP_CRYPTO_WITH_ALIASES)
+
+    # Assert
+    assert results == [("XBT", SAMPLE_COIN_LISTINGS[0][2]), ("ETHER", SAMPLE_COIN_LISTINGS[1][2])]
+    assert sut.unmatched == {"DOGE": "Dogecoin"}
+    assert sut.names["Ethereum"] == "ETH"
+
+
+def test_table_is_persisted_with_known_aliases(tmp_path):
+    # Arrange
+    path = str(tmp_path / "symbol_table.json")
+    with open(path, "w") as table_file:
+        json.dump({"aliases": {"DOGE": "XDG"}}, table_file)
+    sut = SymbolTable(path)
+
+    # Act
+    sut.merge(SAMPLE_COIN_LISTINGS + [("XDG", "Dogecoin", 0.07)], SAMPLE_TOP_CRYPTO_WITH_ALIASES)
+    sut.save()
+    results = SymbolTable(path)
+
+    # Assert
+    assert results.aliases["DOGE"] == "XDG"
+    assert results.names["Bitcoin"] == "BTC"
+    assert results.unmatched == {"ETHER": "Ether"}
+    assert not sut.is_modified
+    assert os.listdir(tmp_path) == ["symbol_table.json"]
+
+
+def test_listed_symbols_take_precedence_over_names_of_other_listings():
+    # Arrange
+    sut = SymbolTable()
+    # The name of an earlier listing is the symbol of a later one
+    coin_listings = [("NEON", "NEO", 1.0), ("NEO", "Neo", 8.0)]
+
+    # Act
+    results = sut.merge(coin_listings, [("NEO", "Neo"), ("NEON", "Neon EVM")])
+
+    # Assert
+    assert results == [("NEO", 8.0), ("NEON", 1.0)]
+    assert sut.names == {"NEO": "NEON", "Neo": "NEO"}
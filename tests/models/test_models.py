@@ -0,0 +1,35 @@
+import json
+
+from app.models.models import OutputFormat, Snapshot
+
+from tests.logic.coin_resolver_mock import SAMPLE_RESULTS, SAMPLE_RESULTS_JSON, SAMPLE_RESULTS_CSV
+
+
+def test_snapshot_renders_json_slices_without_serializing_again():
+    # Arrange
+    sut = Snapshot(SAMPLE_RESULTS)
+
+    # Act and assert
+    assert json.loads(sut.render(OutputFormat.JSON, 10)) == json.loads(SAMPLE_RESULTS_JSON)
+    assert json.loads(sut.render(OutputFormat.JSON, 1)) == json.loads(SAMPLE_RESULTS_JSON)[:1]
+    assert sut.render(OutputFormat.JSON, 0) == b"[]"
+    assert len(sut.rendered_outputs) == 1
+
+
+def test_snapshot_renders_csv_slices():
+    # Arrange
+    sut = Snapshot(SAMPLE_RESULTS)
+
+    # Act and assert
+    assert sut.render(OutputFormat.CSV, 10).decode() == SAMPLE_RESULTS_CSV
+    assert sut.render(OutputFormat.CSV, 1).decode() == "".join(SAMPLE_RESULTS_CSV.splitlines(keepends=True)[:2])
+
+
+def test_empty_snapshot_renders_empty_output():
+    # Arrange
+    sut = Snapshot([])
+
+    # Act and assert
+    assert sut.timestamp is None
+    assert sut.render(OutputFormat.JSON, 10) == b"[]"
+    assert sut.render(OutputFormat.CSV, 10) == OutputFormat.CSV.prefix
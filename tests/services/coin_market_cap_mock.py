@@ -1,15 +1,22 @@
-SAMPLE_COIN_PRICES = {"BTC": 29434.824505477198, "ETH": 1851.0382543598475}
-SAMPLE_COIN_PRICES_LATER = {"ETH": 2500, "BTC": 1800}
+SAMPLE_COIN_LISTINGS = [("BTC", "Bitcoin", 29434.824505477198),
+                        ("ETH", "Ethereum", 1851.0382543598475)]
+SAMPLE_COIN_LISTINGS_LATER = [("ETH", "Ethereum", 2500), ("BTC", "Bitcoin", 1800)]
 
 
 class CoinMarketCapMock:
-    coin_prices: dict[str, float]
+    coin_listings: list[tuple[str, str, float]]
+    error: Exception | None
+    age_seconds: float
     num_invocations: int
 
-    def __init__(self, coin_prices: dict[str, float] = {}):
-        self.coin_prices = coin_prices
+    def __init__(self, coin_listings: list[tuple[str, str, float]] = [], error: Exception | None = None, age_seconds: float = 0.0):
+        self.coin_listings = coin_listings
+        self.error = error
+        self.age_seconds = age_seconds
         self.num_invocations = 0
 
-    async def get_coin_prices(self) -> dict[str, float]:
+    async def get_coin_listings(self) -> tuple[list[tuple[str, str, float]], float]:
         self.num_invocations += 1
-        return self.coin_prices
+        if self.error is not None:
+            raise self.error
+        return self.coin_listings, self.age_seconds
@@ -10,6 +10,6 @@ class CryptoCompareMock:
         self.top_crypto_list = top_crypto_list
         self.num_invocations = 0
 
-    async def get_top_crypto_list(self) -> list[tuple[str, str]]:
+    async def get_top_crypto_list(self) -> tuple[list[tuple[str, str]], float]:
         self.num_invocations += 1
-        return self.top_crypto_list
+        return self.top_crypto_list, 0.0
@@ -0,0 +1,73 @@
+import pytest
+import asyncio
+import httpx
+
+from app.services.coin_market_cap import CoinMarketCap
+from app.services.crypto_compare import CryptoCompare
+from app.models.errors import UpstreamUnavailable
+
+SAMPLE_LISTINGS_RESPONSE = {"data": [
+    {"symbol": "BTC", "name": "Bitcoin", "quote": {
+        "USD": {"price": 29434.824505477198}}},
+    {"symbol": "ETH", "name": "Ethereum", "quote": {
+        "USD": {"price": 1851.0382543598475}}}
+]}
+SAMPLE_TOP_VOLUME_RESPONSE = {"Data": [
+    {"CoinInfo": {"Name": "BTC", "FullName": "Bitcoin"}},
+    {"CoinInfo": {"Name": "ETH", "FullName": "Ethereum"}}
+]}
+
+
+class ConcurrencyTracker:
+    in_flight: int
+    max_in_flight: int
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05)
+        self.in_flight -= 1
+        if "coinmarketcap" in request.url.host:
+            return httpx.Response(200, json=SAMPLE_LISTINGS_RESPONSE)
+        return httpx.Response(200, json=SAMPLE_TOP_VOLUME_RESPONSE)
+
+
+@pytest.mark.asyncio
+async def test_services_parse_responses_from_shared_client():
+    # Arrange
+    tracker = ConcurrencyTracker()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(tracker.handle))
+    coin_market_cap = CoinMarketCap(client)
+    crypto_compare = CryptoCompare(client)
+
+    # Act
+    (coin_listings, listings_age_seconds), (top_crypto, top_crypto_age_seconds) = await asyncio.gather(
+        coin_market_cap.get_coin_listings(),
+        crypto_compare.get_top_crypto_list()
+    )
+    await client.aclose()
+
+    # Assert
+    assert coin_listings == [("BTC", "Bitcoin", 29434.824505477198),
+                             ("ETH", "Ethereum", 1851.0382543598475)]
+    assert top_crypto == [("BTC", "Bitcoin"), ("ETH", "Ethereum")]
+    assert listings_age_seconds == top_crypto_age_seconds == 0.0
+    assert tracker.max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_services_raise_on_upstream_error():
+    # Arrange
+    client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(503)))
+    crypto_compare = CryptoCompare(client)
+
+    # Act and assert
+    with pytest.raises(UpstreamUnavailable) as error:
+        await crypto_compare.get_top_crypto_list()
+    assert isinstance(error.value.__cause__, httpx.HTTPStatusError)
+    await client.aclose()
@@ -0,0 +1,40 @@
+from app.services.metrics import MetricsRegistry
+
+
+def test_histogram_is_rendered_with_cumulative_buckets():
+    # Arrange
+    sut = MetricsRegistry()
+    histogram = sut.histogram("sample_seconds", "Sample latency.", ("method",), buckets=(0.1, 1.0))
+
+    # Act
+    histogram.observe(0.05, "get")
+    histogram.observe(0.5, "get")
+    histogram.observe(5, "get")
+    results = sut.render()
+
+    # Assert
+    assert results == """\
+# HELP sample_seconds Sample latency.
+# TYPE sample_seconds histogram
+sample_seconds_bucket{method="get",le="0.1"} 1
+sample_seconds_bucket{method="get",le="1.0"} 2
+sample_seconds_bucket{method="get",le="+Inf"} 3
+sample_seconds_sum{method="get"} 5.55
+sample_seconds_count{method="get"} 3
+"""
+
+
+def test_counter_is_rendered_by_label_values():
+    # Arrange
+    sut = MetricsRegistry()
+    counter = sut.counter("sample_total", "Sample events.", ("result",))
+
+    # Act
+    counter.inc("miss")
+    counter.inc("hit")
+    counter.inc("hit")
+    results = sut.render()
+
+    # Assert
+    assert 'sample_total{result="hit"} 2.0' in results
+    assert 'sample_total{result="miss"} 1.0' in results
@@ -0,0 +1,142 @@
+import pytest
+import asyncio
+import httpx
+
+from app.models.errors import UpstreamUnavailable
+from app.services.coin_market_cap import CoinMarketCap
+from app.services.resilience import CircuitBreaker, ResilientProvider, MIN_HEDGE_LATENCY_SAMPLES
+
+from tests.services.test_http_services import SAMPLE_LISTINGS_RESPONSE
+
+
+class ProviderMock:
+    responses: list[str | Exception]
+    delays_seconds: list[float]
+    num_invocations: int
+
+    def __init__(self, responses: list[str | Exception], delays_seconds: list[float] | None = None):
+        self.responses = responses
+        self.delays_seconds = delays_seconds if delays_seconds is not None else [0] * len(responses)
+        self.num_invocations = 0
+
+    async def request(self) -> str:
+        response = self.responses[self.num_invocations]
+        delay_seconds = self.delays_seconds[self.num_invocations]
+        self.num_invocations += 1
+        await asyncio.sleep(delay_seconds)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.mark.asyncio
+async def test_failed_request_returns_last_good_response():
+    # Arrange
+    provider_mock = ProviderMock(["good", ConnectionError("down")])
+    sut = ResilientProvider("provider")
+
+    # Act
+    results = [await sut.call(provider_mock.request), await sut.call(provider_mock.request)]
+
+    # Assert
+    assert [response for response, _ in results] == ["good", "good"]
+    assert results[0][1] == 0.0
+    assert results[1][1] > 0.0
+    assert sut.circuit_breaker.num_consecutive_failures == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_request_without_good_response_raises_error():
+    # Arrange
+    provider_mock = ProviderMock([ConnectionError("down")])
+    sut = ResilientProvider("provider")
+
+    # Act and assert
+    with pytest.raises(UpstreamUnavailable):
+        await sut.call(provider_mock.request)
+
+
+@pytest.mark.asyncio
+async def test_request_beyond_deadline_returns_last_good_response():
+    # Arrange
+    provider_mock = ProviderMock(["good", "late"], [0, 1])
+    sut = ResilientProvider("provider", deadline_seconds=0.05)
+
+    # Act
+    results = [await sut.call(provider_mock.request), await sut.call(provider_mock.request)]
+
+    # Assert
+    assert [response for response, _ in results] == ["good", "good"]
+    assert results[1][1] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_returns_last_good_response_without_requests_until_trial_succeeds():
+    # Arrange
+    provider_mock = ProviderMock(["good", ConnectionError("down"), ConnectionError("down"), "recovered"])
+    circuit_breaker = CircuitBreaker("provider", failure_threshold=2, reset_seconds=60)
+    sut = ResilientProvider("provider", circuit_breaker=circuit_breaker)
+    for _ in range(3):
+        await sut.call(provider_mock.request)
+
+    # Act
+    results_open, age_open_seconds = await sut.call(provider_mock.request)
+    circuit_breaker.reset_seconds = 0
+    results_trial, age_trial_seconds = await sut.call(provider_mock.request)
+
+    # Assert
+    assert results_open == "good"
+    assert age_open_seconds > 0.0
+    assert results_trial == "recovered"
+    assert age_trial_seconds == 0.0
+    assert provider_mock.num_invocations == 4
+    assert not circuit_breaker.is_open
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged_beyond_latency_percentile():
+    # Arrange
+    provider_mock = ProviderMock(["slow", "fast"], [1, 0])
+    sut = ResilientProvider("provider", hedge_percentile=95)
+    sut.latencies.extend([0.01] * MIN_HEDGE_LATENCY_SAMPLES)
+
+    # Act
+    results, age_seconds = await sut.call(provider_mock.request)
+
+    # Assert
+    assert results == "fast"
+    assert age_seconds == 0.0
+    assert provider_mock.num_invocations == 2
+
+
+@pytest.mark.asyncio
+async def test_hedge_percentile_below_the_first_percentile_is_clamped_to_it():
+    # Arrange
+    provider_mock = ProviderMock(["slow", "fast"], [1, 0])
+    sut = ResilientProvider("provider", hedge_percentile=0)
+    sut.latencies.extend([0.01] * MIN_HEDGE_LATENCY_SAMPLES + [5.0])
+
+    # Act
+    results, _ = await sut.call(provider_mock.request)
+
+    # Assert
+    assert results == "fast"
+    assert provider_mock.num_invocations == 2
+
+
+@pytest.mark.asyncio
+async def test_service_falls_back_to_last_good_response_when_provider_fails():
+    # Arrange
+    responses = iter([httpx.Response(200, json=SAMPLE_LISTINGS_RESPONSE), httpx.Response(500)])
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: next(responses)))
+    sut = CoinMarketCap(client, ResilientProvider("coinmarketcap"))
+
+    # Act
+    results = [await sut.get_coin_listings(), await sut.get_coin_listings()]
+    await client.aclose()
+
+    # Assert
+    assert results[0][0] == results[1][0] == [("BTC", "Bitcoin", 29434.824505477198),
+                                              ("ETH", "Ethereum", 1851.0382543598475)]
+    assert results[0][1] == 0.0
+    assert results[1][1] > 0.0